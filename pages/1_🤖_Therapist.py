@@ -1,52 +1,128 @@
 import streamlit as st
-import google.generativeai as genai
 import speech_recognition as sr
-from gtts import gTTS
-from streamlit_mic_recorder import speech_to_text
-import redis
-import json
+from streamlit_mic_recorder import mic_recorder
+import io
 import uuid
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-import csv
+import time
+from utils.kb_index import KnowledgeBaseIndex
+from utils.file_lock import append_csv_row
+from utils.cache import TieredCache
+from utils.chat_history import ChatHistoryStore
+from utils.redis_pool import shared_pool
+from utils.response_cache import SemanticResponseCache, MemoryResponseStore, RedisResponseStore
+from utils.llm_client import shared_client
+from utils.context_builder import ContextBuilder, estimate_tokens, fold_messages, model_summarizer
+from utils import metrics
+from utils.chat_pipeline import ChatPipeline, ChatResponder, TurnCancelled, make_executor
+from utils.tts import SpeechSynthesizer, IncrementalSpeech
+from utils.kb_summary import summary_cache_key, extractive_summary, BackgroundRefresher
+from utils.audio_preprocess import preprocess_wav
+from utils.q_store import SharedQTable, RedisQStore, SQLiteQStore
+from utils.rl_training import FeedbackEventLog
+
+KB_PATH = "./assets/knowledge_base/kb.csv"
+KB_INDEX_DIR = "./assets/knowledge_base/.kb_index"
+KB_SUMMARY_CACHE_SIZE = int(st.secrets.get("KB_SUMMARY_CACHE_SIZE", 512))
+KB_SUMMARY_CACHE_TTL = int(st.secrets.get("KB_SUMMARY_CACHE_TTL", 6 * 60 * 60))
+# "llm": Gemini summary; "local": extractive, no network call;
+# "hybrid": cached Gemini summary if present, otherwise local while Gemini fills the cache
+KB_SUMMARY_MODE = st.secrets.get("KB_SUMMARY_MODE", "llm")
+CHAT_STREAMING = bool(st.secrets.get("CHAT_STREAMING", True))
+CHAT_PIPELINE_CONCURRENT = bool(st.secrets.get("CHAT_PIPELINE_CONCURRENT", True))
+CHAT_PIPELINE_WORKERS = int(st.secrets.get("CHAT_PIPELINE_WORKERS", 8))
+TTS_CACHE_DIR = "data/tts_cache"
+TTS_CACHE_MB = int(st.secrets.get("TTS_CACHE_MB", 256))
+TTS_WORKERS = int(st.secrets.get("TTS_WORKERS", 4))
+TTS_INCREMENTAL = bool(st.secrets.get("TTS_INCREMENTAL", True))
+TTS_CHUNK_CHARS = int(st.secrets.get("TTS_CHUNK_CHARS", 60))
+CONTEXT_TOKEN_BUDGET = int(st.secrets.get("CONTEXT_TOKEN_BUDGET", 1500))
+CONTEXT_SUMMARY_TOKENS = int(st.secrets.get("CONTEXT_SUMMARY_TOKENS", 200))
+# "llm": Gemini rewrites the rolling summary of older turns; "local": keeps the start of each message, no network call
+CONTEXT_SUMMARY_MODE = st.secrets.get("CONTEXT_SUMMARY_MODE", "llm")
+RESPONSE_CACHE_ENABLED = bool(st.secrets.get("RESPONSE_CACHE_ENABLED", True))
+# "memory": per process; "redis": shared by every worker process
+RESPONSE_CACHE_BACKEND = st.secrets.get("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_THRESHOLD = float(st.secrets.get("RESPONSE_CACHE_THRESHOLD", 0.9))
+RESPONSE_CACHE_SIZE = int(st.secrets.get("RESPONSE_CACHE_SIZE", 256))
+RESPONSE_CACHE_TTL = int(st.secrets.get("RESPONSE_CACHE_TTL", 24 * 60 * 60))
+# "gemini", or "fake" for a local stand-in model (no API calls)
+LLM_BACKEND = st.secrets.get("LLM_BACKEND", "gemini")
+LLM_TIMEOUT = float(st.secrets.get("LLM_TIMEOUT", 30))
+LLM_MAX_RETRIES = int(st.secrets.get("LLM_MAX_RETRIES", 2))
+# Prompt dumps to stdout are off by default and truncated when on
+CHAT_DEBUG_PROMPTS = bool(st.secrets.get("CHAT_DEBUG_PROMPTS", False))
+CHAT_DEBUG_MAX_CHARS = int(st.secrets.get("CHAT_DEBUG_MAX_CHARS", 2000))
+# Prometheus text at http://<host>:METRICS_PORT/metrics when set; sampled per-turn JSON logs when METRICS_LOG_PATH is set
+METRICS_PORT = int(st.secrets.get("METRICS_PORT", 0))
+METRICS_LOG_PATH = st.secrets.get("METRICS_LOG_PATH", "")
+METRICS_LOG_SAMPLE_RATE = float(st.secrets.get("METRICS_LOG_SAMPLE_RATE", 0.1))
+REDIS_MAX_CONNECTIONS = int(st.secrets.get("REDIS_MAX_CONNECTIONS", 20))
+CHAT_HISTORY_MAX_MESSAGES = int(st.secrets.get("CHAT_HISTORY_MAX_MESSAGES", 20))
+CHAT_HISTORY_TTL = int(st.secrets.get("CHAT_HISTORY_TTL", 7 * 24 * 60 * 60))
+CHAT_HISTORY_COMPRESS_OVER = int(st.secrets.get("CHAT_HISTORY_COMPRESS_OVER", 1024))
+# One Q-table shared by all sessions: Redis, else a local SQLite file, plus periodic JSON snapshots
+RL_SHARED_Q_TABLE = bool(st.secrets.get("RL_SHARED_Q_TABLE", True))
+RL_Q_DB_PATH = "data/rl/q_table.sqlite"
+RL_Q_SNAPSHOT_PATH = "data/rl/q_table_snapshot.json"
+RL_Q_CACHE_TTL = float(st.secrets.get("RL_Q_CACHE_TTL", 5))
+RL_Q_SNAPSHOT_INTERVAL = int(st.secrets.get("RL_Q_SNAPSHOT_INTERVAL", 300))
+# Every feedback event, for offline replay with `python -m utils.rl_training train`
+RL_EVENT_LOG_PATH = "data/rl/feedback_events.bin"
+# Voice input is trimmed to the detected speech and resampled before recognition
+STT_PREPROCESS = bool(st.secrets.get("STT_PREPROCESS", True))
+STT_SAMPLE_RATE = int(st.secrets.get("STT_SAMPLE_RATE", 16000))
+FALLBACK_RESPONSE = "I apologize, but I'm having trouble processing your request at the moment. Please try again."
 
 @st.cache_resource
+def setup_observability():
+    if METRICS_PORT:
+        try:
+            metrics.start_http_server(METRICS_PORT)
+        except OSError as e:
+            print(f"Metrics endpoint not started on port {METRICS_PORT}: {e}")
+    if METRICS_LOG_PATH:
+        metrics.configure_log(METRICS_LOG_PATH, sample_rate=METRICS_LOG_SAMPLE_RATE)
+    return True
+
+setup_observability()
+
+def get_redis_pool():
+    # Process-wide, so it survives st.cache_resource clears and recovers from outages
+    return shared_pool(
+        host=st.secrets.get("REDIS_HOST", "localhost"),
+        port=st.secrets.get("REDIS_PORT", 6379),
+        db=st.secrets.get("REDIS_DB", 0),
+        password=st.secrets.get("REDIS_PASSWORD", None),
+        max_connections=REDIS_MAX_CONNECTIONS
+    )
+
 def get_redis_connection():
-    try:
-        r = redis.Redis(
-            host=st.secrets.get("REDIS_HOST", "localhost"),
-            port=st.secrets.get("REDIS_PORT", 6379),
-            db=st.secrets.get("REDIS_DB", 0),
-            password=st.secrets.get("REDIS_PASSWORD", None),
-            decode_responses=True
-        )
-        r.ping()
-        return r
-    except redis.exceptions.ConnectionError as e:
-        st.error(f"Failed to connect to Redis: {e}. Context history will not be saved/loaded.")
-        return None
-    except Exception as e:
-        st.error(f"An unexpected error occurred during Redis connection: {e}")
-        return None
+    """Shared Redis client, or None while Redis is unreachable."""
+    return get_redis_pool().client()
+
+@st.cache_resource
+def get_summary_cache():
+    return TieredCache(
+        'kb_summary',
+        redis_conn=get_redis_pool().client,
+        max_entries=KB_SUMMARY_CACHE_SIZE,
+        ttl=KB_SUMMARY_CACHE_TTL
+    )
+
+@st.cache_resource
+def get_summary_refresher():
+    return BackgroundRefresher()
 
 @st.cache_resource
 def load_knowledge_base():
     try:
-        df = pd.read_csv("./assets/knowledge_base/kb.csv")
-        if 'question' in df.columns and 'answer' in df.columns:
-            vectorizer = TfidfVectorizer(stop_words='english')
-            question_vectors = vectorizer.fit_transform(df['question'])
-            
-            return {
-                'df': df,
-                'vectorizer': vectorizer,
-                'question_vectors': question_vectors
-            }
-        else:
-            print(f"Knowledge base failed to load cuz of the columns")
-            st.warning("CSV file doesn't have the expected columns (question, answer).")
-            return None
+        kb = KnowledgeBaseIndex.load_or_build(KB_PATH, KB_INDEX_DIR)
+        print(f"Knowledge base ready in {kb.load_seconds:.2f}s ({len(kb)} rows)")
+        return kb
+    except ValueError as e:
+        print(f"Knowledge base failed to load: {e}")
+        st.warning(str(e))
+        return None
     except Exception as e:
         print(f"Knowledge base failed to load")
         st.error(f"Error loading knowledge base: {e}")
@@ -56,63 +132,56 @@ def get_relevant_knowledge(user_message, knowledge_base, top_n=3):
     if not knowledge_base:
         return []
     
-    user_vector = knowledge_base['vectorizer'].transform([user_message])
-    
-    similarities = cosine_similarity(user_vector, knowledge_base['question_vectors']).flatten()
-    
-    top_indices = similarities.argsort()[-top_n:][::-1]
-    
-    relevant_entries = []
-    for idx in top_indices:
-        similarity = similarities[idx]
-        if similarity > 0.2:
-            relevant_entries.append({
-                'question': knowledge_base['df']['question'].iloc[idx],
-                'answer': knowledge_base['df']['answer'].iloc[idx],
-                'similarity': similarity
-            })
-    return relevant_entries
+    return knowledge_base.search(user_message, top_n=top_n, threshold=0.2)
 
 def summarize_knowledge_entries(kb_entries):
     if not kb_entries:
         return ""
     
+    if KB_SUMMARY_MODE == "local":
+        return extractive_summary(kb_entries, knowledge_base)
+    
+    cache_key = summary_cache_key(kb_entries)
+    summary = get_summary_cache().get(cache_key)
+    if summary is not None:
+        return summary
+    
+    if KB_SUMMARY_MODE == "hybrid":
+        get_summary_refresher().submit(cache_key, summarize_with_llm, kb_entries, cache_key)
+        return extractive_summary(kb_entries, knowledge_base)
+    
+    return summarize_with_llm(kb_entries, cache_key)
+
+def summarize_with_llm(kb_entries, cache_key):
     try:
-        genai.configure(api_key=GOOGLE_API_KEY)
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
         content_to_summarize = "Summarize these expert answers concisely within 100 words:\n\n"
         for entry in kb_entries:
             content_to_summarize += f"EXPERT ANSWER: {entry['answer']}\n\n"
             
         content_to_summarize += "Format as bullet points focusing on key advice and therapeutic approaches."
         
-        response = model.generate_content(content_to_summarize)
-        summary = response.text
+        summary = get_llm_client().generate(content_to_summarize)
+        get_summary_cache().set(cache_key, summary)
         
         return summary
     except Exception as e:
         print(f"Error generating knowledge summary: {e}")
         
-        return summary
+        return ""
 
 def save_conversation_to_knowledge_base(user_message, assistant_response, feedback_type):
     if feedback_type not in ["helpful"]:
         return False
     
     try:
-        kb_path = "./assets/knowledge_base/kb.csv"
-        
-        if knowledge_base and 'df' in knowledge_base:
-            similar_entries = get_relevant_knowledge(user_message, knowledge_base, top_n=1)
+        if knowledge_base is not None:
+            duplicate = knowledge_base.append_unique(KB_PATH, user_message, assistant_response)
             
-            if similar_entries and similar_entries[0]['similarity'] > 0.8:
-                print(f"Similar question already exists with similarity {similar_entries[0]['similarity']}")
+            if duplicate is not None:
+                print(f"Similar question already exists with similarity {duplicate[1]}")
                 return False
-        
-        with open(kb_path, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([user_message, assistant_response])
+        else:
+            append_csv_row(KB_PATH, [user_message, assistant_response])
         
         print(f"Added new conversation to knowledge base: {user_message[:50]}...")
         
@@ -122,84 +191,206 @@ def save_conversation_to_knowledge_base(user_message, assistant_response, feedba
         print(f"Error saving to knowledge base: {e}")
         return False
 
-def reload_knowledge_base():
-    st.cache_resource.clear()
-    global knowledge_base
-    knowledge_base = load_knowledge_base()
-
 if 'session_id' not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
 
 redis_conn = get_redis_connection()
-SESSION_HISTORY_KEY = f"chat_history:{st.session_state.session_id}"
-MAX_HISTORY_LENGTH = 10
+if redis_conn is None:
+    st.warning("Redis is unavailable; chat history will not be saved or loaded until it reconnects.")
+# Read from pipeline worker threads, which cannot access st.session_state
+session_id = st.session_state.session_id
+
+@st.cache_resource
+def get_history_summarizer():
+    if CONTEXT_SUMMARY_MODE == "local":
+        return fold_messages
+    return model_summarizer(lambda prompt: get_llm_client().generate(prompt))
+
+chat_history = ChatHistoryStore(
+    redis_conn,
+    max_messages=CHAT_HISTORY_MAX_MESSAGES,
+    ttl=CHAT_HISTORY_TTL,
+    compress_over=CHAT_HISTORY_COMPRESS_OVER,
+    summarize=get_history_summarizer(),
+    summary_tokens=CONTEXT_SUMMARY_TOKENS
+) if redis_conn is not None else None
+
+@st.cache_resource
+def get_q_table():
+    return SharedQTable(
+        primary=RedisQStore(get_redis_pool().client),
+        fallback=SQLiteQStore(RL_Q_DB_PATH),
+        snapshot_path=RL_Q_SNAPSHOT_PATH,
+        read_ttl=RL_Q_CACHE_TTL,
+        snapshot_interval=RL_Q_SNAPSHOT_INTERVAL
+    )
+
+@st.cache_resource
+def get_feedback_log():
+    return FeedbackEventLog(RL_EVENT_LOG_PATH)
 
 if 'rl_agent' not in st.session_state:
     from reinforcement import PromptOptimizationRL
-    st.session_state.rl_agent = PromptOptimizationRL()
+    st.session_state.rl_agent = PromptOptimizationRL(
+        q_store=get_q_table() if RL_SHARED_Q_TABLE else None,
+        event_log=get_feedback_log()
+    )
 
 knowledge_base = load_knowledge_base()
 
-GOOGLE_API_KEY = st.secrets["GOOGLE_API_KEY"]
+GOOGLE_API_KEY = st.secrets.get("GOOGLE_API_KEY")
 MODEL_NAME = 'gemini-2.0-flash'
 
+def get_llm_client():
+    # Process-wide: the API is configured once and model instances are reused
+    return shared_client(
+        LLM_BACKEND,
+        api_key=GOOGLE_API_KEY,
+        model=MODEL_NAME,
+        timeout=LLM_TIMEOUT,
+        max_retries=LLM_MAX_RETRIES
+    )
+
 st.title("💭 Chat with Me")
 
 def get_conversation_history():
-    """Retrieves the last N messages from Redis."""
-    if not redis_conn:
-        return []
-    try:
-        history_json = redis_conn.lrange(SESSION_HISTORY_KEY, -MAX_HISTORY_LENGTH * 2, -1)
-        history = [json.loads(msg) for msg in history_json]
-        return history
-    except Exception as e:
-        st.warning(f"Could not retrieve chat history from Redis: {e}")
-        return []
+    """
+    Retrieves this session's retained messages and rolling summary from Redis.
+    Runs on a pipeline worker thread; errors are reported by `build_prompt`.
+    """
+    if not chat_history:
+        return None
+    return chat_history.snapshot(session_id)
 
-def add_to_conversation_history(role, content):
-    """Adds a message to Redis history for context management."""
-    if not redis_conn:
-        return
+def add_turn_to_conversation_history(responder, turn, user_message, response_text):
+    """Saves a user message and its reply to Redis in one transaction."""
     try:
-        redis_conn.rpush(SESSION_HISTORY_KEY, json.dumps({"role": role, "content": content}))
+        responder.save_turn(turn, user_message, response_text)
     except Exception as e:
         st.warning(f"Could not save chat history to Redis: {e}")
 
-def generate_response(user_message):
+@st.cache_resource
+def get_pipeline_executor():
+    return make_executor(CHAT_PIPELINE_WORKERS)
+
+@st.cache_resource
+def get_context_builder():
+    return ContextBuilder(
+        budget=CONTEXT_TOKEN_BUDGET,
+        summary_tokens=CONTEXT_SUMMARY_TOKENS,
+        summarize=get_history_summarizer()
+    )
+
+def get_chat_pipeline():
+    return ChatPipeline(
+        get_pipeline_executor(),
+        fetch_history=get_conversation_history,
+        retrieve=lambda message: get_relevant_knowledge(message, knowledge_base),
+        summarize=summarize_knowledge_entries,
+        concurrent=CHAT_PIPELINE_CONCURRENT
+    )
+
+def get_chat_responder(pipeline):
+    return ChatResponder(
+        pipeline,
+        get_context_builder(),
+        st.session_state.rl_agent,
+        session_id,
+        history=chat_history,
+        response_cache=get_response_cache() if RESPONSE_CACHE_ENABLED else None,
+        knowledge_base=knowledge_base
+    )
+
+def debug_prompt(prompt):
+    """Opt-in prompt dump (CHAT_DEBUG_PROMPTS), truncated to CHAT_DEBUG_MAX_CHARS."""
+    if not CHAT_DEBUG_PROMPTS:
+        return
+    shown = prompt[:CHAT_DEBUG_MAX_CHARS]
+    suffix = f"... [{len(prompt) - len(shown)} more chars]" if len(prompt) > len(shown) else ""
+    print(f"Full User Message ({estimate_tokens(prompt)} tokens): {shown}{suffix}")
+
+def build_prompt(responder, user_message, turn):
+    optimized_prompt, context = responder.build_prompt(turn, user_message)
+    if 'history' in turn.errors:
+        st.warning(f"Could not retrieve chat history from Redis: {turn.errors['history']}")
+    debug_prompt(context.text)
+    return optimized_prompt
+
+def generate_response(responder, user_message, turn):
     try:
-        genai.configure(api_key=GOOGLE_API_KEY)
-        model = genai.GenerativeModel(MODEL_NAME)
+        optimized_prompt = build_prompt(responder, user_message, turn)
+        turn.check()
 
-        history = get_conversation_history()
-        context_prompt = "\n".join([f"{msg['role']}: {msg['content']}" for msg in history])
-        
-        kb_entries = get_relevant_knowledge(user_message, knowledge_base)
-        knowledge_context = ""
-        
-        if kb_entries:
-            knowledge_summary = summarize_knowledge_entries(kb_entries)
-            knowledge_context = "\n\nRELEVANT EXPERT INSIGHTS:\n" + knowledge_summary
-        
-        full_user_message = (
-            f"{context_prompt}\n\n"
-            f"{knowledge_context}\n\n"
-            f"user: {user_message}\n\n"
-        )
+        start = time.perf_counter()
+        with turn.span("llm"):
+            response_text = get_llm_client().generate(
+                optimized_prompt, system_instruction=st.session_state.rl_agent.system_instruction
+            )
+        metrics.observe("llm_response_seconds", time.perf_counter() - start, mode="blocking")
+        return response_text
+
+    except Exception as e:
+        st.error(f"Error generating response: {e}")
+        return FALLBACK_RESPONSE
 
-        print(f"Full User Message: {full_user_message}")
+def stream_chunks(prompt, system_instruction, turn, speech, audio_slot):
+    """
+    Yields response text as the model produces it, recording time-to-first-token
+    and total time, and plays the first speech chunk as soon as it is synthesized.
+    """
+    start = time.perf_counter()
+    first_token = True
+    for text in get_llm_client().stream(prompt, system_instruction=system_instruction):
+        if turn.cancelled:
+            return
+        if first_token:
+            metrics.observe("llm_time_to_first_token_seconds", time.perf_counter() - start)
+            turn.record("llm_first_token", time.perf_counter() - start)
+            first_token = False
+        speech.feed(text)
+        show_first_audio(speech, audio_slot)
+        yield text
+    metrics.observe("llm_response_seconds", time.perf_counter() - start, mode="streaming")
+    turn.record("llm", time.perf_counter() - start)
 
-        optimized_prompt, action = st.session_state.rl_agent.generate_optimized_prompt(full_user_message)
-        st.session_state.rl_agent.last_action = action
+def stream_response(responder, user_message, turn, speech, audio_slot):
+    """Writes the reply into the current chat message as it streams and returns the full text."""
+    try:
+        with st.spinner("Consulting the archives of the mind..."):
+            optimized_prompt = build_prompt(responder, user_message, turn)
 
-        response = model.generate_content(optimized_prompt)
-        response_text = response.text
-        audio_file = speak(response_text)
-        return response_text, audio_file
+        response_text = st.write_stream(
+            stream_chunks(optimized_prompt, st.session_state.rl_agent.system_instruction, turn, speech, audio_slot)
+        )
+        return response_text if isinstance(response_text, str) else "".join(map(str, response_text))
 
     except Exception as e:
         st.error(f"Error generating response: {e}")
-        return "I apologize, but I'm having trouble processing your request at the moment. Please try again.", None
+        st.write(FALLBACK_RESPONSE)
+        return FALLBACK_RESPONSE
+
+def transcribe_wav(wav_bytes, recognizer=None, language='en'):
+    """Pre-process a WAV recording and transcribe it; returns None if nothing was understood."""
+    recognizer = recognizer or sr.Recognizer()
+    if STT_PREPROCESS:
+        processed = preprocess_wav(wav_bytes, target_rate=STT_SAMPLE_RATE)
+        if not processed.has_speech:
+            metrics.increment('stt_requests_total', result='no_speech')
+            return None
+        audio_data = sr.AudioData(processed.pcm, processed.sample_rate, 2)
+        print(f"Voice input: {processed.report()}")
+    else:
+        with sr.AudioFile(io.BytesIO(wav_bytes)) as source:
+            audio_data = recognizer.record(source)
+
+    try:
+        with metrics.span('stt_transcription_seconds', preprocessed=STT_PREPROCESS):
+            transcription = recognizer.recognize_google(audio_data, language=language)
+    except sr.UnknownValueError:
+        metrics.increment('stt_requests_total', result='unrecognized')
+        return None
+    metrics.increment('stt_requests_total', result='ok')
+    return transcription
 
 def record_and_transcribe():
     recognizer = sr.Recognizer()
@@ -219,10 +410,10 @@ def record_and_transcribe():
             
             with st.spinner("Transcribing..."):
                 try:
-                    transcription = recognizer.recognize_google(audio_data)
+                    transcription = transcribe_wav(audio_data.get_wav_data(), recognizer)
+                    if transcription is None:
+                        st.error("Could not understand the audio. Please try again.")
                     return transcription
-                except sr.UnknownValueError:
-                    st.error("Could not understand the audio. Please try again.")
                 except sr.RequestError:
                     st.error("Could not connect to speech recognition service.")
     except Exception as e:
@@ -230,30 +421,105 @@ def record_and_transcribe():
     
     return None
 
-def speak(text):
+@st.cache_resource
+def get_speech_synthesizer():
+    return SpeechSynthesizer(TTS_CACHE_DIR, max_cache_bytes=TTS_CACHE_MB * 1024 * 1024, max_workers=TTS_WORKERS)
+
+def new_speech():
+    return IncrementalSpeech(get_speech_synthesizer(), min_chars=TTS_CHUNK_CHARS if TTS_INCREMENTAL else None)
+
+def show_first_audio(speech, audio_slot, wait=False):
+    """Plays the first speech chunk in `audio_slot` if it is ready (with `wait`, once it is) and not shown yet."""
+    first_audio = speech.take_first_audio(wait=wait)
+    if first_audio is not None:
+        audio_slot.audio(first_audio, format="audio/mp3")
+
+def play_speech(turn, speech, audio_slot):
+    """Shows the first audio chunk (unless already shown while streaming), then the rest as one stream."""
+    if not speech.futures:
+        return None
     try:
-        tts = gTTS(text=text, lang='en')
-        audio_file = "response.mp3"
-        tts.save(audio_file)
-        return audio_file
+        with turn.span("tts_first_audio"):
+            show_first_audio(speech, audio_slot, wait=True)
+            first_audio = speech.first_audio()
+        turn.check()
+        with turn.span("tts_remaining_audio"):
+            remaining_audio = speech.remaining_audio()
+        turn.check()
+        if remaining_audio:
+            st.audio(remaining_audio, format="audio/mp3")
+        return first_audio + remaining_audio
+    except TurnCancelled:
+        raise
     except Exception as e:
         st.error(f"Error generating audio: {e}")
         return None
 
+@st.cache_resource
+def get_response_cache():
+    if RESPONSE_CACHE_BACKEND == "redis":
+        store = RedisResponseStore(get_redis_pool().client, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+    else:
+        store = MemoryResponseStore(max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+    return SemanticResponseCache(store, threshold=RESPONSE_CACHE_THRESHOLD)
+
 def process_message(message_text):
     if message_text:
-        st.session_state.messages.append({"role": "user", "content": message_text})
-        st.chat_message("user").write(message_text)
-        add_to_conversation_history("user", message_text)
-        with st.chat_message("assistant"):
-            with st.spinner("Consulting the archives of the mind..."):
-                response_text, audio_file = generate_response(message_text)
-                st.write(response_text)
-                if audio_file:
-                    st.audio(audio_file)
-        st.session_state.messages.append({"role": "assistant", "content": response_text, "audio_file": audio_file})
-        add_to_conversation_history("assistant", response_text)
-        st.session_state.needs_rerun = True
+        # A new message supersedes whatever the previous one still has in flight
+        previous_turn = st.session_state.get("active_turn")
+        if previous_turn is not None:
+            previous_turn.cancel()
+        pipeline = get_chat_pipeline()
+        turn = pipeline.start()
+        st.session_state.active_turn = turn
+        responder = get_chat_responder(pipeline)
+
+        try:
+            cache_key = responder.cache_key(message_text, first_turn=not st.session_state.messages)
+            st.session_state.messages.append({"role": "user", "content": message_text})
+            st.chat_message("user").write(message_text)
+            # Speech chunks are submitted sentence by sentence while the reply streams
+            speech = new_speech()
+            cached_response = responder.cached_reply(cache_key)
+            with st.chat_message("assistant"):
+                # Filled with the first audio chunk as soon as it is synthesized, even mid-stream
+                audio_slot = st.empty()
+                if cached_response is not None:
+                    response_text = cached_response
+                    speech.feed(response_text)
+                elif CHAT_STREAMING:
+                    response_text = stream_response(responder, message_text, turn, speech, audio_slot)
+                else:
+                    with st.spinner("Consulting the archives of the mind..."):
+                        response_text = generate_response(responder, message_text, turn)
+                    speech.feed(response_text)
+                if response_text == FALLBACK_RESPONSE:
+                    speech = new_speech()
+                    speech.feed(response_text)
+                elif cached_response is None and not turn.cancelled:
+                    responder.remember(cache_key, response_text)
+                speech.finish()
+                show_first_audio(speech, audio_slot)
+                if not CHAT_STREAMING or cached_response is not None:
+                    st.write(response_text)
+                # Remaining chunks keep synthesizing while the reply is saved to history
+                add_turn_to_conversation_history(responder, turn, message_text, response_text)
+                audio = play_speech(turn, speech, audio_slot)
+            # Only the newest reply's audio is replayed, so older replies drop their bytes
+            for previous in st.session_state.messages:
+                previous.pop("audio", None)
+            st.session_state.messages.append({"role": "assistant", "content": response_text, "audio": audio})
+            turn.finish(
+                "cached" if cached_response is not None else pipeline.mode,
+                streaming=CHAT_STREAMING,
+                fallback=response_text == FALLBACK_RESPONSE
+            )
+            st.session_state.needs_rerun = True
+        finally:
+            # Also reached when Streamlit stops this run (new input or navigation)
+            turn.cancel()
+            if st.session_state.get("active_turn") is turn:
+                st.session_state.active_turn = None
 
 if 'messages' not in st.session_state:
     st.session_state.messages = []
@@ -269,15 +535,27 @@ input_method = st.radio(
 )
     
 if input_method == "Voice Recording (5-10 seconds recommended)":
-    spoken_text = speech_to_text(
-                    language='en',
+    recording = mic_recorder(
                     start_prompt="Speak now...",
                     stop_prompt="Done",
-                    use_container_width=True,
                     just_once=True,
+                    use_container_width=True,
+                    format="wav",
                     key='STT',
                 )
 
+    spoken_text = None
+    if recording:
+        with st.spinner("Transcribing..."):
+            try:
+                spoken_text = transcribe_wav(recording['bytes'])
+                if spoken_text is None:
+                    st.error("Could not understand the audio. Please try again.")
+            except sr.RequestError:
+                st.error("Could not connect to speech recognition service.")
+            except ValueError as e:
+                st.error(f"Could not read the recording: {e}")
+
     if spoken_text:
         process_message(spoken_text)
 
@@ -291,10 +569,9 @@ for i, msg in enumerate(st.session_state.messages):
         if (
             msg["role"] == "assistant"
             and i == len(st.session_state.messages) - 1
-            and "audio_file" in msg
-            and msg["audio_file"]
+            and msg.get("audio")
         ):
-            st.audio(msg["audio_file"])
+            st.audio(msg["audio"], format="audio/mp3")
         if msg["role"] == "assistant" and i != 0:
             feedback_col1, feedback_col2, feedback_col3, feedback_col4 = st.columns(4)
             with feedback_col1:
@@ -306,7 +583,6 @@ for i, msg in enumerate(st.session_state.messages):
                         st.session_state.messages[i-1]["content"],
                         msg["content"],
                         "helpful")
-                    reload_knowledge_base()
             with feedback_col2:
                 if st.button("Need Empathy", key=f"empathy_{i}", use_container_width=True):
                     reward = st.session_state.rl_agent.give_feedback("more_empathy")
@@ -1,8 +1,174 @@
+import re
 import random
+import threading
+import numpy as np
 from collections import defaultdict
 
-class PromptOptimizationRL:
+EMOTION_KEYWORDS = {
+    'anxious': ['anxious', 'anxiety', 'nervous', 'worry', 'scared', 'fear', 'stress', 'stressed'],
+    'sad': ['sad', 'depress', 'unhappy', 'miserable', 'down', 'low', 'blue'],
+    'angry': ['angry', 'mad', 'frustrated', 'irritated', 'annoyed', 'upset'],
+    'happy': ['happy', 'good', 'great', 'wonderful', 'joy', 'excited', 'positive'],
+    'overwhelmed': ['overwhelm', 'too much', 'exhausted', 'burnout', 'burned out'],
+    'lonely': ['lonely', 'alone', 'isolated', 'no friends', 'no one']
+}
+EMOTIONS = tuple(EMOTION_KEYWORDS)
+ACTIONS = ('more_empathy', 'more_practical', 'helpful', 'not_helpful')
+N_STATES = 1 << len(EMOTIONS)
+# Identical for every request, so it is bound to the model once as its system
+# instruction; only PROMPT_TEMPLATE (action guidance + conversation) varies
+SYSTEM_INSTRUCTION = """You are an expert psychologist with years of clinical experience. Respond in English only.
+
+IMPORTANT GUIDELINES:
+- Adopt the tone, approach, and clinical perspective found in the expert insights provided.
+- Maintain a professional therapeutic voice while being accessible and clear.
+- Use psychological concepts and approaches found in the expert references.
+- Answer within 200 words, focusing on therapeutic value.
+- Only address mental health questions; for other topics reply 'I cannot answer that question.'
+- Follow the response guidance given at the start of each message.
+
+CONVERSATION CONTEXT:
+Each message contains the previous conversation history for continuity (a summary of older turns and the recent turns). Use it to provide consistent and appropriate support.
+
+EXPERT INSIGHTS:
+Messages may include relevant expert psychologist insights. Model your response after their therapeutic approach, professional tone, and clinical methodology."""
+ACTION_GUIDANCE = {
+    'more_empathy': "Be more empathetic and warm.",
+    'more_practical': "Provide specific techniques and practical advice.",
+    'helpful': "Be as helpful as possible, offering tailored advice.",
+    'not_helpful': "Focus on providing general information."
+}
+PROMPT_TEMPLATE = "Response guidance: {guidance}\n\n{message}"
+_KEYWORD_EMOTION = {keyword: emotion for emotion, keywords in EMOTION_KEYWORDS.items() for keyword in keywords}
+
+
+def _trie_pattern(words):
+    """Alternation of `words` factored by common prefix, so the regex engine never retries a shared prefix."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+# Keywords match at the start of a word, so 'depress' still covers 'depressed'
+# but 'happy' no longer fires inside 'unhappy'
+_EMOTION_PATTERN = re.compile(r'\b' + _trie_pattern(_KEYWORD_EMOTION))
+
+
+def detect_state(message):
+    """
+    RL state of a message: its detected emotions joined by '+', e.g.
+    'anxious+sad', or 'neutral'. One regex pass; every match is a keyword,
+    mapped back to its emotion.
+    """
+    emotions = {_KEYWORD_EMOTION[match] for match in _EMOTION_PATTERN.findall(message.lower())}
+    return '+'.join(sorted(emotions)) if emotions else 'neutral'
+
+
+def state_mask(state):
+    """Bitmask of a state string ('anxious+sad' -> 0b11, 'neutral' -> 0), bit i for EMOTIONS[i]."""
+    if state == 'neutral':
+        return 0
+    mask = 0
+    for emotion in state.split('+'):
+        mask |= 1 << EMOTIONS.index(emotion)
+    return mask
+
+
+def mask_state(mask):
+    """Inverse of `state_mask`."""
+    emotions = [emotion for bit, emotion in enumerate(EMOTIONS) if mask >> bit & 1]
+    return '+'.join(sorted(emotions)) if emotions else 'neutral'
+
+
+class ArrayQTable:
+    """
+    Q-table as a (2 ** len(EMOTIONS), len(ACTIONS)) array indexed by state
+    bitmask and action index, with a mask of the entries that have been
+    updated at least once (only those count as known actions of a state).
+
+    Exposes the same values/update/snapshot/load methods as the stores in
+    `utils.q_store`, and `apply_events` for vectorized offline replay.
+    """
+
     def __init__(self):
+        self.q = np.zeros((N_STATES, len(ACTIONS)))
+        self.seen = np.zeros((N_STATES, len(ACTIONS)), dtype=bool)
+        self._lock = threading.Lock()
+
+    def values(self, state):
+        mask = state_mask(state)
+        return {action: float(self.q[mask, i]) for i, action in enumerate(ACTIONS) if self.seen[mask, i]}
+
+    def update(self, state, action, reward, learning_rate, discount_factor):
+        mask, a = state_mask(state), ACTIONS.index(action)
+        with self._lock:
+            current = self.q[mask, a]
+            best = self.q[mask][self.seen[mask]].max(initial=current)
+            self.q[mask, a] = current + learning_rate * (reward + discount_factor * best - current)
+            self.seen[mask, a] = True
+        return self.values(state)
+
+    def apply_events(self, states, actions, rewards, learning_rate, discount_factor):
+        """
+        Replay (state mask, action index, reward) events, with the same result
+        as calling `update` for each in order.
+
+        An update only reads and writes its own state's row, so events of
+        different states commute. The events are split into waves holding
+        the k-th event of every state, and each wave is one vectorized update.
+        """
+        states = np.asarray(states, dtype=np.int64)
+        actions = np.asarray(actions, dtype=np.int64)
+        rewards = np.asarray(rewards, dtype=np.float64)
+        if not len(states):
+            return 0
+
+        by_state = np.argsort(states, kind='stable')
+        _, first, counts = np.unique(states[by_state], return_index=True, return_counts=True)
+        rank = np.empty(len(states), dtype=np.int64)
+        rank[by_state] = np.arange(len(states)) - np.repeat(first, counts)
+        order = np.argsort(rank, kind='stable')
+        bounds = np.searchsorted(rank[order], np.arange(counts.max() + 1))
+        states, actions, rewards = states[order], actions[order], rewards[order]
+
+        with self._lock:
+            known = np.where(self.seen, self.q, -np.inf)
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                s, a = states[start:end], actions[start:end]
+                current = self.q[s, a]
+                best = np.maximum(known[s].max(axis=1), current)
+                self.q[s, a] = known[s, a] = current + learning_rate * (rewards[start:end] + discount_factor * best - current)
+                self.seen[s, a] = True
+        return len(states)
+
+    def snapshot(self):
+        table = {}
+        for mask, a in zip(*np.nonzero(self.seen)):
+            table.setdefault(mask_state(int(mask)), {})[ACTIONS[a]] = float(self.q[mask, a])
+        return table
+
+    def load(self, table):
+        with self._lock:
+            for state, values in table.items():
+                for action, value in values.items():
+                    self.q[state_mask(state), ACTIONS.index(action)] = value
+                    self.seen[state_mask(state), ACTIONS.index(action)] = True
+
+
+class PromptOptimizationRL:
+    def __init__(self, q_store=None, event_log=None):
         self.parameters = {
             'empathy_level': 0.5,
             'technique_focus': 0.5,
@@ -13,95 +179,58 @@ class PromptOptimizationRL:
         self.learning_rate = 0.1
         self.discount_factor = 0.9
         self.exploration_rate = 0.3
+        self.system_instruction = SYSTEM_INSTRUCTION
         
         self.state_parameters = defaultdict(lambda: self.parameters.copy())
         
-        self.q_table = defaultdict(lambda: defaultdict(float))
+        # Per-session ArrayQTable unless a shared store (utils.q_store.SharedQTable) is given
+        self.q_table = q_store if q_store is not None else ArrayQTable()
+        # Optional utils.rl_training.FeedbackEventLog recording every feedback event
+        self.event_log = event_log
         self.last_state = None
         self.last_parameters = None
+        self.last_action = None
         
     def identify_state(self, message):
-        emotions = {
-            'anxious': ['anxious', 'anxiety', 'nervous', 'worry', 'scared', 'fear', 'stress', 'stressed'],
-            'sad': ['sad', 'depress', 'unhappy', 'miserable', 'down', 'low', 'blue'],
-            'angry': ['angry', 'mad', 'frustrated', 'irritated', 'annoyed', 'upset'],
-            'happy': ['happy', 'good', 'great', 'wonderful', 'joy', 'excited', 'positive'],
-            'overwhelmed': ['overwhelm', 'too much', 'exhausted', 'burnout', 'burned out'],
-            'lonely': ['lonely', 'alone', 'isolated', 'no friends', 'no one']
-        }
-        
-        message_lower = message.lower()
-        detected_states = []
-        
-        for emotion, keywords in emotions.items():
-            if any(keyword in message_lower for keyword in keywords):
-                detected_states.append(emotion)
-        
-        if not detected_states:
-            detected_states = ['neutral']
-            
-        return '+'.join(sorted(detected_states))
+        return detect_state(message)
+
+    def identify_states(self, messages):
+        """Batch version of `identify_state`, e.g. for offline analysis of logged messages."""
+        return [detect_state(message) for message in messages]
     
     def select_action(self, state):
         if random.random() < self.exploration_rate:
-            return random.choice(['more_empathy', 'more_practical', 'helpful', 'not_helpful'])
+            return random.choice(ACTIONS)
         else:
-            return max(self.q_table[state], key=self.q_table[state].get, default='helpful')
+            q_values = self.q_table.values(state)
+            return max(q_values, key=q_values.get, default='helpful')
 
-    def generate_optimized_prompt(self, message):
-        state = self.identify_state(message)
+    def generate_optimized_prompt(self, message, user_message=None):
+        # The state comes from what the user just said, not the history and insights around it
+        state = self.identify_state(message if user_message is None else user_message)
         
         action = self.select_action(state)
         
         params = self.state_parameters[state].copy()
         self.last_state = state
         self.last_parameters = params.copy()
+        self.last_action = action
         
         prompt_guidance = self._generate_prompt_modifiers(params, action)
-        
-        prompt_guidance = self._generate_prompt_modifiers(params, action)
-    
-        prompt = f"""You are an expert psychologist with years of clinical experience. Respond in English only.
-        
-        {prompt_guidance}
-        
-        IMPORTANT GUIDELINES:
-        - Adopt the tone, approach, and clinical perspective found in the expert insights provided.
-        - Maintain a professional therapeutic voice while being accessible and clear.
-        - Use psychological concepts and approaches found in the expert references.
-        - Answer within 200 words, focusing on therapeutic value.
-        - Only address mental health questions; for other topics reply 'I cannot answer that question.'
-        
-        CONVERSATION CONTEXT:
-        The previous conversation history is included for continuity. Use it to provide consistent and appropriate support.
-        
-        EXPERT INSIGHTS:
-        Expert psychologist insights are provided below. Model your response after their therapeutic approach, professional tone, and clinical methodology.
-        
-        {message}"""
+        prompt = PROMPT_TEMPLATE.format(guidance=prompt_guidance, message=message)
         
         return prompt, action
 
     def _generate_prompt_modifiers(self, params, action):
-        modifiers = []
-        
         if action == 'more_empathy':
             params['empathy_level'] = min(1.0, params['empathy_level'] + self.learning_rate)
             params['professional_tone'] = max(0.0, params['professional_tone'] - self.learning_rate)
-            modifiers.append("Be more empathetic and warm.")
             
         elif action == 'more_practical':
             params['technique_focus'] = min(1.0, params['technique_focus'] + self.learning_rate)
             params['specificity'] = min(1.0, params['specificity'] + self.learning_rate)
-            modifiers.append("Provide specific techniques and practical advice.")
-            
-        elif action == 'helpful':
-            modifiers.append("Be as helpful as possible, offering tailored advice.")
-            
-        elif action == 'not_helpful':
-            modifiers.append("Focus on providing general information.")
         
-        return " ".join(modifiers)
+        return ACTION_GUIDANCE.get(action, "")
 
     def process_feedback(self, reward):
         if not self.last_state or not self.last_parameters:
@@ -109,14 +238,13 @@ class PromptOptimizationRL:
         
         state = self.last_state
         action = self.last_action
-        current_q_value = self.q_table[state][action]
-        
-        self.q_table[state][action] = current_q_value + self.learning_rate * (reward + self.discount_factor * self._max_q_value(state) - current_q_value)
-
         #Q(s, a) = Q(s, a) + α * (r + γ * max Q(s', a') - Q(s, a))
+        self.q_table.update(state, action, reward, self.learning_rate, self.discount_factor)
+        if self.event_log is not None:
+            self.event_log.append(state, action, reward)
 
     def _max_q_value(self, state):
-        return max(self.q_table[state].values(), default=0.0)
+        return max(self.q_table.values(state).values(), default=0.0)
     
     def give_feedback(self, feedback_type):
         if feedback_type == "helpful":
@@ -0,0 +1,114 @@
+import io
+import wave
+import numpy as np
+import pytest
+from utils.audio_preprocess import preprocess_wav, read_wav, speech_bounds, write_wav
+
+RATE = 44100
+
+
+def tone(seconds, amplitude=0.3, frequency=220.0, rate=RATE):
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def noise(seconds, amplitude=0.001, rate=RATE, seed=0):
+    return (amplitude * np.random.default_rng(seed).standard_normal(int(seconds * rate))).astype(np.float32)
+
+
+def pcm_wav(samples, rate=RATE, width=2, channels=1):
+    """WAV bytes of `samples` (shape (n,) or (n, channels)) at `width` bytes per sample."""
+    samples = np.clip(samples, -1.0, 1.0)
+    if width == 1:
+        frames = (samples * 127 + 128).astype(np.uint8).tobytes()
+    elif width == 3:
+        values = (samples * (2 ** 23 - 1)).astype('<i4').reshape(-1, 1).view(np.uint8)
+        frames = values.reshape(-1, 4)[:, :3].tobytes()
+    else:
+        frames = (samples * (2 ** (8 * width - 1) - 1)).astype(f'<i{width}').tobytes()
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(width)
+        wav.setframerate(rate)
+        wav.writeframes(frames)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def padded_speech():
+    """1s of room noise, 1.5s of 'speech', 1s of room noise."""
+    return pcm_wav(np.concatenate([noise(1.0), tone(1.5) + noise(1.5, seed=1), noise(1.0, seed=2)]))
+
+
+def test_silence_around_speech_is_trimmed_and_resampled(padded_speech):
+    processed = preprocess_wav(padded_speech, target_rate=16000)
+
+    assert processed.has_speech
+    assert processed.sample_rate == 16000
+    # The speech plus up to PADDING_MS on each side
+    assert 1.5 <= processed.speech_seconds <= 1.5 + 0.4 + 0.06
+    assert processed.original_seconds == pytest.approx(3.5)
+    assert processed.bytes_saved > 0
+    samples, rate = read_wav(processed.wav)
+    assert rate == 16000 and len(samples) == pytest.approx(processed.speech_seconds * 16000, abs=2)
+
+
+@pytest.mark.parametrize('samples', [
+    tone(3.0),
+    tone(3.0) * (0.7 + 0.3 * np.sin(2 * np.pi * 4 * np.arange(3 * RATE) / RATE)).astype(np.float32),
+], ids=['steady', 'modulated'])
+def test_speech_throughout_is_kept_whole(samples):
+    processed = preprocess_wav(pcm_wav(samples), target_rate=16000)
+
+    assert processed.has_speech
+    assert processed.speech_seconds == pytest.approx(3.0, abs=0.05)
+
+
+def test_digital_silence_has_no_speech():
+    processed = preprocess_wav(pcm_wav(np.zeros(RATE, dtype=np.float32)))
+
+    assert not processed.has_speech
+    assert processed.wav == b''
+
+
+def test_trim_false_only_converts(padded_speech):
+    processed = preprocess_wav(padded_speech, target_rate=16000, trim=False)
+
+    assert processed.speech_seconds == pytest.approx(3.5)
+
+
+@pytest.mark.parametrize('width', [1, 2, 3, 4])
+def test_read_wav_decodes_every_pcm_width(width):
+    samples = tone(0.1, amplitude=0.5)
+    decoded, rate = read_wav(pcm_wav(samples, width=width))
+
+    assert rate == RATE
+    assert np.abs(decoded - samples).max() < 2.0 / 2 ** (8 * width - 1) + 1e-4
+
+
+def test_stereo_is_mixed_down():
+    left = tone(2.0)
+    stereo = pcm_wav(np.stack([left, np.zeros_like(left)], axis=1).reshape(-1), channels=2)
+
+    processed = preprocess_wav(stereo, trim=False, target_rate=RATE)
+
+    mono, _ = read_wav(processed.wav)
+    assert np.abs(mono - left / 2).max() < 1e-3
+
+
+def test_invalid_data_raises_value_error():
+    with pytest.raises(ValueError):
+        preprocess_wav(b'not a wav file')
+
+
+def test_speech_bounds_of_too_short_clip():
+    assert speech_bounds(np.zeros(10, dtype=np.float32), RATE) is None
+
+
+def test_write_wav_round_trip():
+    samples = tone(0.2)
+    decoded, rate = read_wav(write_wav(samples, 16000))
+
+    assert rate == 16000
+    assert np.abs(decoded - samples).max() < 1e-4
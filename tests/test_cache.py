@@ -0,0 +1,90 @@
+import pytest
+from utils.cache import TTLCache, TieredCache
+from utils.fake_redis import FakeRedis
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('utils.cache.time', clock)
+    monkeypatch.setattr('utils.fake_redis.time', clock)
+    return clock
+
+
+class BrokenRedis:
+    def get(self, key):
+        raise ConnectionError("redis down")
+
+    def set(self, key, value, ex=None):
+        raise ConnectionError("redis down")
+
+
+def test_ttl_cache_expires_entries(clock):
+    cache = TTLCache(ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2, ttl=30)
+
+    clock.now += 11
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert cache.items() == [('b', 2)]
+
+
+def test_ttl_cache_evicts_least_recently_used(clock):
+    cache = TTLCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert len(cache) == 2
+
+
+def test_tiered_cache_shares_entries_through_redis(clock):
+    redis_conn = FakeRedis()
+    writer = TieredCache('test_shared', redis_conn=redis_conn, ttl=60)
+    reader = TieredCache('test_shared', redis_conn=redis_conn, ttl=60)
+
+    writer.set('key', 'summary')
+
+    assert reader.get('key') == 'summary'
+    assert reader.get('key') == 'summary'
+    stats = reader.stats()
+    assert (stats['redis_hits'], stats['local_hits']) == (1, 1)
+
+
+def test_tiered_cache_redis_entries_expire(clock):
+    redis_conn = FakeRedis()
+    TieredCache('test_expiry', redis_conn=redis_conn, ttl=60).set('key', 'summary')
+    reader = TieredCache('test_expiry', redis_conn=redis_conn, ttl=60)
+
+    clock.now += 61
+
+    assert reader.get('key') is None
+
+
+def test_tiered_cache_degrades_to_local_when_redis_fails(clock):
+    cache = TieredCache('test_broken', redis_conn=BrokenRedis())
+
+    cache.set('key', 'summary')
+
+    assert cache.get('key') == 'summary'
+    assert cache.get('other') is None
+
+
+def test_tiered_cache_without_redis(clock):
+    cache = TieredCache('test_no_redis', redis_conn=lambda: None)
+
+    assert cache.get('key') is None
+    cache.set('key', 'summary')
+    assert cache.get('key') == 'summary'
@@ -0,0 +1,65 @@
+import pytest
+from utils.chat_history import ChatHistoryStore, encode_message, decode_message
+from utils.context_builder import ContextBuilder
+from utils.fake_redis import FakeRedis
+
+
+@pytest.mark.parametrize('content', ["", "hi", "ünïcödé ✓ " * 50, "x" * 5000, "{not json", "line\nbreaks\r\n"])
+@pytest.mark.parametrize('role', ['user', 'assistant', 'system'])
+def test_encode_decode_round_trip(role, content):
+    assert decode_message(encode_message(role, content, compress_over=16)) == {"role": role, "content": content}
+
+
+def test_long_messages_are_compressed():
+    encoded = encode_message('user', "calm " * 1000)
+    assert encoded.startswith('uz') and len(encoded) < 1000
+
+
+def test_decode_reads_json_entries():
+    assert decode_message('{"role": "user", "content": "hello"}') == {"role": "user", "content": "hello"}
+
+
+def collect_folded(summarized):
+    def summarize(summary, messages, max_tokens):
+        summarized.extend(message['content'] for message in messages)
+        return "\n".join(filter(None, [summary, *(message['content'] for message in messages)]))
+    return summarize
+
+
+def test_every_message_is_folded_before_it_is_trimmed():
+    folded = []
+    store = ChatHistoryStore(FakeRedis(), max_messages=4, summarize=collect_folded(folded))
+    # A budget so large every retained message fits verbatim: the builder itself never folds
+    builder = ContextBuilder(budget=100000, summarize=collect_folded(folded))
+
+    for turn in range(10):
+        snapshot = store.snapshot('s')
+        context = builder.build(snapshot, f"user {turn}")
+        if context.summary_changed:
+            store.save_summary('s', context.summary, context.summarized)
+        store.append_turn('s', f"user {turn}", f"assistant {turn}")
+
+    snapshot = store.snapshot('s')
+    assert [m['content'] for m in snapshot.messages] == ["user 8", "assistant 8", "user 9", "assistant 9"]
+    assert snapshot.start == 16 and snapshot.summarized == 16
+    assert folded == [f"{role} {turn}" for turn in range(8) for role in ('user', 'assistant')]
+
+
+def test_builder_and_store_fold_each_message_once():
+    folded = []
+    store = ChatHistoryStore(FakeRedis(), max_messages=6, summarize=collect_folded(folded))
+    # Room for about two messages verbatim
+    builder = ContextBuilder(budget=30, summary_tokens=0, summarize=collect_folded(folded))
+
+    for turn in range(10):
+        context = builder.build(store.snapshot('s'), f"user {turn}")
+        if context.summary_changed:
+            store.save_summary('s', context.summary, context.summarized)
+        store.append_turn('s', f"user {turn}", f"assistant {turn}")
+
+    snapshot = store.snapshot('s')
+    builder.build(snapshot, "last")
+    assert len(snapshot.messages) == 6
+    assert len(folded) == len(set(folded))
+    expected = [f"{role} {turn}" for turn in range(10) for role in ('user', 'assistant')]
+    assert set(folded) | {m['content'] for m in snapshot.messages} == set(expected)
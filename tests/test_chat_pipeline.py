@@ -0,0 +1,35 @@
+import pytest
+from utils.chat_pipeline import ChatPipeline, TurnCancelled, make_executor
+
+
+def failing_history():
+    raise ConnectionError("redis down")
+
+
+@pytest.mark.parametrize('concurrent', [True, False])
+def test_history_errors_are_returned_to_the_caller(concurrent):
+    pipeline = ChatPipeline(
+        make_executor(2),
+        fetch_history=failing_history,
+        retrieve=lambda message: [{'question': message, 'answer': 'Breathe slowly.'}],
+        summarize=lambda entries: entries[0]['answer'],
+        concurrent=concurrent
+    )
+    turn = pipeline.start()
+
+    history, kb_entries, summary = pipeline.prepare(turn, "I can't sleep")
+
+    assert history is None
+    assert summary == 'Breathe slowly.'
+    assert isinstance(turn.errors['history'], ConnectionError)
+
+
+def test_cancelled_turn_is_not_reported_as_a_history_error():
+    pipeline = ChatPipeline(make_executor(1), fetch_history=failing_history, retrieve=lambda message: [],
+                            summarize=lambda entries: "")
+    turn = pipeline.start()
+    turn.cancel()
+
+    with pytest.raises(TurnCancelled):
+        pipeline.prepare(turn, "hello")
+    assert not turn.errors
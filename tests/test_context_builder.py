@@ -0,0 +1,50 @@
+from utils.chat_history import HistorySnapshot
+from utils.context_builder import ContextBuilder, estimate_tokens, fold_messages, model_summarizer
+from utils.llm_client import LLMClient, FakeBackend
+
+MESSAGES = [
+    {'role': 'user', 'content': "My manager keeps piling on work and I stay late every night."},
+    {'role': 'assistant', 'content': "That sounds draining. What happens when you try to say no?"},
+]
+
+
+def test_model_summarizer_rewrites_the_summary_with_the_model():
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return "The user is overworked and finds it hard to refuse extra tasks."
+
+    summary = model_summarizer(generate)("The user feels tired.", MESSAGES, 50)
+
+    assert summary == "The user is overworked and finds it hard to refuse extra tasks."
+    assert "The user feels tired." in prompts[0]
+    assert all(message['content'] in prompts[0] for message in MESSAGES)
+
+
+def test_model_summarizer_output_is_bounded():
+    summary = model_summarizer(lambda prompt: "worry " * 500)("", MESSAGES, 30)
+
+    assert estimate_tokens(summary) <= 31
+
+
+def test_model_summarizer_falls_back_when_the_model_fails():
+    def generate(prompt):
+        raise TimeoutError("no reply")
+
+    summary = model_summarizer(generate)("", MESSAGES, 100)
+
+    assert summary == fold_messages("", MESSAGES, 100)
+
+
+def test_context_builder_folds_old_messages_through_the_model():
+    llm = LLMClient(FakeBackend(latency=0, reply="The user talked about work stress."), max_retries=0)
+    builder = ContextBuilder(budget=60, summary_tokens=20, summarize=model_summarizer(llm.generate))
+    messages = [{'role': 'user', 'content': f"message {i} " + "detail " * 10} for i in range(6)]
+
+    context = builder.build(HistorySnapshot(0, messages), "And today?")
+
+    assert context.summary_changed
+    assert context.summary == "The user talked about work stress."
+    assert "Summary of the earlier conversation:\nThe user talked about work stress." in context.text
+    assert llm.backend.calls == 1
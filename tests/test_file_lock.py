@@ -0,0 +1,104 @@
+import csv
+import json
+import time
+import random
+import multiprocessing
+import pytest
+from utils.file_lock import append_csv_row
+from utils.kb_index import KnowledgeBaseIndex
+
+WORKERS = 4
+VOCABULARY = [f"word{i}" for i in range(3000)]
+
+
+def random_question(rng):
+    return " ".join(rng.sample(VOCABULARY, 6)) + "?"
+
+
+def read_rows(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.reader(f))[1:]
+
+
+def write_rows(worker, path, n_rows):
+    for i in range(n_rows):
+        append_csv_row(path, [f"worker {worker} row {i}", "x" * (i % 50) + "\nsecond line"])
+
+
+def append_questions(worker, csv_path, cache_dir, questions, ready, result_path):
+    index = KnowledgeBaseIndex.load_or_build(csv_path, cache_dir)
+    find_duplicate = index.find_duplicate
+
+    def slow_find_duplicate(*args, **kwargs):
+        duplicate = find_duplicate(*args, **kwargs)
+        # Widen the check-then-append window so unlocked writers would interleave
+        time.sleep(0.005)
+        return duplicate
+    index.find_duplicate = slow_find_duplicate
+    ready.wait(60)
+    appended = [question for question in questions if index.append_unique(csv_path, question, f"from {worker}") is None]
+    with open(result_path, 'w') as f:
+        json.dump(appended, f)
+
+
+@pytest.fixture
+def fork():
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        pytest.skip("needs the fork start method")
+    return multiprocessing.get_context('fork')
+
+
+def run_workers(fork, target, args_for):
+    processes = [fork.Process(target=target, args=args_for(worker)) for worker in range(WORKERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(120)
+        assert process.exitcode == 0
+
+
+def test_concurrent_appends_keep_rows_whole(tmp_path, fork):
+    path = str(tmp_path / 'kb.csv')
+    append_csv_row(path, ['question', 'answer'])
+
+    run_workers(fork, write_rows, lambda worker: (worker, path, 200))
+
+    rows = read_rows(path)
+    assert len(rows) == WORKERS * 200
+    assert sorted(row[0] for row in rows) == sorted(
+        f"worker {worker} row {i}" for worker in range(WORKERS) for i in range(200)
+    )
+    assert all(len(row) == 2 and row[1].endswith("\nsecond line") for row in rows)
+
+
+def test_concurrent_append_unique_writes_each_question_once(tmp_path, fork):
+    rng = random.Random(0)
+    csv_path = str(tmp_path / 'kb.csv')
+    cache_dir = str(tmp_path / '.kb_index')
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['question', 'answer'])
+        writer.writerows((random_question(rng), "seed answer") for _ in range(20))
+    shared = [random_question(rng) for _ in range(15)]
+    own = {worker: [random_question(rng) for _ in range(5)] for worker in range(WORKERS)}
+
+    ready = fork.Barrier(WORKERS)
+
+    def args_for(worker):
+        # Every worker tries the shared questions in the same order, so they race on each one
+        questions = [question for pair in zip(shared, own[worker] * 3) for question in pair]
+        return worker, csv_path, cache_dir, questions, ready, str(tmp_path / f"worker{worker}.json")
+
+    run_workers(fork, append_questions, args_for)
+    appended = {}
+    for worker in range(WORKERS):
+        with open(tmp_path / f"worker{worker}.json") as f:
+            appended[worker] = json.load(f)
+
+    questions = [row[0] for row in read_rows(csv_path)]
+    assert len(questions) == len(set(questions)) == 20 + len(shared) + WORKERS * 5
+    assert set(shared) <= set(questions)
+    # Each shared question was appended by exactly one worker; every worker's own questions by it
+    assert sorted(q for worker_appended in appended.values() for q in worker_appended if q in shared) == sorted(shared)
+    for worker, questions_added in appended.items():
+        assert set(own[worker]) <= set(questions_added)
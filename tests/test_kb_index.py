@@ -0,0 +1,136 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from utils.kb_index import KnowledgeBaseIndex
+
+KB_PATH = os.path.join(os.path.dirname(__file__), '..', 'assets', 'knowledge_base', 'kb.csv')
+
+QUESTIONS = [
+    "How can I sleep better at night?",
+    "What helps with anxiety before an exam?",
+    "How do I cope with loneliness after moving?",
+    "Why do I feel tired all the time?",
+    "How can I stop overthinking at night?",
+    "What are grounding techniques for panic attacks?",
+]
+QUERIES = [
+    "insomnia: I cannot sleep, my doctor prescribed melatonin but nothing works",
+    "exam anxiety",
+    "I moved to a new city and feel lonely",
+    "zebra quantum",
+]
+
+
+def sklearn_scores(questions, queries):
+    vectorizer = TfidfVectorizer(stop_words='english')
+    question_vectors = vectorizer.fit_transform(questions)
+    return cosine_similarity(vectorizer.transform(queries), question_vectors)
+
+
+def index_scores(index, queries):
+    return index.similarities(index.transform(queries)).toarray()
+
+
+def test_query_scores_match_tfidf_vectorizer():
+    index = KnowledgeBaseIndex(QUESTIONS, [f"answer {i}" for i in range(len(QUESTIONS))])
+    np.testing.assert_allclose(index_scores(index, QUERIES), sklearn_scores(QUESTIONS, QUERIES), atol=1e-9)
+
+
+def test_unknown_terms_do_not_dilute_query():
+    index = KnowledgeBaseIndex(QUESTIONS, [f"answer {i}" for i in range(len(QUESTIONS))])
+    results = index.search(QUERIES[0])
+    assert results and results[0]['question'] == "How can I sleep better at night?"
+    assert results[0]['similarity'] > 0.5
+
+
+def test_known_terms_only_false_keeps_unknown_terms():
+    index = KnowledgeBaseIndex(QUESTIONS, [f"answer {i}" for i in range(len(QUESTIONS))])
+    assert index.transform(["zebra quantum"]).nnz == 0
+    assert index.transform(["zebra quantum"], known_terms_only=False).nnz == 2
+
+
+@pytest.mark.skipif(not os.path.exists(KB_PATH), reason="knowledge base CSV not shipped")
+def test_shipped_knowledge_base_scores_match_tfidf_vectorizer():
+    df = pd.read_csv(KB_PATH).dropna(subset=['question', 'answer'])
+    questions = df['question'].astype(str).tolist()
+    index = KnowledgeBaseIndex(questions, df['answer'].astype(str).tolist())
+    queries = QUERIES + questions[:20]
+    np.testing.assert_allclose(index_scores(index, queries), sklearn_scores(questions, queries), atol=1e-6)
+
+
+@pytest.mark.parametrize('exact_rows', [0, 10 ** 6])
+def test_find_duplicate_verifies_with_cosine(monkeypatch, exact_rows):
+    monkeypatch.setattr('utils.kb_index.EXACT_DUPLICATE_ROWS', exact_rows)
+    index = KnowledgeBaseIndex(QUESTIONS, [f"answer {i}" for i in range(len(QUESTIONS))])
+    row, similarity = index.find_duplicate("How can I sleep better at night")
+    assert row == 0 and similarity == pytest.approx(1.0)
+    assert index.find_duplicate("How can I sleep at the office?") is None
+    index.add("Is it normal to dream every night?", "Yes")
+    assert index.find_duplicate("is it normal to dream every night")[0] == len(QUESTIONS)
+
+
+def write_kb(path, n_rows):
+    pd.DataFrame({
+        'question': [f"How do I handle worry number {i} about topic{i}?" for i in range(n_rows)],
+        'answer': [f"Answer {i}" for i in range(n_rows)]
+    }).to_csv(path, index=False)
+
+
+def no_rebuild(*args, **kwargs):
+    raise AssertionError("index was rebuilt from the CSV")
+
+
+def test_appends_reuse_the_artifact_and_tail_new_rows(tmp_path, monkeypatch):
+    kb_path, cache_dir = str(tmp_path / 'kb.csv'), str(tmp_path / '.kb_index')
+    write_kb(kb_path, 200)
+    built = KnowledgeBaseIndex.load_or_build(kb_path, cache_dir)
+    built.append_unique(kb_path, "Is journaling at night a good idea?", "Yes")
+
+    monkeypatch.setattr(KnowledgeBaseIndex, 'from_frame', no_rebuild)
+    loaded = KnowledgeBaseIndex.load_or_build(kb_path, cache_dir)
+
+    assert loaded.artifact_dir == built.artifact_dir
+    assert os.listdir(cache_dir) == [os.path.basename(built.artifact_dir)]
+    assert len(loaded) == 201 and loaded.csv_offset == os.path.getsize(kb_path)
+    assert loaded.search("journaling at night")[0]['answer'] == "Yes"
+    # Nothing is tailed twice by a later sync
+    assert loaded.sync_from_csv(kb_path) == 0
+
+
+def test_long_tail_is_saved_as_a_new_artifact(tmp_path, monkeypatch):
+    kb_path, cache_dir = str(tmp_path / 'kb.csv'), str(tmp_path / '.kb_index')
+    write_kb(kb_path, 50)
+    built = KnowledgeBaseIndex.load_or_build(kb_path, cache_dir, reweight_every=8)
+    for i in range(8):
+        assert built.append_unique(kb_path, f"Is it normal to dream{i} about exam{i}?", f"Dream {i}") is None
+
+    monkeypatch.setattr(KnowledgeBaseIndex, 'from_frame', no_rebuild)
+    refreshed = KnowledgeBaseIndex.load_or_build(kb_path, cache_dir, reweight_every=8)
+    reloaded = KnowledgeBaseIndex.load_or_build(kb_path, cache_dir, reweight_every=8)
+
+    assert refreshed.artifact_dir != built.artifact_dir
+    assert os.listdir(cache_dir) == [os.path.basename(refreshed.artifact_dir)]
+    assert reloaded.artifact_dir == refreshed.artifact_dir and len(reloaded) == 58
+    np.testing.assert_allclose(
+        index_scores(reloaded, ["dream3 about exam3"]),
+        index_scores(KnowledgeBaseIndex(list(reloaded.questions), list(reloaded.answers)), ["dream3 about exam3"])
+    )
+
+
+def test_edited_csv_is_rebuilt(tmp_path):
+    kb_path, cache_dir = str(tmp_path / 'kb.csv'), str(tmp_path / '.kb_index')
+    write_kb(kb_path, 200)
+    built = KnowledgeBaseIndex.load_or_build(kb_path, cache_dir)
+    with open(kb_path, 'r+b') as f:
+        # Same length and head, different content past the bytes that are checked cheaply
+        data = f.read()
+        f.seek(0)
+        f.write(data[:data.rindex(b'Answer 199')] + b'Answer 999\n')
+
+    rebuilt = KnowledgeBaseIndex.load_or_build(kb_path, cache_dir)
+
+    assert rebuilt.artifact_dir != built.artifact_dir
+    assert rebuilt.answers[199] == "Answer 999"
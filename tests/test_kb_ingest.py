@@ -0,0 +1,66 @@
+import os
+import csv
+import numpy as np
+from utils.file_lock import append_csv_row, lock_for
+from utils.kb_index import KnowledgeBaseIndex
+from utils.kb_ingest import ingest
+
+
+def write_kb(path, rows):
+    # LF line endings, as pandas writes; ingest re-serializes them as CRLF
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['question', 'answer'])
+        writer.writerows(rows)
+
+
+def test_worker_reloads_after_ingest_replaces_csv(tmp_path):
+    kb_path = str(tmp_path / 'kb.csv')
+    index_dir = str(tmp_path / '.kb_index')
+    write_kb(kb_path, [(f"How do I handle worry number {i}?", f"Answer {i}") for i in range(50)])
+    worker = KnowledgeBaseIndex.load_or_build(kb_path, index_dir)
+
+    source = str(tmp_path / 'more.csv')
+    write_kb(source, [(f"What does topic{i} mean for my sleep schedule?", f"Topic answer {i}") for i in range(5)])
+    ingest([source], kb_path, index_dir=index_dir, progress=False)
+    # Another worker appends after the ingest
+    append_csv_row(kb_path, ["Is journaling at night a good idea?", "Yes"])
+
+    with lock_for(kb_path):
+        added = worker.sync_from_csv(kb_path)
+
+    fresh = KnowledgeBaseIndex.load_or_build(kb_path, index_dir)
+    fresh.sync_from_csv(kb_path)
+    assert added == 6
+    assert list(worker.questions) == list(fresh.questions)
+    assert worker.csv_offset == os.path.getsize(kb_path)
+    for i in range(5):
+        assert worker.search(f"topic{i} sleep schedule")[0]['answer'] == f"Topic answer {i}"
+    np.testing.assert_allclose(
+        worker.similarities(worker.transform(["journaling at night"])).toarray(),
+        fresh.similarities(fresh.transform(["journaling at night"])).toarray()
+    )
+
+    # Nothing changed since: plain appends are tailed, no reload
+    artifact_dir = worker.artifact_dir
+    append_csv_row(kb_path, ["How can I rest on weekends?", "Plan less"])
+    with lock_for(kb_path):
+        assert worker.sync_from_csv(kb_path) == 1
+    assert worker.artifact_dir == artifact_dir
+
+
+def test_appends_to_a_small_csv_are_not_mistaken_for_a_replacement(tmp_path, monkeypatch):
+    kb_path = str(tmp_path / 'kb.csv')
+    write_kb(kb_path, [(f"How do I handle worry number {i}?", f"Answer {i}") for i in range(5)])
+    index = KnowledgeBaseIndex.load_or_build(kb_path, str(tmp_path / '.kb_index'))
+
+    def reload(csv_path):
+        raise AssertionError("appended CSV was reloaded as replaced")
+    monkeypatch.setattr(index, '_reload', reload)
+
+    assert index.append_unique(kb_path, "Is journaling at night a good idea?", "Yes") is None
+    append_csv_row(kb_path, ["What is box breathing?", "Breathe in four counts"])
+    with lock_for(kb_path):
+        assert index.sync_from_csv(kb_path) == 1
+    assert index.append_unique(kb_path, "Can music help with stress?", "Often") is None
+    assert len(index) == 8
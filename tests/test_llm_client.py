@@ -0,0 +1,94 @@
+import pytest
+from utils import metrics
+from utils.llm_client import LLMClient, FakeBackend, TransientLLMError, shared_client
+
+
+class FlakyBackend(FakeBackend):
+    """Fails the first `failures` calls with `error`, optionally after streaming one chunk."""
+
+    def __init__(self, failures, error=TransientLLMError, fail_mid_stream=False):
+        super().__init__(latency=0, reply="one two three")
+        self.failures = failures
+        self.error = error
+        self.fail_mid_stream = fail_mid_stream
+
+    def generate(self, model, prompt, timeout, system_instruction=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error("flaky")
+        return self._text(prompt)
+
+    def stream(self, model, prompt, timeout, system_instruction=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            if self.fail_mid_stream:
+                yield "one "
+            raise self.error("flaky")
+        yield from ["one ", "two ", "three"]
+
+
+def client(backend, max_retries=2, timeout=1, model='test-retry'):
+    return LLMClient(backend, model=model, timeout=timeout, max_retries=max_retries, backoff_base=0)
+
+
+def test_generate_retries_transient_errors():
+    retries = metrics.counter('llm_retries_total', model='test-generate-retry')
+    backend = FlakyBackend(failures=2)
+
+    assert client(backend, model='test-generate-retry').generate("hi") == "one two three"
+    assert backend.calls == 3
+    assert metrics.counter('llm_retries_total', model='test-generate-retry') == retries + 2
+
+
+def test_generate_gives_up_after_max_retries():
+    backend = FlakyBackend(failures=5)
+
+    with pytest.raises(TransientLLMError):
+        client(backend, max_retries=2).generate("hi")
+    assert backend.calls == 3
+
+
+def test_other_errors_are_not_retried():
+    backend = FlakyBackend(failures=1, error=ValueError)
+
+    with pytest.raises(ValueError):
+        client(backend).generate("hi")
+    assert backend.calls == 1
+
+
+def test_slow_replies_time_out_and_are_retried():
+    backend = FakeBackend(latency=0.2)
+
+    with pytest.raises(TimeoutError):
+        client(backend, max_retries=1, timeout=0.01).generate("hi")
+    assert backend.calls == 2
+
+
+def test_stream_retries_before_the_first_chunk():
+    backend = FlakyBackend(failures=1)
+
+    assert "".join(client(backend).stream("hi")) == "one two three"
+    assert backend.calls == 2
+
+
+def test_stream_is_not_retried_after_the_first_chunk():
+    backend = FlakyBackend(failures=1, fail_mid_stream=True)
+    chunks = []
+
+    with pytest.raises(TransientLLMError):
+        for chunk in client(backend).stream("hi"):
+            chunks.append(chunk)
+    assert chunks == ["one "]
+    assert backend.calls == 1
+
+
+def test_shared_client_is_keyed_by_its_settings():
+    first = shared_client('fake', timeout=1, max_retries=0)
+    assert shared_client('fake', timeout=1, max_retries=0) is first
+
+    other = shared_client('fake', timeout=5, max_retries=3)
+    assert other is not first
+    assert (other.timeout, other.max_retries) == (5, 3)
+    assert (first.timeout, first.max_retries) == (1, 0)
+    # One backend per (backend, api_key), whatever the client settings
+    assert other.backend is first.backend
@@ -0,0 +1,135 @@
+import json
+import threading
+import pytest
+from reinforcement import ArrayQTable, ACTIONS, mask_state
+from utils.fake_redis import FakeRedis
+from utils.q_store import SharedQTable, RedisQStore, SQLiteQStore, q_update
+from utils.rl_training import deploy
+
+STORES = {
+    'redis': lambda tmp_path: RedisQStore(FakeRedis()),
+    'sqlite': lambda tmp_path: SQLiteQStore(str(tmp_path / 'q.sqlite')),
+}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture(params=sorted(STORES))
+def store(request, tmp_path):
+    return STORES[request.param](tmp_path)
+
+
+def test_q_update_uses_the_best_value_of_the_state():
+    values = {'helpful': 0.5, 'more_empathy': 2.0}
+
+    assert q_update(values, 'helpful', 1.0, 0.1, 0.9) == pytest.approx(0.5 + 0.1 * (1.0 + 0.9 * 2.0 - 0.5))
+    assert q_update({}, 'helpful', 1.0, 0.5, 0.9) == pytest.approx(0.5)
+
+
+def test_stores_apply_q_learning_updates(store):
+    assert store.update('sad', 'helpful', 1.0, 0.5, 0.0) == {'helpful': 0.5}
+    assert store.update('sad', 'more_empathy', -1.0, 0.5, 0.0) == {'helpful': 0.5, 'more_empathy': -0.5}
+    assert store.values('sad') == {'helpful': 0.5, 'more_empathy': -0.5}
+    assert store.values('happy') == {}
+    assert store.snapshot() == {'sad': {'helpful': 0.5, 'more_empathy': -0.5}}
+
+
+def test_concurrent_sqlite_updates_are_not_lost(tmp_path):
+    path = str(tmp_path / 'q.sqlite')
+
+    def work():
+        store = SQLiteQStore(path)
+        for _ in range(25):
+            # With α = γ = 1 and one action, each update adds exactly 1
+            store.update('anxious', 'helpful', 1.0, 1.0, 1.0)
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert SQLiteQStore(path).values('anxious') == {'helpful': 100.0}
+
+
+def test_updates_fall_back_to_sqlite_while_redis_is_down(tmp_path):
+    redis_conn = FakeRedis()
+    available = [False]
+    fallback = SQLiteQStore(str(tmp_path / 'q.sqlite'))
+    table = SharedQTable(RedisQStore(lambda: redis_conn if available[0] else None), fallback, read_ttl=0)
+
+    assert table.update('sad', 'helpful', 1.0, 0.5, 0.0) == {'helpful': 0.5}
+    assert fallback.values('sad') == {'helpful': 0.5}
+
+    available[0] = True
+    table.update('happy', 'helpful', 1.0, 0.5, 0.0)
+    assert RedisQStore(redis_conn).snapshot() == {'happy': {'helpful': 0.5}}
+
+
+def test_reads_are_cached_for_read_ttl(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('utils.cache.time', clock)
+    redis_conn = FakeRedis()
+    table = SharedQTable(RedisQStore(redis_conn), read_ttl=5)
+    other_process = SharedQTable(RedisQStore(redis_conn), read_ttl=5)
+    assert table.values('sad') == {}
+
+    other_process.update('sad', 'helpful', 1.0, 0.5, 0.0)
+    assert table.values('sad') == {}
+
+    clock.now += 6
+    assert table.values('sad') == {'helpful': 0.5}
+
+
+def test_snapshot_seeds_only_an_empty_store(tmp_path):
+    snapshot_path = str(tmp_path / 'snapshot.json')
+    table = SharedQTable(RedisQStore(FakeRedis()), snapshot_path=snapshot_path)
+    table.update('sad', 'helpful', 1.0, 0.5, 0.0)
+    assert table.maybe_snapshot(force=True)
+
+    assert SharedQTable(RedisQStore(FakeRedis()), snapshot_path=snapshot_path).values('sad') == {'helpful': 0.5}
+
+    populated = FakeRedis()
+    RedisQStore(populated).load({'happy': {'helpful': 1.0}})
+    restored = SharedQTable(RedisQStore(populated), snapshot_path=snapshot_path)
+    assert restored.snapshot() == {'happy': {'helpful': 1.0}}
+
+
+def test_replace_swaps_a_trained_policy_into_a_running_table(tmp_path):
+    snapshot_path = tmp_path / 'snapshot.json'
+    live = SharedQTable(RedisQStore(FakeRedis()), SQLiteQStore(str(tmp_path / 'q.sqlite')),
+                        snapshot_path=str(snapshot_path))
+    live.update('sad', 'helpful', 1.0, 0.5, 0.0)
+    live.update('happy', 'more_empathy', -1.0, 0.5, 0.0)
+    assert live.values('sad') == {'helpful': 0.5}
+
+    assert live.replace({'sad': {'more_empathy': 0.8}}) == 2
+
+    # Cached values and states the new policy does not have are gone
+    assert live.values('sad') == {'more_empathy': 0.8}
+    assert live.values('happy') == {}
+    assert [store.snapshot() for store in live.stores] == [{'sad': {'more_empathy': 0.8}}] * 2
+    assert json.loads(snapshot_path.read_text())['q_table'] == {'sad': {'more_empathy': 0.8}}
+
+
+def test_replace_works_while_redis_is_down(tmp_path):
+    live = SharedQTable(RedisQStore(lambda: None), SQLiteQStore(str(tmp_path / 'q.sqlite')))
+
+    assert live.replace({'anxious': {'more_practical': 0.3}}) == 1
+    assert live.values('anxious') == {'more_practical': 0.3}
+
+
+def test_deploy_replaces_the_sqlite_fallback(tmp_path):
+    sqlite_path = str(tmp_path / 'q.sqlite')
+    SQLiteQStore(sqlite_path).load({'lonely': {'helpful': -0.4}})
+    trained = ArrayQTable()
+    trained.update(mask_state(3), ACTIONS[1], 1.0, 0.1, 0.9)
+
+    assert deploy(trained, sqlite_path=sqlite_path) == 1
+
+    assert SQLiteQStore(sqlite_path).snapshot() == trained.snapshot()
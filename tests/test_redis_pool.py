@@ -0,0 +1,102 @@
+import socket
+import pytest
+import redis
+from utils.redis_pool import CountingConnectionPool, RedisPoolManager, shared_pool
+
+
+class IdleConnection(redis.Connection):
+    """A connection that never touches the network."""
+
+    def connect(self):
+        pass
+
+    def can_read(self, timeout=0):
+        return False
+
+    def disconnect(self, *args, **kwargs):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('utils.redis_pool.time', clock)
+    return clock
+
+
+@pytest.fixture
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_pool_counts_created_and_checked_out_connections():
+    pool = CountingConnectionPool(connection_class=IdleConnection, max_connections=2, timeout=0.01)
+
+    first, second = pool.get_connection(), pool.get_connection()
+    pool.release(first)
+    assert (pool.created, pool.in_use) == (2, 1)
+
+    # Released connections are reused rather than reopened
+    third = pool.get_connection()
+    assert third is first
+    assert (pool.created, pool.in_use) == (2, 2)
+
+    # The pool is bounded: a third concurrent caller waits, then gives up
+    with pytest.raises(redis.exceptions.ConnectionError):
+        pool.get_connection()
+    assert (pool.created, pool.in_use) == (2, 2)
+
+    pool.release(second)
+    pool.release(third)
+    assert pool.in_use == 0
+
+
+def test_unreachable_redis_backs_off_between_attempts(clock, closed_port, monkeypatch):
+    manager = RedisPoolManager(port=closed_port, connect_timeout=0.2, reconnect_base=1, reconnect_max=4)
+    pings = []
+    ping = manager._client.ping
+    monkeypatch.setattr(manager._client, 'ping', lambda: pings.append(clock.now) or ping())
+
+    assert manager.client() is None
+    assert manager.client() is None
+    assert len(pings) == 1
+    stats = manager.stats()
+    assert (stats['healthy'], stats['consecutive_failures']) == (False, 1)
+    assert stats['last_error']
+
+    # Retries wait 0.5-1x of 1s, 2s, 4s, then stay capped at reconnect_max
+    for failures, delay in [(2, 1), (3, 2), (4, 4), (5, 4)]:
+        clock.now += delay
+        assert manager.client() is None
+        assert manager.stats()['consecutive_failures'] == failures
+    assert len(pings) == 5
+
+
+def test_manager_recovers_when_redis_comes_back(clock, closed_port, monkeypatch):
+    manager = RedisPoolManager(port=closed_port, connect_timeout=0.2, reconnect_base=1, health_check_interval=30)
+    assert manager.client() is None
+
+    monkeypatch.setattr(manager._client, 'ping', lambda: True)
+    assert manager.client() is None  # Still backing off
+    clock.now += 1
+
+    assert manager.client() is manager._client
+    stats = manager.stats()
+    assert (stats['healthy'], stats['consecutive_failures'], stats['last_error']) == (True, 0, None)
+
+
+def test_shared_pool_is_one_manager_per_server():
+    manager = shared_pool('localhost', 6390, 1)
+
+    assert shared_pool('localhost', '6390', '1') is manager
+    assert shared_pool('localhost', 6390, 2) is not manager
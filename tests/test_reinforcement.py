@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from reinforcement import ArrayQTable, ACTIONS, mask_state
+from utils.rl_training import synthetic_events
+
+
+def replay_sequentially(events, learning_rate, discount_factor, table=None):
+    table = table if table is not None else ArrayQTable()
+    for mask, action, reward in zip(events['state'].tolist(), events['action'].tolist(), events['reward'].tolist()):
+        table.update(mask_state(mask), ACTIONS[action], reward, learning_rate, discount_factor)
+    return table
+
+
+@pytest.mark.parametrize('discount_factor', [0.0, 0.9])
+def test_apply_events_matches_sequential_updates(discount_factor):
+    events = synthetic_events(20_000, seed=3)
+    sequential = replay_sequentially(events, 0.1, discount_factor)
+
+    replayed = ArrayQTable()
+    # In chunks, as `train` replays a log, so waves also span chunk boundaries
+    for start in range(0, len(events), 7_000):
+        chunk = events[start:start + 7_000]
+        replayed.apply_events(chunk['state'], chunk['action'], chunk['reward'], 0.1, discount_factor)
+
+    assert np.array_equal(replayed.seen, sequential.seen)
+    assert np.abs(replayed.q - sequential.q).max() < 1e-12
+    assert replayed.snapshot().keys() == sequential.snapshot().keys()
+
+
+def test_apply_events_continues_from_loaded_values():
+    events = synthetic_events(2_000, seed=4)
+    seed_table = {mask_state(5): {ACTIONS[0]: 0.5}, mask_state(0): {ACTIONS[-1]: -0.25}}
+
+    sequential = ArrayQTable()
+    sequential.load(seed_table)
+    replay_sequentially(events, 0.3, 0.5, sequential)
+
+    replayed = ArrayQTable()
+    replayed.load(seed_table)
+    assert replayed.apply_events(events['state'], events['action'], events['reward'], 0.3, 0.5) == len(events)
+
+    assert np.abs(replayed.q - sequential.q).max() < 1e-12
+
+
+def test_apply_events_without_events_is_a_no_op():
+    table = ArrayQTable()
+    assert table.apply_events([], [], [], 0.1, 0.9) == 0
+    assert not table.seen.any()
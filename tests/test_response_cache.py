@@ -0,0 +1,113 @@
+import pytest
+from utils.fake_redis import FakeRedis
+from utils.kb_index import KnowledgeBaseIndex
+from utils.response_cache import SemanticResponseCache, MemoryResponseStore, RedisResponseStore
+
+KB = KnowledgeBaseIndex(
+    ["How can I sleep better?", "What helps with exam anxiety?", "How do I make friends in a new city?"],
+    ["a", "b", "c"]
+)
+
+
+def vector(message):
+    return KB.transform([message], known_terms_only=False)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr('utils.response_cache.time', clock)
+    monkeypatch.setattr('utils.cache.time', clock)
+    monkeypatch.setattr('utils.fake_redis.time', clock)
+    return clock
+
+
+STORES = {
+    'memory': lambda max_entries, ttl: MemoryResponseStore(max_entries=max_entries, ttl=ttl),
+    'redis': lambda max_entries, ttl: RedisResponseStore(FakeRedis(), max_entries=max_entries, ttl=ttl),
+}
+
+
+@pytest.fixture(params=sorted(STORES))
+def make_store(request):
+    return STORES[request.param]
+
+
+def test_semantically_equal_message_hits(make_store, clock):
+    cache = SemanticResponseCache(make_store(16, 60))
+    cache.set('anxious', vector("What can I do about my exam anxiety?"), "Try breathing exercises.", 'more_practical')
+
+    hit = cache.get('anxious', vector("what can i do about my EXAM anxiety"))
+
+    assert hit.response == "Try breathing exercises." and hit.action == 'more_practical'
+    assert hit.similarity == pytest.approx(1.0)
+
+
+def test_different_message_or_state_misses(make_store, clock):
+    cache = SemanticResponseCache(make_store(16, 60))
+    cache.set('anxious', vector("What can I do about my exam anxiety?"), "Try breathing exercises.", 'helpful')
+
+    assert cache.get('anxious', vector("How do I make friends in a new city?")) is None
+    assert cache.get('sad', vector("What can I do about my exam anxiety?")) is None
+
+
+def test_entries_expire(make_store, clock):
+    cache = SemanticResponseCache(make_store(16, 60))
+    cache.set('neutral', vector("How can I sleep better?"), "Keep a regular bedtime.", 'helpful')
+
+    clock.now += 61
+
+    assert cache.get('neutral', vector("How can I sleep better?")) is None
+
+
+def test_least_recently_used_entry_is_evicted(make_store, clock):
+    cache = SemanticResponseCache(make_store(2, 60))
+    messages = ["How can I sleep better?", "What helps with exam anxiety?", "How do I make friends in a new city?"]
+    for i, message in enumerate(messages[:2]):
+        clock.now += 1
+        cache.set('neutral', vector(message), f"reply {i}", 'helpful')
+    clock.now += 1
+    assert cache.get('neutral', vector(messages[0])).response == "reply 0"
+
+    clock.now += 1
+    cache.set('neutral', vector(messages[2]), "reply 2", 'helpful')
+
+    assert cache.get('neutral', vector(messages[1])) is None
+    assert cache.get('neutral', vector(messages[0])).response == "reply 0"
+    assert cache.get('neutral', vector(messages[2])).response == "reply 2"
+
+
+def test_store_failures_count_as_misses():
+    class BrokenStore:
+        def entries(self, state):
+            raise ConnectionError("redis down")
+
+        def put(self, state, entry_id, vector, response, action):
+            raise ConnectionError("redis down")
+
+    cache = SemanticResponseCache(BrokenStore())
+    cache.set('neutral', vector("How can I sleep better?"), "reply", 'helpful')
+
+    assert cache.get('neutral', vector("How can I sleep better?")) is None
+
+
+def test_redis_store_is_shared_between_processes(clock):
+    redis_conn = FakeRedis()
+    SemanticResponseCache(RedisResponseStore(redis_conn)).set(
+        'sad', vector("How do I make friends in a new city?"), "Join a local club.", 'more_empathy'
+    )
+
+    hit = SemanticResponseCache(RedisResponseStore(redis_conn)).get('sad', vector("how do i make friends in a new city"))
+
+    assert hit.response == "Join a local club."
@@ -0,0 +1,88 @@
+import threading
+from utils.tts import SpeechSynthesizer, IncrementalSpeech
+
+
+class RecordingBackend:
+    def __init__(self, release=None):
+        self.calls = []
+        self.release = release
+
+    def __call__(self, text, lang):
+        if self.release is not None:
+            self.release.wait(5)
+        self.calls.append(text)
+        return f"{lang}:{text}|".encode('utf-8')
+
+
+def test_repeated_text_is_served_from_the_cache(tmp_path):
+    backend = RecordingBackend()
+    tts = SpeechSynthesizer(str(tmp_path), backend=backend)
+
+    assert tts.synthesize("Take a deep breath.") == b"en:Take a deep breath.|"
+    assert tts.synthesize("Take a deep breath.") == b"en:Take a deep breath.|"
+    assert tts.synthesize("Take a deep breath.", lang='fr') == b"fr:Take a deep breath.|"
+    assert backend.calls == ["Take a deep breath.", "Take a deep breath."]
+
+    # The cache is on disk, so a restarted worker reuses it
+    restarted = SpeechSynthesizer(str(tmp_path), backend=backend)
+    assert restarted.synthesize("Take a deep breath.") == b"en:Take a deep breath.|"
+    assert len(backend.calls) == 2
+
+
+def test_cache_evicts_least_recently_used_audio(tmp_path):
+    backend = RecordingBackend()
+    tts = SpeechSynthesizer(str(tmp_path), max_cache_bytes=30, backend=backend)
+    tts.synthesize("first line")
+    tts.synthesize("second line")
+    tts.synthesize("first line")
+
+    tts.synthesize("third line")
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        f"{SpeechSynthesizer.cache_key(text)}.mp3" for text in ("first line", "third line")
+    )
+    tts.synthesize("second line")
+    assert backend.calls == ["first line", "second line", "third line", "second line"]
+
+
+def test_concurrent_requests_share_one_synthesis(tmp_path):
+    release = threading.Event()
+    backend = RecordingBackend(release)
+    tts = SpeechSynthesizer(str(tmp_path), backend=backend)
+
+    futures = [tts.submit("You are not alone.") for _ in range(3)]
+    release.set()
+
+    assert len({id(future) for future in futures}) == 1
+    assert futures[0].result(5) == b"en:You are not alone.|"
+    assert backend.calls == ["You are not alone."]
+
+
+def test_incremental_speech_submits_complete_sentences(tmp_path):
+    backend = RecordingBackend()
+    speech = IncrementalSpeech(SpeechSynthesizer(str(tmp_path), backend=backend), min_chars=20)
+
+    for piece in ["That sounds ", "really hard. It makes ", "sense. ", "What helped ", "before?"]:
+        speech.feed(piece)
+    assert len(speech.futures) == 1
+    futures = speech.finish()
+
+    assert [future.result(5) for future in futures] == [
+        b"en:That sounds really hard.|", b"en:It makes sense. What helped before?|"
+    ]
+    assert speech.first_audio(5) == b"en:That sounds really hard.|"
+    assert speech.take_first_audio(wait=True, timeout=5) == b"en:That sounds really hard.|"
+    assert speech.take_first_audio(wait=True) is None
+    assert speech.remaining_audio(5) == b"en:It makes sense. What helped before?|"
+
+
+def test_whole_mode_synthesizes_one_chunk(tmp_path):
+    backend = RecordingBackend()
+    speech = IncrementalSpeech(SpeechSynthesizer(str(tmp_path), backend=backend), min_chars=None)
+
+    speech.feed("First sentence here. ")
+    speech.feed("Second one.")
+    assert speech.futures == []
+
+    assert [future.result(5) for future in speech.finish()] == [b"en:First sentence here. Second one.|"]
+    assert speech.remaining_audio(5) == b""
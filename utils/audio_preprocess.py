@@ -0,0 +1,253 @@
+"""
+Voice-input pre-processing before speech recognition.
+
+Recordings are trimmed to the span that contains speech, using a frame
+energy voice activity detector, mixed down to mono and resampled to the
+rate the recognizer wants, all on in-memory WAV bytes. Try it offline on
+WAV files with:
+
+    python -m utils.audio_preprocess recording.wav [more.wav ...]
+"""
+import io
+import math
+import time
+import wave
+import numpy as np
+from scipy.signal import resample_poly
+from utils import metrics
+
+TARGET_RATE = 16000
+FRAME_MS = 30
+# A frame is speech when it is this far above the noise floor and above an absolute floor
+SPEECH_MARGIN_DB = 12.0
+MIN_SPEECH_DBFS = -50.0
+NOISE_PERCENTILE = 10
+PADDING_MS = 200
+
+metrics.set_buckets('audio_trimmed_ratio', metrics.RATIO_BUCKETS)
+
+
+def read_wav(data):
+    """
+    Decode PCM WAV bytes.
+
+    Returns:
+        tuple: (float32 samples in [-1, 1] of shape (n,) or (n, channels), sample rate)
+
+    Raises:
+        ValueError: If the data is not 8/16/24/32-bit PCM WAV
+    """
+    try:
+        with wave.open(io.BytesIO(data), 'rb') as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise ValueError(f"Unsupported WAV data: {e}") from e
+
+    if width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32) / 2 ** 15
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = (np.where(values >= 2 ** 23, values - 2 ** 24, values) / 2 ** 23).astype(np.float32)
+    elif width == 4:
+        samples = (np.frombuffer(frames, dtype='<i4') / 2 ** 31).astype(np.float32)
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width} bytes")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels)
+    return samples, rate
+
+
+def write_wav(samples, rate):
+    """Encode mono float samples as 16-bit PCM WAV bytes."""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def frame_energy_db(samples, rate, frame_ms=FRAME_MS):
+    """RMS level of consecutive `frame_ms` frames, in dBFS."""
+    frame = max(int(rate * frame_ms / 1000), 1)
+    n_frames = len(samples) // frame
+    if not n_frames:
+        return np.zeros(0)
+    frames = samples[:n_frames * frame].reshape(n_frames, frame).astype(np.float64)
+    rms = np.sqrt((frames ** 2).mean(axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_bounds(samples, rate, frame_ms=FRAME_MS, margin_db=SPEECH_MARGIN_DB, min_dbfs=MIN_SPEECH_DBFS,
+                  padding_ms=PADDING_MS):
+    """
+    Sample range [start, end) that contains the detected speech.
+
+    The noise floor is estimated as a low percentile of the frame levels, so
+    the detector adapts to the microphone and room. The range runs from the
+    first to the last speech frame plus `padding_ms` on each side, so pauses
+    inside an utterance are kept and soft word onsets are not clipped.
+
+    A recording whose levels stay within `margin_db` of the floor has no
+    silence to measure against (speech from start to end), so it is kept
+    whole rather than dropped.
+
+    Returns:
+        tuple: (start, end), or None if every frame is below `min_dbfs`
+    """
+    energy = frame_energy_db(samples, rate, frame_ms)
+    if not len(energy) or energy.max() <= min_dbfs:
+        return None
+    floor = np.percentile(energy, NOISE_PERCENTILE)
+    if energy.max() - floor < margin_db:
+        return 0, len(samples)
+    threshold = max(floor + margin_db, min_dbfs)
+    voiced = np.flatnonzero(energy > threshold)
+    frame = max(int(rate * frame_ms / 1000), 1)
+    padding = int(rate * padding_ms / 1000)
+    start = max(int(voiced[0]) * frame - padding, 0)
+    end = min((int(voiced[-1]) + 1) * frame + padding, len(samples))
+    return start, end
+
+
+def resample(samples, rate, target_rate):
+    """Polyphase resampling of mono samples from `rate` to `target_rate`."""
+    if rate == target_rate or not len(samples):
+        return samples
+    divisor = math.gcd(rate, target_rate)
+    return resample_poly(samples, target_rate // divisor, rate // divisor).astype(np.float32)
+
+
+class ProcessedAudio:
+    """
+    Result of `preprocess_wav`.
+
+    `wav` holds the trimmed 16-bit mono recording at `sample_rate` and is
+    empty when no speech was found.
+    """
+
+    def __init__(self, wav, sample_rate, original_bytes, original_seconds, speech_seconds, seconds):
+        self.wav = wav
+        self.sample_rate = sample_rate
+        self.original_bytes = original_bytes
+        self.original_seconds = original_seconds
+        self.speech_seconds = speech_seconds
+        self.seconds = seconds
+
+    @property
+    def has_speech(self):
+        return bool(self.speech_seconds)
+
+    @property
+    def bytes_saved(self):
+        return self.original_bytes - len(self.wav)
+
+    @property
+    def pcm(self):
+        """Raw little-endian 16-bit frames, e.g. for `speech_recognition.AudioData(pcm, sample_rate, 2)`."""
+        with wave.open(io.BytesIO(self.wav), 'rb') as wav:
+            return wav.readframes(wav.getnframes())
+
+    def report(self):
+        return {
+            'original_bytes': self.original_bytes,
+            'bytes': len(self.wav),
+            'bytes_saved': self.bytes_saved,
+            'original_seconds': round(self.original_seconds, 3),
+            'speech_seconds': round(self.speech_seconds, 3),
+            'sample_rate': self.sample_rate,
+            'preprocess_ms': round(self.seconds * 1000, 2)
+        }
+
+
+def preprocess_wav(data, target_rate=TARGET_RATE, trim=True, **vad_options):
+    """
+    Trim silence from a WAV recording and resample it for the recognizer.
+
+    Args:
+        data: WAV file bytes
+        target_rate: Sample rate the recognizer expects
+        trim: Run voice activity detection; otherwise only convert
+        **vad_options: Passed to `speech_bounds`
+
+    Returns:
+        ProcessedAudio
+
+    Raises:
+        ValueError: If `data` is not PCM WAV
+    """
+    start = time.perf_counter()
+    samples, rate = read_wav(data)
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    original_seconds = len(samples) / rate if rate else 0.0
+
+    bounds = speech_bounds(samples, rate, **vad_options) if trim else (0, len(samples))
+    if bounds is None:
+        samples = samples[:0]
+    else:
+        samples = samples[bounds[0]:bounds[1]]
+    speech_seconds = len(samples) / rate if rate else 0.0
+    samples = resample(samples, rate, target_rate)
+
+    processed = ProcessedAudio(
+        write_wav(samples, target_rate) if len(samples) else b'',
+        target_rate,
+        len(data),
+        original_seconds,
+        speech_seconds,
+        time.perf_counter() - start
+    )
+    metrics.observe('audio_preprocess_seconds', processed.seconds)
+    metrics.increment('audio_bytes_saved_total', max(processed.bytes_saved, 0))
+    if original_seconds:
+        metrics.observe('audio_trimmed_ratio', 1 - speech_seconds / original_seconds)
+    return processed
+
+
+if __name__ == "__main__":
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Trim and resample WAV recordings as the voice input does.")
+    parser.add_argument("paths", nargs="+", help="WAV files")
+    parser.add_argument("--rate", type=int, default=TARGET_RATE, help="Target sample rate")
+    parser.add_argument("--out", help="Write the processed audio of a single input here")
+    parser.add_argument("--transcribe", action="store_true",
+                        help="Also transcribe the original and processed audio with Google (needs network)")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        processed = preprocess_wav(data, target_rate=args.rate)
+        report = {'path': path, **processed.report()}
+
+        if args.transcribe:
+            import speech_recognition as sr
+
+            recognizer = sr.Recognizer()
+            for name, audio in (('original', data), ('processed', processed.wav)):
+                if not audio:
+                    continue
+                with sr.AudioFile(io.BytesIO(audio)) as source:
+                    audio_data = recognizer.record(source)
+                started = time.perf_counter()
+                try:
+                    text = recognizer.recognize_google(audio_data)
+                except sr.UnknownValueError:
+                    text = None
+                report[f"{name}_transcript"] = text
+                report[f"{name}_transcribe_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        if args.out and len(args.paths) == 1:
+            with open(args.out, 'wb') as f:
+                f.write(processed.wav)
+        print(json.dumps(report))
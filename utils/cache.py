@@ -0,0 +1,117 @@
+import time
+import threading
+from collections import OrderedDict
+from utils import metrics
+
+
+class TTLCache:
+    """Thread-safe in-process LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, max_entries=512, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def items(self):
+        """Snapshot of the live (key, value) pairs, least recently used first."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (value, expires_at) in self._data.items() if expires_at >= now]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache:
+    """
+    String cache with an in-process `TTLCache` in front of an optional Redis tier.
+
+    Redis entries are shared across worker processes and expire with the
+    same TTL. `redis_conn` is a client or a callable returning one (None
+    while Redis is down), e.g. `RedisPoolManager.client`. Redis failures are
+    counted and otherwise ignored, so the cache degrades to process-local. Hits and misses are recorded in `utils.metrics`
+    under `cache_requests_total{cache=<name>, result=...}`.
+    """
+
+    def __init__(self, name, redis_conn=None, max_entries=512, ttl=3600):
+        self.name = name
+        self._redis = redis_conn if callable(redis_conn) else (lambda: redis_conn)
+        self.ttl = ttl
+        self.local = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    def _redis_key(self, key):
+        return f"cache:{self.name}:{key}"
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            metrics.increment('cache_requests_total', cache=self.name, result='local_hit')
+            return value
+
+        redis_conn = self._redis()
+        if redis_conn is not None:
+            try:
+                value = redis_conn.get(self._redis_key(key))
+            except Exception as e:
+                metrics.increment('cache_errors_total', cache=self.name)
+                print(f"Redis {self.name} cache read failed: {e}")
+            if value is not None:
+                self.local.set(key, value)
+                metrics.increment('cache_requests_total', cache=self.name, result='redis_hit')
+                return value
+
+        metrics.increment('cache_requests_total', cache=self.name, result='miss')
+        return None
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        redis_conn = self._redis()
+        if redis_conn is not None:
+            try:
+                redis_conn.set(self._redis_key(key), value, ex=self.ttl)
+            except Exception as e:
+                metrics.increment('cache_errors_total', cache=self.name)
+                print(f"Redis {self.name} cache write failed: {e}")
+
+    def stats(self):
+        """Hit/miss counts and overall hit rate for this cache."""
+        hits_local = metrics.counter('cache_requests_total', cache=self.name, result='local_hit')
+        hits_redis = metrics.counter('cache_requests_total', cache=self.name, result='redis_hit')
+        misses = metrics.counter('cache_requests_total', cache=self.name, result='miss')
+        total = hits_local + hits_redis + misses
+        return {
+            'local_hits': hits_local,
+            'redis_hits': hits_redis,
+            'misses': misses,
+            'hit_rate': (hits_local + hits_redis) / total if total else 0.0,
+            'size': len(self.local)
+        }
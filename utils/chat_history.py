@@ -0,0 +1,174 @@
+import json
+import zlib
+import base64
+from redis.exceptions import WatchError
+from utils.context_builder import fold_messages, SUMMARY_TOKENS
+
+MAX_MESSAGES = 20
+TTL_SECONDS = 7 * 24 * 60 * 60
+COMPRESS_OVER = 1024
+MAX_WATCH_RETRIES = 10
+
+_ROLE_CODES = {'user': 'u', 'assistant': 'a', 'system': 's'}
+_ROLES = {code: role for role, code in _ROLE_CODES.items()}
+
+
+def encode_message(role, content, compress_over=COMPRESS_OVER):
+    """
+    Compact string encoding of one message: a role code, a format flag and
+    the text. Messages longer than `compress_over` characters are stored
+    zlib-compressed and base64-encoded when that is actually shorter.
+    """
+    code = _ROLE_CODES.get(role, 's')
+    if compress_over is not None and len(content) > compress_over:
+        packed = base64.b64encode(zlib.compress(content.encode('utf-8'), 6)).decode('ascii')
+        if len(packed) < len(content):
+            return f"{code}z{packed}"
+    return f"{code}t{content}"
+
+
+def decode_message(value):
+    """Inverse of `encode_message`; also reads the older JSON entries."""
+    if value.startswith('{'):
+        return json.loads(value)
+    role = _ROLES.get(value[0], 'system')
+    if value[1] == 'z':
+        content = zlib.decompress(base64.b64decode(value[2:])).decode('utf-8')
+    else:
+        content = value[2:]
+    return {"role": role, "content": content}
+
+
+class HistorySnapshot:
+    """
+    The retained messages of a session plus its rolling summary.
+
+    `start` is the absolute position of `messages[0]` in the conversation and
+    `summarized` the number of leading messages already folded into
+    `summary`, so callers can tell which messages still need folding.
+    """
+
+    def __init__(self, start, messages, summary="", summarized=0):
+        self.start = start
+        self.messages = messages
+        self.summary = summary
+        self.summarized = summarized
+
+
+class ChatHistoryStore:
+    """
+    Per-session chat history kept in Redis as a capped, expiring list.
+
+    Each write appends its messages and refreshes the TTL in one MULTI/EXEC
+    round trip, so a session's footprint disappears `ttl` seconds after its
+    last message. A running message count and a rolling summary of older
+    turns are kept alongside under the same TTL. Once the list grows past
+    `max_messages`, the oldest messages are folded into the summary with
+    `summarize` (unless it already covers them) and trimmed in one more
+    transaction, so no message leaves the list before it is summarized.
+    """
+
+    def __init__(self, redis_conn, max_messages=MAX_MESSAGES, ttl=TTL_SECONDS,
+                 compress_over=COMPRESS_OVER, key_prefix='chat_history', summarize=fold_messages,
+                 summary_tokens=SUMMARY_TOKENS):
+        self.redis_conn = redis_conn
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.compress_over = compress_over
+        self.key_prefix = key_prefix
+        self.summarize = summarize
+        self.summary_tokens = summary_tokens
+
+    def key(self, session_id):
+        return f"{self.key_prefix}:{session_id}"
+
+    def _count_key(self, session_id):
+        return f"{self.key(session_id)}:count"
+
+    def _summary_key(self, session_id):
+        return f"{self.key(session_id)}:summary"
+
+    def append(self, session_id, *messages):
+        """Atomically append (role, content) pairs and refresh the TTL, then trim if over the cap."""
+        if not messages:
+            return
+        key = self.key(session_id)
+        pipe = self.redis_conn.pipeline(transaction=True)
+        pipe.rpush(key, *[encode_message(role, content, self.compress_over) for role, content in messages])
+        pipe.expire(key, self.ttl)
+        pipe.incrby(self._count_key(session_id), len(messages))
+        pipe.expire(self._count_key(session_id), self.ttl)
+        length = pipe.execute()[0]
+        if length > self.max_messages:
+            self.trim(session_id)
+
+    def trim(self, session_id):
+        """
+        Fold the messages beyond the last `max_messages` into the rolling
+        summary and drop them from the list, under WATCH so a concurrent
+        append or summary update makes it retry.
+        """
+        key, count_key, summary_key = self.key(session_id), self._count_key(session_id), self._summary_key(session_id)
+        with self.redis_conn.pipeline(transaction=True) as pipe:
+            for _ in range(MAX_WATCH_RETRIES):
+                try:
+                    pipe.watch(key, count_key, summary_key)
+                    # WATCH is per connection, so the reads can go in one round trip on another
+                    reads = self.redis_conn.pipeline(transaction=False)
+                    reads.lrange(key, 0, -1)
+                    reads.get(count_key)
+                    reads.hgetall(summary_key)
+                    values, count, summary = reads.execute()
+                    overflow = len(values) - self.max_messages
+                    if overflow <= 0:
+                        pipe.unwatch()
+                        return
+                    start = max(int(count or 0) - len(values), 0)
+                    unfolded = values[max(int(summary.get('upto', 0)) - start, 0):overflow]
+
+                    pipe.multi()
+                    if unfolded:
+                        text = self.summarize(summary.get('text', ""), [decode_message(value) for value in unfolded],
+                                              self.summary_tokens)
+                        pipe.hset(summary_key, mapping={'text': text, 'upto': start + overflow})
+                        pipe.expire(summary_key, self.ttl)
+                    pipe.ltrim(key, overflow, -1)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+        print(f"Chat history trim for {session_id} kept conflicting; retrying on the next append")
+
+    def append_turn(self, session_id, user_content, assistant_content):
+        """Store a user message and the assistant's reply together."""
+        self.append(session_id, ("user", user_content), ("assistant", assistant_content))
+
+    def recent(self, session_id, limit=None):
+        """The last `limit` messages (default: all retained), oldest first."""
+        limit = limit or self.max_messages
+        values = self.redis_conn.lrange(self.key(session_id), -limit, -1)
+        return [decode_message(value) for value in values]
+
+    def snapshot(self, session_id):
+        """Retained messages, their position and the rolling summary, read in one transaction."""
+        pipe = self.redis_conn.pipeline(transaction=True)
+        pipe.lrange(self.key(session_id), -self.max_messages, -1)
+        pipe.get(self._count_key(session_id))
+        pipe.hgetall(self._summary_key(session_id))
+        values, count, summary = pipe.execute()
+        messages = [decode_message(value) for value in values]
+        start = max(int(count) - len(messages), 0) if count else 0
+        return HistorySnapshot(
+            start,
+            messages,
+            summary=summary.get('text', ""),
+            summarized=int(summary.get('upto', 0))
+        )
+
+    def save_summary(self, session_id, summary, upto):
+        """Store the rolling summary covering the first `upto` messages of the session."""
+        key = self._summary_key(session_id)
+        pipe = self.redis_conn.pipeline(transaction=True)
+        pipe.hset(key, mapping={'text': summary, 'upto': upto})
+        pipe.expire(key, self.ttl)
+        pipe.execute()
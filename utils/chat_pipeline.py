@@ -0,0 +1,235 @@
+import time
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, Future
+from utils import metrics
+from utils.context_builder import estimate_tokens
+
+
+class TurnCancelled(Exception):
+    """Raised when a stage of a cancelled chat turn is reached."""
+
+
+class ChatTurn:
+    """
+    One in-flight reply. Stages submitted through a turn run on the shared
+    executor (or inline when the pipeline is sequential), are timed under
+    `chat_stage_seconds{stage=...}`, and are skipped once the turn is
+    cancelled. The turn also keeps its own stage timings, which `finish`
+    writes as one sampled `chat_turn` JSON log record, and the errors of
+    stages the reply went on without, for the caller to report.
+    """
+
+    def __init__(self, executor, concurrent=True):
+        self.executor = executor
+        self.concurrent = concurrent
+        self.started_at = time.perf_counter()
+        self._cancelled = threading.Event()
+        self._futures = []
+        self.timings = {}
+        self.errors = {}
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Abandon the turn: queued stages never start, running ones stop at their next check."""
+        self._cancelled.set()
+        for future in self._futures:
+            future.cancel()
+
+    def check(self):
+        if self.cancelled:
+            raise TurnCancelled()
+
+    def record(self, stage, seconds):
+        """Record a stage duration measured elsewhere."""
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+        metrics.observe('chat_stage_seconds', seconds, stage=stage)
+
+    @contextmanager
+    def span(self, stage):
+        """Time the enclosed block as a stage of this turn."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def _timed(self, stage, fn, *args):
+        self.check()
+        with self.span(stage):
+            return fn(*args)
+
+    def run(self, stage, fn, *args):
+        """Run a stage in the calling thread."""
+        return self._timed(stage, fn, *args)
+
+    def submit(self, stage, fn, *args):
+        """Start a stage in the background; runs it inline when the pipeline is sequential."""
+        if self.concurrent:
+            future = self.executor.submit(self._timed, stage, fn, *args)
+            self._futures.append(future)
+            return future
+
+        future = Future()
+        try:
+            future.set_result(self._timed(stage, fn, *args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def result(self, future, timeout=None):
+        """Wait for a submitted stage, raising TurnCancelled if the turn was cancelled meanwhile."""
+        value = future.result(timeout=timeout)
+        self.check()
+        return value
+
+    def finish(self, mode, **fields):
+        seconds = time.perf_counter() - self.started_at
+        metrics.observe('chat_turn_seconds', seconds, mode=mode)
+        metrics.log_event(
+            'chat_turn',
+            mode=mode,
+            seconds=round(seconds, 4),
+            stages={stage: round(value, 4) for stage, value in self.timings.items()},
+            **fields
+        )
+
+
+class ChatPipeline:
+    """
+    Prepares the context for a reply: conversation history, KB retrieval and
+    the expert-insight summary.
+
+    History lives in Redis and does not depend on retrieval, so it is fetched
+    on the executor while retrieval and summarization run in the caller's
+    thread. With `concurrent=False` every stage runs inline in the original
+    order, which is kept for comparison.
+
+    A failed history fetch does not fail the reply: it continues without
+    history and the error is left in `turn.errors['history']`, so the caller
+    can report it from its own thread (worker threads cannot touch the UI).
+    """
+
+    def __init__(self, executor, fetch_history, retrieve, summarize, concurrent=True):
+        self.executor = executor
+        self.fetch_history = fetch_history
+        self.retrieve = retrieve
+        self.summarize = summarize
+        self.concurrent = concurrent
+
+    @property
+    def mode(self):
+        return 'concurrent' if self.concurrent else 'sequential'
+
+    def start(self):
+        return ChatTurn(self.executor, concurrent=self.concurrent)
+
+    def prepare(self, turn, user_message):
+        """
+        Returns:
+            tuple: (history, kb_entries, knowledge_summary)
+        """
+        history_future = turn.submit('history', self.fetch_history)
+        kb_entries = turn.run('retrieval', self.retrieve, user_message)
+        knowledge_summary = turn.run('summary', self.summarize, kb_entries) if kb_entries else ""
+        try:
+            history = turn.result(history_future)
+        except Exception as e:
+            turn.check()
+            metrics.increment('chat_stage_errors_total', stage='history')
+            turn.errors['history'] = e
+            history = None
+        return history, kb_entries, knowledge_summary
+
+
+class ChatResponder:
+    """
+    The steps of one Therapist reply that do not touch the UI, shared by the
+    page and `utils.load_test` so both measure the same flow: response-cache
+    lookup and store, prompt assembly (pipeline, context window, rolling
+    summary, RL-optimized prompt) and the history write. The caller
+    generates or streams the model's reply and plays the audio.
+
+    `history` (a `ChatHistoryStore`), `response_cache` and `knowledge_base`
+    may be None, which skips history writes and response caching.
+    """
+
+    def __init__(self, pipeline, context_builder, rl_agent, session_id, history=None, response_cache=None,
+                 knowledge_base=None):
+        self.pipeline = pipeline
+        self.context_builder = context_builder
+        self.rl_agent = rl_agent
+        self.session_id = session_id
+        self.history = history
+        self.response_cache = response_cache
+        self.knowledge_base = knowledge_base
+
+    def cache_key(self, message, first_turn):
+        """
+        (RL state, message vector) for the response cache, or None if the reply
+        cannot be reused. Only replies given without conversation history are.
+        """
+        if not first_turn or self.response_cache is None or self.knowledge_base is None:
+            return None
+        vector = self.knowledge_base.transform([message], known_terms_only=False)
+        if vector.nnz == 0:
+            return None
+        return self.rl_agent.identify_state(message), vector
+
+    def cached_reply(self, cache_key):
+        """A cached reply for `cache_key`, or None."""
+        if cache_key is None:
+            return None
+        state, vector = cache_key
+        cached = self.response_cache.get(state, vector)
+        if cached is None:
+            return None
+        # Feedback on a reused reply updates the state/action that produced it
+        self.rl_agent.last_state = state
+        self.rl_agent.last_parameters = self.rl_agent.state_parameters[state].copy()
+        self.rl_agent.last_action = cached.action
+        return cached.response
+
+    def build_prompt(self, turn, message):
+        """
+        Returns:
+            tuple: (RL-optimized prompt, the `BuiltContext` it was built from)
+        """
+        history, kb_entries, knowledge_summary = self.pipeline.prepare(turn, message)
+        knowledge_context = "RELEVANT EXPERT INSIGHTS:\n" + knowledge_summary if kb_entries else ""
+        context = turn.run('context', self.context_builder.build, history, message, knowledge_context)
+        self._save_summary(context)
+
+        prompt, _ = self.rl_agent.generate_optimized_prompt(context.text, message)
+        # The system instruction is bound to the model; only the dynamic part is rebuilt per request
+        metrics.observe("llm_prompt_tokens", estimate_tokens(prompt), part="dynamic")
+        metrics.observe("llm_prompt_tokens", estimate_tokens(self.rl_agent.system_instruction), part="system")
+        return prompt, context
+
+    def _save_summary(self, context):
+        """Persists the rolling summary if this turn folded older messages into it."""
+        if self.history is None or not context.summary_changed:
+            return
+        try:
+            self.history.save_summary(self.session_id, context.summary, context.summarized)
+        except Exception as e:
+            print(f"Could not save conversation summary to Redis: {e}")
+
+    def remember(self, cache_key, response_text):
+        """Caches a freshly generated reply under `cache_key` with the action that produced it."""
+        if cache_key is not None:
+            self.response_cache.set(*cache_key, response_text, self.rl_agent.last_action)
+
+    def save_turn(self, turn, message, response_text):
+        """Saves a user message and its reply in one transaction, timed as the 'history_write' stage."""
+        if self.history is None:
+            return
+        with turn.span('history_write'):
+            self.history.append_turn(self.session_id, message, response_text)
+
+
+def make_executor(max_workers=8):
+    return ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chat-pipeline')
@@ -0,0 +1,173 @@
+import re
+from utils import metrics
+
+TOKEN_BUDGET = 1500
+SUMMARY_TOKENS = 200
+SUMMARY_LINE_TOKENS = 40
+CHARS_PER_TOKEN = 4
+_WORD = re.compile(r'\S+')
+
+metrics.set_buckets('context_messages_verbatim', metrics.COUNT_BUCKETS)
+
+
+def estimate_tokens(text):
+    """
+    Cheap local token count: about four characters per token, the usual
+    ratio for English with Gemini's tokenizer, but never fewer than one per
+    word so short-word text is not undercounted.
+    """
+    if not text:
+        return 0
+    return max(-(-len(text) // CHARS_PER_TOKEN), len(_WORD.findall(text)))
+
+
+def shorten(text, max_tokens):
+    """Cut `text` at a word boundary so it fits in about `max_tokens` tokens."""
+    text = " ".join(text.split())
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + "…"
+
+
+def fold_messages(summary, messages, max_tokens=SUMMARY_TOKENS, line_tokens=SUMMARY_LINE_TOKENS):
+    """
+    Fold messages into a rolling summary without a model call.
+
+    This truncates rather than summarizes: each message becomes one line
+    holding its first `line_tokens` tokens, appended to the previous
+    summary, and the oldest lines are dropped once the summary exceeds
+    `max_tokens`. It is the offline mode and the fallback of
+    `model_summarizer`.
+    """
+    lines = summary.splitlines() if summary else []
+    lines.extend(f"{message['role']}: {shorten(message['content'], line_tokens)}" for message in messages)
+    while lines and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def summary_prompt(summary, messages, max_tokens=SUMMARY_TOKENS):
+    words = max(max_tokens * 3 // 4, 20)
+    return (
+        f"Update the summary of a conversation between a user and a supportive therapist in at most {words} words. "
+        "Keep what the user shared about their situation, feelings and goals, the advice already given, and "
+        "anything they asked to follow up on. Write plain prose in the third person.\n\n"
+        f"CURRENT SUMMARY:\n{summary or '(none)'}\n\n"
+        f"NEW MESSAGES:\n{format_messages(messages)}"
+    )
+
+
+def model_summarizer(generate, fallback=fold_messages):
+    """
+    A `summarize` hook that has a language model rewrite the rolling summary.
+
+    `generate(prompt)` returns the model's text (e.g. `LLMClient.generate`).
+    The result is cut to `max_tokens`; when the call fails the messages are
+    folded with `fallback` instead, so no message is lost from the summary.
+    """
+    def summarize(summary, messages, max_tokens=SUMMARY_TOKENS):
+        try:
+            with metrics.span('context_summary_seconds'):
+                text = generate(summary_prompt(summary, messages, max_tokens))
+        except Exception as e:
+            metrics.increment('context_summary_errors_total')
+            print(f"Conversation summary failed, truncating instead: {e}")
+            return fallback(summary, messages, max_tokens)
+        return shorten(text, max_tokens)
+    return summarize
+
+
+def format_messages(messages):
+    return "\n".join(f"{message['role']}: {message['content']}" for message in messages)
+
+
+class BuiltContext:
+    """
+    A prompt body assembled within the token budget.
+
+    `summary` and `summarized` are the updated rolling summary and the number
+    of messages it covers; `summary_changed` tells the caller to persist them.
+    `tokens` breaks the estimated prompt size down by part.
+    """
+
+    def __init__(self, text, summary, summarized, summary_changed, tokens):
+        self.text = text
+        self.summary = summary
+        self.summarized = summarized
+        self.summary_changed = summary_changed
+        self.tokens = tokens
+
+
+class ContextBuilder:
+    """
+    Assembles the conversation context for a reply under a token budget.
+
+    The new message and the retrieved expert insights are always included.
+    Of the remaining budget, `summary_tokens` is reserved for the rolling
+    summary; the rest takes as many of the most recent messages verbatim as
+    fit. Older messages that have not been folded into the summary yet are
+    folded now, so each message is summarized exactly once.
+    """
+
+    def __init__(self, budget=TOKEN_BUDGET, summary_tokens=SUMMARY_TOKENS, summarize=fold_messages):
+        self.budget = budget
+        self.summary_tokens = summary_tokens
+        self.summarize = summarize
+
+    def recent_window(self, messages, budget):
+        """Index of the oldest message in the longest recent suffix that fits in `budget`."""
+        used = 0
+        for idx in range(len(messages) - 1, -1, -1):
+            used += estimate_tokens(messages[idx]['content']) + 2
+            if used > budget:
+                return idx + 1
+        return 0
+
+    def build(self, snapshot, user_message, knowledge_context=""):
+        """
+        Args:
+            snapshot: HistorySnapshot of the session (or None without history)
+            user_message: The new user message
+            knowledge_context: Expert-insight block for the prompt, may be empty
+
+        Returns:
+            BuiltContext
+        """
+        messages = snapshot.messages if snapshot else []
+        start = snapshot.start if snapshot else 0
+        summary = snapshot.summary if snapshot else ""
+        summarized = snapshot.summarized if snapshot else 0
+
+        fixed = estimate_tokens(user_message) + estimate_tokens(knowledge_context)
+        window = self.recent_window(messages, max(self.budget - fixed - self.summary_tokens, 0))
+        recent = messages[window:]
+
+        # Messages that fell out of the verbatim window and are not summarized yet
+        unfolded = messages[max(summarized - start, 0):window]
+        summary_changed = bool(unfolded)
+        if unfolded:
+            summary = self.summarize(summary, unfolded, self.summary_tokens)
+            summarized = start + window
+
+        parts = []
+        if summary:
+            parts.append(f"Summary of the earlier conversation:\n{summary}")
+        if recent:
+            parts.append(format_messages(recent))
+        if knowledge_context:
+            parts.append(knowledge_context)
+        parts.append(f"user: {user_message}")
+        text = "\n\n".join(parts) + "\n\n"
+
+        tokens = {
+            'summary': estimate_tokens(summary),
+            'recent': estimate_tokens(format_messages(recent)),
+            'knowledge': estimate_tokens(knowledge_context),
+            'message': estimate_tokens(user_message)
+        }
+        tokens['total'] = estimate_tokens(text)
+        for part, count in tokens.items():
+            metrics.observe('context_tokens', count, part=part)
+        metrics.observe('context_messages_verbatim', len(recent))
+        return BuiltContext(text, summary, summarized, summary_changed, tokens)
@@ -0,0 +1,210 @@
+import time
+import threading
+
+
+class FakeRedis:
+    """
+    In-process stand-in for a `decode_responses=True` Redis client, for
+    load tests and local runs without a server.
+
+    Implements only the commands the app uses. Every command (and every
+    pipeline `execute`) runs under one lock, so MULTI/EXEC pipelines are
+    atomic; WATCH is accepted and never aborts. `latency` adds a simulated
+    network round trip to each command or pipeline execution.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.RLock()
+        self.commands = 0
+
+    # -- plumbing -------------------------------------------------------
+
+    def _round_trip(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _call(self, name, *args, **kwargs):
+        self._round_trip()
+        with self._lock:
+            self.commands += 1
+            return getattr(self, f"_{name}")(*args, **kwargs)
+
+    def _live(self, key):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key)
+
+    def _container(self, key, factory):
+        value = self._live(key)
+        if value is None:
+            value = self._data[key] = factory()
+        return value
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not hasattr(type(self), f"_{name}"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._call(name, *args, **kwargs)
+
+    # -- commands -------------------------------------------------------
+
+    def _ping(self):
+        return True
+
+    def _get(self, key):
+        return self._live(key)
+
+    def _set(self, key, value, ex=None):
+        self._data[key] = str(value)
+        self._expires.pop(key, None)
+        if ex is not None:
+            self._expire(key, ex)
+        return True
+
+    def _delete(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._live(key) is not None:
+                removed += 1
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return removed
+
+    def _exists(self, *keys):
+        return sum(self._live(key) is not None for key in keys)
+
+    def _expire(self, key, seconds):
+        if self._live(key) is None:
+            return False
+        self._expires[key] = time.monotonic() + seconds
+        return True
+
+    def _incrby(self, key, amount=1):
+        value = int(self._live(key) or 0) + amount
+        self._data[key] = str(value)
+        return value
+
+    def _rpush(self, key, *values):
+        items = self._container(key, list)
+        items.extend(str(value) for value in values)
+        return len(items)
+
+    def _lrange(self, key, start, end):
+        items = self._live(key) or []
+        n = len(items)
+        start = max(start + n if start < 0 else start, 0)
+        end = end + n if end < 0 else min(end, n - 1)
+        return list(items[start:end + 1])
+
+    def _ltrim(self, key, start, end):
+        items = self._live(key)
+        if items is not None:
+            self._data[key] = self._lrange(key, start, end)
+        return True
+
+    def _llen(self, key):
+        return len(self._live(key) or [])
+
+    def _hset(self, key, field=None, value=None, mapping=None):
+        fields = self._container(key, dict)
+        updates = dict(mapping or {})
+        if field is not None:
+            updates[field] = value
+        added = sum(name not in fields for name in updates)
+        fields.update((name, str(v)) for name, v in updates.items())
+        return added
+
+    def _hget(self, key, field):
+        return (self._live(key) or {}).get(field)
+
+    def _hgetall(self, key):
+        return dict(self._live(key) or {})
+
+    def _hdel(self, key, *fields):
+        existing = self._live(key) or {}
+        return sum(existing.pop(field, None) is not None for field in fields)
+
+    def _hincrbyfloat(self, key, field, amount):
+        fields = self._container(key, dict)
+        value = float(fields.get(field, 0)) + amount
+        fields[field] = repr(value)
+        return value
+
+    def _zadd(self, key, mapping):
+        scores = self._container(key, dict)
+        added = sum(member not in scores for member in mapping)
+        scores.update((member, float(score)) for member, score in mapping.items())
+        return added
+
+    def _zcard(self, key):
+        return len(self._live(key) or {})
+
+    def _zrem(self, key, *members):
+        scores = self._live(key) or {}
+        return sum(scores.pop(member, None) is not None for member in members)
+
+    def _zpopmin(self, key, count=1):
+        scores = self._live(key) or {}
+        popped = sorted(scores.items(), key=lambda item: (item[1], item[0]))[:count]
+        for member, _ in popped:
+            del scores[member]
+        return popped
+
+
+class FakePipeline:
+    """
+    Queues commands and runs them atomically on `execute`. As with redis-py,
+    commands issued between `watch` and `multi` run immediately.
+    """
+
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+        self._watching = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
+
+    def watch(self, *keys):
+        self._watching = True
+        return True
+
+    def unwatch(self):
+        self._watching = False
+        return True
+
+    def multi(self):
+        self._watching = False
+
+    def reset(self):
+        self._commands = []
+        self._watching = False
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not hasattr(FakeRedis, f"_{name}"):
+            raise AttributeError(name)
+
+        def queue(*args, **kwargs):
+            if self._watching:
+                return self._redis._call(name, *args, **kwargs)
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        self._redis._round_trip()
+        with self._redis._lock:
+            results = [getattr(self._redis, f"_{name}")(*args, **kwargs) for name, args, kwargs in self._commands]
+            self._redis.commands += len(results)
+        self.reset()
+        return results
@@ -0,0 +1,82 @@
+import io
+import os
+import csv
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Exclusive inter-process lock held on a sidecar `.lock` file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+
+def lock_for(path):
+    """The lock guarding appends to `path`."""
+    return FileLock(f"{path}.lock")
+
+
+def encode_csv_row(row):
+    """Serialize one CSV row to UTF-8 bytes, quoting as csv.writer does."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(row)
+    return buffer.getvalue().encode('utf-8')
+
+
+def append_atomic(path, data):
+    """
+    Append `data` with a single O_APPEND write and fsync.
+
+    Callers should hold `lock_for(path)`. If the file does not end with a
+    newline, one is written first so the new row never merges into the last.
+
+    Returns:
+        int: Number of bytes written
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        size = os.fstat(fd).st_size
+        if size:
+            with open(path, 'rb') as f:
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    data = b'\n' + data
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        os.fsync(fd)
+        return len(data)
+    finally:
+        os.close(fd)
+
+
+def append_csv_row(path, row):
+    """Append one row to a CSV file under its inter-process lock."""
+    with lock_for(path):
+        return append_atomic(path, encode_csv_row(row))
@@ -1,16 +1,18 @@
 import streamlit as st
-import google.generativeai as genai
+from utils.llm_client import shared_client
 
-def configure_genai():
-    """Configure the Google GenerativeAI with API key from secrets"""
-    if not hasattr(st.session_state, 'genai_configured'):
-        try:
-            genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
-            st.session_state.genai_configured = True
-        except Exception as e:
-            st.error(f"Error configuring GenerativeAI: {e}")
-            return False
-    return True
+def get_llm_client():
+    """Shared LLM client configured from secrets, or None if configuration fails"""
+    try:
+        return shared_client(
+            st.secrets.get("LLM_BACKEND", "gemini"),
+            api_key=st.secrets["GOOGLE_API_KEY"],
+            timeout=float(st.secrets.get("LLM_TIMEOUT", 30)),
+            max_retries=int(st.secrets.get("LLM_MAX_RETRIES", 2))
+        )
+    except Exception as e:
+        st.error(f"Error configuring GenerativeAI: {e}")
+        return None
 
 def generate_sleep_insights(sleep_data):
     """
@@ -22,12 +24,11 @@ def generate_sleep_insights(sleep_data):
     Returns:
         str: Text insights about sleep patterns
     """
-    if not configure_genai():
+    client = get_llm_client()
+    if client is None:
         return "Unable to generate insights due to API configuration issues."
     
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
         # Create a prompt with the sleep data
         prompt = f"""
         Based on the following sleep data, provide helpful insights and recommendations:
@@ -38,8 +39,7 @@ def generate_sleep_insights(sleep_data):
         Keep the response under 200 words and easy to understand.
         """
         
-        response = model.generate_content(prompt)
-        return response.text
+        return client.generate(prompt)
     except Exception as e:
         st.error(f"Error generating sleep insights: {e}")
         return "Could not generate insights at this time. Please try again later."
@@ -54,12 +54,11 @@ def generate_mood_insights(mood_data):
     Returns:
         str: Text insights about mood patterns
     """
-    if not configure_genai():
+    client = get_llm_client()
+    if client is None:
         return "Unable to generate insights due to API configuration issues."
     
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
         # Create a prompt with the mood data
         prompt = f"""
         Based on the following mood tracking data, provide helpful insights and recommendations:
@@ -70,8 +69,7 @@ def generate_mood_insights(mood_data):
         practical steps. Keep the response under 200 words and easy to understand.
         """
         
-        response = model.generate_content(prompt)
-        return response.text
+        return client.generate(prompt)
     except Exception as e:
         st.error(f"Error generating mood insights: {e}")
         return "Could not generate insights at this time. Please try again later."
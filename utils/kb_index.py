@@ -0,0 +1,825 @@
+import io
+import os
+import csv
+import json
+import time
+import shutil
+import hashlib
+import threading
+from contextlib import nullcontext
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from utils.kb_dedup import MinHashIndex
+from utils.file_lock import lock_for, encode_csv_row, append_atomic
+
+N_FEATURES = 2 ** 20
+REWEIGHT_EVERY = 256
+QUERY_CHUNK = 64
+ARTIFACT_VERSION = 2
+DUPLICATE_THRESHOLD = 0.8
+# Up to this many rows the duplicate check scores every question exactly
+EXACT_DUPLICATE_ROWS = 50_000
+# Bytes hashed to tell whether the indexed CSV was rewritten rather than appended to
+CSV_PREFIX_BYTES = 1 << 16
+
+
+def file_digest(path, size=None, chunk_size=1 << 20):
+    """SHA-256 of a file's contents (or of its first `size` bytes), read in chunks."""
+    with open(path, 'rb') as f:
+        return _stream_digest(f, os.fstat(f.fileno()).st_size if size is None else size, chunk_size)
+
+
+def _stream_digest(f, size, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    f.seek(0)
+    remaining = size
+    while remaining > 0:
+        chunk = f.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def csv_fingerprint(path, size):
+    """
+    Identity of the CSV an index was built from: its inode and the SHA-256
+    of its first `CSV_PREFIX_BYTES` (at most `size`) bytes, with the number
+    of bytes hashed. Appends keep all three; replacing the file (as
+    `utils.kb_ingest` does) changes the inode.
+    """
+    with open(path, 'rb') as f:
+        return _fingerprint(os.fstat(f.fileno()).st_ino, f.read(min(size, CSV_PREFIX_BYTES)))
+
+
+def _fingerprint(inode, head):
+    return {'csv_inode': inode, 'csv_prefix_sha256': hashlib.sha256(head).hexdigest(), 'csv_prefix_bytes': len(head)}
+
+
+class TextColumn:
+    """
+    Append-only sequence of strings stored as one UTF-8 blob plus offsets.
+
+    The blob and offsets can be memory-mapped from disk; strings are only
+    decoded when they are looked up.
+    """
+
+    def __init__(self, blob=None, offsets=None):
+        self._blob = np.zeros(0, dtype=np.uint8) if blob is None else blob
+        self._offsets = np.zeros(1, dtype=np.int64) if offsets is None else offsets
+        self._appended = []
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    @classmethod
+    def load(cls, prefix, mmap_mode='r'):
+        return cls(
+            np.load(f"{prefix}_blob.npy", mmap_mode=mmap_mode),
+            np.load(f"{prefix}_offsets.npy", mmap_mode=mmap_mode)
+        )
+
+    def save(self, prefix):
+        column = TextColumn.from_strings(list(self)) if self._appended else self
+        np.save(f"{prefix}_blob.npy", column._blob)
+        np.save(f"{prefix}_offsets.npy", column._offsets)
+
+    def __len__(self):
+        return len(self._offsets) - 1 + len(self._appended)
+
+    def __getitem__(self, idx):
+        idx = int(idx)
+        n_stored = len(self._offsets) - 1
+        if idx >= n_stored:
+            return self._appended[idx - n_stored]
+        start, end = self._offsets[idx], self._offsets[idx + 1]
+        return bytes(self._blob[start:end]).decode('utf-8')
+
+    def __iter__(self):
+        return (self[idx] for idx in range(len(self)))
+
+    def append(self, value):
+        self._appended.append(value)
+
+
+class KnowledgeBaseIndex:
+    """
+    TF-IDF index over knowledge base questions that can grow one row at a time.
+
+    Questions are hashed into a fixed feature space, so adding a row never
+    refits a vocabulary. New rows are weighted with the current IDF and kept
+    in a small pending block; once enough rows have piled up, IDF weights are
+    recomputed over the whole matrix on a background thread and swapped in.
+    """
+
+    def __init__(self, questions=(), answers=(), n_features=N_FEATURES, reweight_every=REWEIGHT_EVERY):
+        self.vectorizer = HashingVectorizer(
+            stop_words='english',
+            n_features=n_features,
+            alternate_sign=False,
+            norm=None
+        )
+        self.n_features = n_features
+        self.reweight_every = reweight_every
+        self.questions = TextColumn()
+        self.answers = TextColumn()
+        self.artifact_dir = None
+        self.load_seconds = None
+        self.csv_offset = None
+        self.csv_fingerprint = None
+        self._minhash = None
+        self._lock = threading.RLock()
+        self._reweighting = False
+
+        self._doc_freq = np.zeros(n_features, dtype=np.int64)
+        self._counts = sp.csr_matrix((0, n_features), dtype=np.float64)
+        self._pending_counts = []
+        self._pending_vectors = []
+        self.idf = self._compute_idf(self._doc_freq, 0)
+        self.question_vectors = sp.csr_matrix((0, n_features), dtype=np.float64)
+
+        if len(questions):
+            self._bulk_load(list(questions), list(answers))
+
+    @classmethod
+    def from_frame(cls, df, **kwargs):
+        """Build an index from a dataframe with question and answer columns."""
+        return cls(
+            df['question'].fillna('').astype(str).tolist(),
+            df['answer'].fillna('').astype(str).tolist(),
+            **kwargs
+        )
+
+    @classmethod
+    def load_or_build(cls, csv_path, cache_dir, locked=False, **kwargs):
+        """
+        Load the index artifact for `csv_path`, building it on a cache miss.
+
+        Artifacts live in `cache_dir/<sha256 of the indexed CSV prefix>`. The
+        CSV only grows by appends between rebuilds, so the artifact whose
+        indexed prefix the current file still starts with is loaded and the
+        rows appended after it are tailed in; once that tail reaches
+        `reweight_every` rows a fresh artifact is saved for the whole file.
+        Any other change to the CSV produces a fresh build; stale artifacts
+        are removed. Pass `locked=True` when the caller already holds
+        `lock_for(csv_path)`.
+
+        Raises:
+            ValueError: If the CSV lacks question/answer columns
+        """
+        start = time.perf_counter()
+        # Pin the byte range we index; rows appended later are picked up by sync_from_csv.
+        # Everything is read through this handle, which keeps the old contents if the file is replaced.
+        with nullcontext() if locked else lock_for(csv_path):
+            f = open(csv_path, 'rb')
+            inode, csv_bytes = os.fstat(f.fileno()).st_ino, os.fstat(f.fileno()).st_size
+            head = f.read(min(csv_bytes, CSV_PREFIX_BYTES))
+
+        with f:
+            artifact_dir = cls._find_artifact(cache_dir, f, csv_bytes, head)
+            if artifact_dir is not None:
+                index = cls.load(artifact_dir, **kwargs)
+                f.seek(index.csv_offset)
+                tailed = index._index_csv_rows(f.read(csv_bytes - index.csv_offset))
+                if tailed >= index.reweight_every:
+                    index.csv_fingerprint = _fingerprint(inode, head)
+                    index._save_for(cache_dir, _stream_digest(f, csv_bytes))
+            else:
+                f.seek(0)
+                df = pd.read_csv(io.BytesIO(f.read(csv_bytes)))
+                if 'question' not in df.columns or 'answer' not in df.columns:
+                    raise ValueError("CSV file doesn't have the expected columns (question, answer).")
+                index = cls.from_frame(df, **kwargs)
+                index.csv_offset = csv_bytes
+                index.csv_fingerprint = _fingerprint(inode, head)
+                index._save_for(cache_dir, _stream_digest(f, csv_bytes))
+
+        # The artifact may come from a copy of the same content with another inode
+        index.csv_fingerprint = _fingerprint(inode, head[:index.csv_offset])
+        index.load_seconds = time.perf_counter() - start
+        return index
+
+    @staticmethod
+    def _find_artifact(cache_dir, f, csv_bytes, head):
+        """
+        The artifact in `cache_dir` with the longest indexed prefix that `f`
+        (of `csv_bytes` bytes, starting with `head`) still begins with, or None.
+        """
+        if not os.path.isdir(cache_dir):
+            return None
+        candidates = []
+        for name in os.listdir(cache_dir):
+            try:
+                with open(os.path.join(cache_dir, name, 'meta.json')) as meta_file:
+                    meta = json.load(meta_file)
+            except (OSError, ValueError):
+                continue
+            indexed = meta.get('csv_bytes')
+            if (
+                meta.get('version') == ARTIFACT_VERSION
+                and indexed is not None
+                and indexed <= csv_bytes
+                and hashlib.sha256(head[:meta.get('csv_prefix_bytes', indexed)]).hexdigest() == meta.get('csv_prefix_sha256')
+            ):
+                candidates.append((indexed, name))
+        # The cheap head check can collide for long prefixes; the name is the hash of the whole prefix
+        for indexed, name in sorted(candidates, reverse=True):
+            if _stream_digest(f, indexed) == name:
+                return os.path.join(cache_dir, name)
+        return None
+
+    def _save_for(self, cache_dir, digest):
+        """Save as `cache_dir/<digest>` and remove every other artifact there."""
+        artifact_dir = os.path.join(cache_dir, digest)
+        self.save(artifact_dir)
+        for name in os.listdir(cache_dir):
+            stale = os.path.join(cache_dir, name)
+            if stale != artifact_dir and '.tmp-' not in name and os.path.isdir(stale):
+                shutil.rmtree(stale, ignore_errors=True)
+
+    def save(self, artifact_dir):
+        """Write the fitted index to `artifact_dir` atomically."""
+        if self._pending_counts:
+            self.reweight()
+        tmp_dir = f"{artifact_dir}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        with self._lock:
+            np.save(os.path.join(tmp_dir, 'doc_freq.npy'), self._doc_freq)
+            np.save(os.path.join(tmp_dir, 'idf.npy'), self.idf)
+            # Counts and weighted vectors share one sparsity structure
+            np.save(os.path.join(tmp_dir, 'indices.npy'), self._counts.indices)
+            np.save(os.path.join(tmp_dir, 'indptr.npy'), self._counts.indptr)
+            np.save(os.path.join(tmp_dir, 'counts.npy'), self._counts.data)
+            np.save(os.path.join(tmp_dir, 'vectors.npy'), self.question_vectors.data)
+            self.questions.save(os.path.join(tmp_dir, 'questions'))
+            self.answers.save(os.path.join(tmp_dir, 'answers'))
+            np.save(os.path.join(tmp_dir, 'minhash.npy'), self._dedup_index().all_signatures())
+            meta = {
+                'version': ARTIFACT_VERSION,
+                'n_features': self.n_features,
+                'n_rows': len(self),
+                'csv_bytes': self.csv_offset,
+                **(self.csv_fingerprint or {})
+            }
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        if os.path.exists(artifact_dir):
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, artifact_dir)
+        self.artifact_dir = artifact_dir
+
+    @classmethod
+    def load(cls, artifact_dir, mmap_mode='r', **kwargs):
+        """Open an artifact written by `save`, memory-mapping the large arrays."""
+        with open(os.path.join(artifact_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('version') != ARTIFACT_VERSION:
+            raise ValueError(f"Unsupported knowledge base artifact version: {meta.get('version')}")
+
+        index = cls(n_features=meta['n_features'], **kwargs)
+
+        def array(name):
+            return np.load(os.path.join(artifact_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        shape = (meta['n_rows'], meta['n_features'])
+        indices, indptr = array('indices'), array('indptr')
+        index._counts = sp.csr_matrix((array('counts'), indices, indptr), shape=shape, copy=False)
+        index.question_vectors = sp.csr_matrix((array('vectors'), indices, indptr), shape=shape, copy=False)
+        # doc_freq is updated in place by add(), so keep it in memory
+        index._doc_freq = np.load(os.path.join(artifact_dir, 'doc_freq.npy'))
+        index.idf = np.array(array('idf'))
+        index.questions = TextColumn.load(os.path.join(artifact_dir, 'questions'), mmap_mode)
+        index.answers = TextColumn.load(os.path.join(artifact_dir, 'answers'), mmap_mode)
+        index.artifact_dir = artifact_dir
+        index.csv_offset = meta.get('csv_bytes')
+        if 'csv_inode' in meta:
+            index.csv_fingerprint = {
+                'csv_inode': meta['csv_inode'],
+                'csv_prefix_sha256': meta['csv_prefix_sha256'],
+                'csv_prefix_bytes': meta.get('csv_prefix_bytes', min(meta['csv_bytes'], CSV_PREFIX_BYTES))
+            }
+        return index
+
+    def __len__(self):
+        return len(self.questions)
+
+    @staticmethod
+    def _compute_idf(doc_freq, n_docs):
+        # Same smoothing as TfidfVectorizer(smooth_idf=True)
+        return np.log((1.0 + n_docs) / (1.0 + doc_freq)) + 1.0
+
+    def _term_counts(self, texts):
+        counts = self.vectorizer.transform(texts).tocsr()
+        counts.sum_duplicates()
+        return counts
+
+    def _weight(self, counts, idf):
+        weighted = counts.copy()
+        weighted.data *= idf[weighted.indices]
+        return normalize(weighted, norm='l2', copy=False)
+
+    def _bulk_load(self, questions, answers):
+        counts = self._term_counts(questions)
+        self._doc_freq += np.bincount(counts.indices, minlength=self.n_features)
+        self._counts = counts
+        self.questions = TextColumn.from_strings(questions)
+        self.answers = TextColumn.from_strings(answers)
+        self.idf = self._compute_idf(self._doc_freq, len(questions))
+        self.question_vectors = self._weight(counts, self.idf)
+
+    def _weight_query(self, counts):
+        # Terms no indexed question contains get no weight, as TfidfVectorizer
+        # drops out-of-vocabulary terms; otherwise they would dilute the cosine
+        weighted = counts.copy()
+        weighted.data *= self.idf[weighted.indices] * (self._doc_freq[weighted.indices] > 0)
+        weighted.eliminate_zeros()
+        return normalize(weighted, norm='l2', copy=False)
+
+    def transform(self, texts, known_terms_only=True):
+        """
+        Vectorize texts with the current IDF weights (L2-normalized rows).
+
+        By default terms that occur in no indexed question are dropped, as
+        for retrieval; pass `known_terms_only=False` to keep them, e.g. to
+        compare two messages with each other.
+        """
+        counts = self._term_counts(texts)
+        return self._weight_query(counts) if known_terms_only else self._weight(counts, self.idf)
+
+    def add(self, question, answer):
+        """
+        Append a question/answer pair without refitting the index.
+
+        Cost depends only on the length of the question, not on the size of
+        the knowledge base. Triggers a background re-weighting once the
+        pending block reaches `reweight_every` rows.
+        """
+        counts = self._term_counts([question])
+        with self._lock:
+            if self._minhash is not None:
+                self._minhash.add(self._minhash.signatures_for(counts)[0])
+            self._doc_freq[counts.indices] += 1
+            self._pending_counts.append(counts)
+            self._pending_vectors.append(self._weight(counts, self.idf))
+            self.questions.append(question)
+            self.answers.append(answer)
+            should_reweight = (
+                len(self._pending_counts) >= self.reweight_every
+                and not self._reweighting
+            )
+            if should_reweight:
+                self._reweighting = True
+
+        if should_reweight:
+            threading.Thread(target=self._reweight_in_background, daemon=True).start()
+
+    def _dedup_index(self):
+        """The MinHash index over every row, built (or loaded from the artifact) on first use."""
+        with self._lock:
+            if self._minhash is not None:
+                return self._minhash
+            minhash = MinHashIndex()
+            signatures = np.zeros((0, minhash.n_perm), dtype=np.uint32)
+            path = self.artifact_dir and os.path.join(self.artifact_dir, 'minhash.npy')
+            if path and os.path.exists(path):
+                signatures = np.load(path, mmap_mode='r')[:len(self)]
+
+            # Rows not covered by the stored signatures: main-matrix tail, then pending
+            n_signed, n_main = len(signatures), self._counts.shape[0]
+            tail = [self._counts[n_signed:]] if n_signed < n_main else []
+            tail += self._pending_counts[max(0, n_signed - n_main):]
+            if tail:
+                signatures = np.vstack([signatures, minhash.signatures_for(sp.vstack(tail, format='csr'))])
+
+            self._minhash = minhash.build(signatures)
+            return self._minhash
+
+    def find_duplicate(self, question, threshold=DUPLICATE_THRESHOLD):
+        """
+        Look up a near-duplicate of `question`, including rows added since the last re-weighting.
+
+        Up to `EXACT_DUPLICATE_ROWS` rows, every question is scored with
+        exact TF-IDF cosine similarity. Larger indexes first narrow the search
+        with MinHash LSH and score only those candidates exactly, so a match
+        found is always a true one, but one can be missed: a row is a
+        candidate with the probability `MinHashIndex.candidate_probability`
+        gives for the Jaccard similarity of the two questions' term sets
+        (about 0.9998 at 0.8, 0.89 at 0.6, 0.64 at 0.5). Cosine above 0.8
+        usually comes with Jaccard above 0.6, but rare, heavily weighted
+        shared terms can lift the cosine of a pair with lower Jaccard.
+
+        Returns:
+            tuple: (row id, similarity) of the best match above `threshold`, or None
+        """
+        if not len(self):
+            return None
+        counts = self._term_counts([question])
+        query_vector = self._weight_query(counts)
+        if len(self) <= EXACT_DUPLICATE_ROWS:
+            similarities = self.similarities(query_vector).toarray().ravel()
+            candidates = np.arange(len(similarities))
+        else:
+            minhash = self._dedup_index()
+            candidates = minhash.candidates(minhash.signatures_for(counts)[0])
+            if not len(candidates):
+                return None
+            similarities = _sparse_dot(query_vector, self.rows(candidates)).ravel()
+        best = similarities.argmax()
+        if similarities[best] <= threshold:
+            return None
+        return int(candidates[best]), float(similarities[best])
+
+    def _csv_replaced(self, csv_path):
+        size = os.path.getsize(csv_path)
+        if size < self.csv_offset:
+            return True
+        return (
+            self.csv_fingerprint is not None
+            # The same prefix as when the fingerprint was taken; appends since then leave it unchanged
+            and csv_fingerprint(csv_path, self.csv_fingerprint['csv_prefix_bytes']) != self.csv_fingerprint
+        )
+
+    def _reload(self, csv_path):
+        """Swap in the published artifact for the current `csv_path` (building it if needed)."""
+        fresh = type(self).load_or_build(
+            csv_path, os.path.dirname(self.artifact_dir), locked=True,
+            reweight_every=self.reweight_every
+        )
+        with self._lock:
+            for name in ('questions', 'answers', 'artifact_dir', 'load_seconds', 'csv_offset', 'csv_fingerprint',
+                         '_minhash', '_doc_freq', '_counts', '_pending_counts', '_pending_vectors', 'idf',
+                         'question_vectors'):
+                setattr(self, name, getattr(fresh, name))
+
+    def sync_from_csv(self, csv_path):
+        """
+        Index rows other processes appended to `csv_path` since we last read it.
+        Call while holding `lock_for(csv_path)`.
+
+        If the file was replaced or rewritten since (e.g. by `utils.kb_ingest`),
+        byte offsets no longer line up, so the index is first reloaded from
+        the artifact published for the new file.
+
+        Returns:
+            int: Change in the number of indexed rows
+        """
+        if self.csv_offset is None:
+            return 0
+        before = len(self)
+        if self._csv_replaced(csv_path):
+            self._reload(csv_path)
+            print(f"Knowledge base {csv_path} was replaced; reloaded index with {len(self)} rows")
+        with open(csv_path, 'rb') as f:
+            f.seek(self.csv_offset)
+            self._index_csv_rows(f.read())
+        return len(self) - before
+
+    def _index_csv_rows(self, data):
+        """Add the rows in `data`, the CSV bytes that follow `csv_offset`; returns how many."""
+        added = 0
+        for row in csv.reader(io.StringIO(data.decode('utf-8'), newline='')):
+            if len(row) >= 2:
+                self.add(row[0], row[1])
+                added += 1
+        self.csv_offset += len(data)
+        return added
+
+    def append_unique(self, csv_path, question, answer, threshold=DUPLICATE_THRESHOLD):
+        """
+        Append a Q/A pair to `csv_path` and the index unless a near-duplicate exists.
+
+        The duplicate check and the append run under an inter-process lock,
+        after catching up on rows appended by other workers.
+
+        Returns:
+            tuple: The (row id, similarity) duplicate that blocked the append, or None if appended
+        """
+        with lock_for(csv_path):
+            self.sync_from_csv(csv_path)
+            duplicate = self.find_duplicate(question, threshold)
+            if duplicate is not None:
+                return duplicate
+            written = append_atomic(csv_path, encode_csv_row([question, answer]))
+            if self.csv_offset is not None:
+                self.csv_offset += written
+            self.add(question, answer)
+        return None
+
+    def _reweight_in_background(self):
+        try:
+            self.reweight()
+        finally:
+            self._reweighting = False
+
+    def reweight(self):
+        """Recompute IDF over every row and fold the pending block into the main matrix."""
+        with self._lock:
+            n_pending = len(self._pending_counts)
+            pending = self._pending_counts[:n_pending]
+            base_counts = self._counts
+            doc_freq = self._doc_freq.copy()
+            n_docs = len(self.questions)
+
+        counts = sp.vstack([base_counts] + pending, format='csr') if pending else base_counts
+        idf = self._compute_idf(doc_freq, n_docs)
+        question_vectors = self._weight(counts, idf)
+
+        with self._lock:
+            if self._counts is not base_counts:
+                # The index was reloaded (or re-weighted) meanwhile
+                return
+            self._counts = counts
+            self.idf = idf
+            self.question_vectors = question_vectors
+            # Rows added while we were re-weighting stay pending
+            del self._pending_counts[:n_pending]
+            del self._pending_vectors[:n_pending]
+
+    def similarities(self, query_vectors):
+        """Sparse cosine similarity of each query row against every indexed question."""
+        with self._lock:
+            question_vectors = self.question_vectors
+            pending = list(self._pending_vectors)
+
+        blocks = [query_vectors @ question_vectors.T]
+        if pending:
+            blocks.append(query_vectors @ sp.vstack(pending, format='csr').T)
+        return sp.hstack(blocks, format='csr') if len(blocks) > 1 else blocks[0].tocsr()
+
+    def rows(self, ids):
+        """Weighted question vectors for the given row ids."""
+        with self._lock:
+            question_vectors = self.question_vectors
+            pending = list(self._pending_vectors)
+        ids = np.asarray(ids)
+        in_main = ids < question_vectors.shape[0]
+        if in_main.all():
+            return question_vectors[ids]
+        blocks = [question_vectors[ids[in_main]]]
+        blocks += [pending[idx - question_vectors.shape[0]] for idx in ids[~in_main]]
+        order = np.concatenate([np.flatnonzero(in_main), np.flatnonzero(~in_main)])
+        return sp.vstack(blocks, format='csr')[np.argsort(order)]
+
+    def search_batch(self, queries, top_n=3, threshold=0.2, chunk_size=QUERY_CHUNK):
+        """
+        Top-n retrieval for a batch of queries.
+
+        Args:
+            queries: List of query strings
+            top_n: Maximum results per query
+            threshold: Only similarities strictly above this are kept
+            chunk_size: Queries scored together; bounds peak memory
+
+        Returns:
+            dict: Columnar results of shape (len(queries), top_n) -- 'ids'
+            (-1 where empty), 'similarity' (0.0 where empty), and object
+            arrays 'question' and 'answer' (None where empty)
+        """
+        ids = np.full((len(queries), top_n), -1, dtype=np.int64)
+        similarity = np.zeros((len(queries), top_n))
+
+        if len(self):
+            for start in range(0, len(queries), chunk_size):
+                query_vectors = self.transform(queries[start:start + chunk_size])
+                candidate_ids, scores = _pad_rows(self.similarities(query_vectors), threshold)
+                chunk_ids, chunk_scores = _top_k(candidate_ids, scores, top_n)
+                ids[start:start + chunk_size] = chunk_ids
+                similarity[start:start + chunk_size] = chunk_scores
+
+        found = ids >= 0
+        question = np.full(ids.shape, None, dtype=object)
+        answer = np.full(ids.shape, None, dtype=object)
+        question[found] = [self.questions[idx] for idx in ids[found]]
+        answer[found] = [self.answers[idx] for idx in ids[found]]
+
+        return {
+            'ids': ids,
+            'similarity': similarity,
+            'question': question,
+            'answer': answer
+        }
+
+    def search(self, query, top_n=3, threshold=0.2):
+        """Return up to `top_n` entries whose similarity to `query` exceeds `threshold`."""
+        results = self.search_batch([query], top_n=top_n, threshold=threshold)
+        found = results['ids'][0] >= 0
+        return [
+            {'question': question, 'answer': answer, 'similarity': similarity}
+            for question, answer, similarity in zip(
+                results['question'][0][found],
+                results['answer'][0][found],
+                results['similarity'][0][found]
+            )
+        ]
+
+
+def _pad_rows(similarities, threshold):
+    """
+    Turn the above-threshold entries of a sparse similarity matrix into a
+    dense (n_queries, widest_row) candidate block padded with -inf.
+    """
+    similarities = similarities.tocsr()
+    similarities.data[similarities.data <= threshold] = 0
+    similarities.eliminate_zeros()
+
+    counts = np.diff(similarities.indptr)
+    width = max(int(counts.max(initial=0)), 1)
+    rows = np.repeat(np.arange(similarities.shape[0]), counts)
+    columns = np.arange(similarities.nnz) - np.repeat(similarities.indptr[:-1], counts)
+
+    ids = np.full((similarities.shape[0], width), -1, dtype=np.int64)
+    scores = np.full((similarities.shape[0], width), -np.inf)
+    ids[rows, columns] = similarities.indices
+    scores[rows, columns] = similarities.data
+    return ids, scores
+
+
+def _sparse_dot(queries, rows):
+    """
+    Dense `queries @ rows.T` for a few CSR rows. Both sides are first mapped
+    onto the queries' own features, as transposing in the full hashed space
+    costs O(n_features) per call.
+    """
+    features = np.unique(queries.indices)
+    if not len(features):
+        return np.zeros((queries.shape[0], rows.shape[0]))
+
+    def compact(matrix):
+        positions = np.minimum(np.searchsorted(features, matrix.indices), len(features) - 1)
+        data = np.where(features[positions] == matrix.indices, matrix.data, 0.0)
+        return sp.csr_matrix((data, positions, matrix.indptr), shape=(matrix.shape[0], len(features)))
+
+    return (compact(queries) @ compact(rows).T).toarray()
+
+
+def _top_k(ids, scores, top_n):
+    """Pick the `top_n` best-scoring ids per row, best first, padding with -1/0.0."""
+    n_rows, width = scores.shape
+    out_ids = np.full((n_rows, top_n), -1, dtype=np.int64)
+    out_scores = np.zeros((n_rows, top_n))
+    k = min(top_n, width)
+    if k == 0:
+        return out_ids, out_scores
+
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k] if k < width else np.tile(np.arange(width), (n_rows, 1))
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    best = np.take_along_axis(best, order, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+    found = np.isfinite(best_scores)
+    out_ids[:, :k] = np.where(found, np.take_along_axis(ids, best, axis=1), -1)
+    out_scores[:, :k] = np.where(found, best_scores, 0.0)
+    return out_ids, out_scores
+
+
+def _raw_to_npy(raw_path, npy_path, dtype, shape):
+    """Prefix a raw little-endian array dump with an .npy header, streaming the data."""
+    with open(npy_path, 'wb') as out:
+        np.lib.format.write_array_header_2_0(out, {
+            'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            'fortran_order': False,
+            'shape': shape
+        })
+        with open(raw_path, 'rb') as raw:
+            shutil.copyfileobj(raw, out, 16 << 20)
+    os.remove(raw_path)
+
+
+class IndexArtifactWriter:
+    """
+    Writes a `KnowledgeBaseIndex` artifact chunk by chunk.
+
+    Texts, term counts and MinHash signatures go straight to raw files, so
+    memory stays bounded by the chunk size plus the document-frequency vector
+    and row pointers. `close` turns the raw files into the arrays `load`
+    expects and computes the IDF-weighted vectors in a second pass over the
+    memory-mapped counts.
+    """
+
+    def __init__(self, artifact_dir, n_features=N_FEATURES):
+        self.artifact_dir = artifact_dir
+        self.n_features = n_features
+        self.template = KnowledgeBaseIndex(n_features=n_features)
+        self.minhash = MinHashIndex()
+        self.n_rows = 0
+        self.nnz = 0
+        self._doc_freq = np.zeros(n_features, dtype=np.int64)
+        self._indptr = [np.zeros(1, dtype=np.int64)]
+        self._text_offsets = {'questions': 0, 'answers': 0}
+        os.makedirs(artifact_dir, exist_ok=True)
+        self._files = {
+            name: open(self._path(f"{name}.raw"), 'wb')
+            for name in ('indices', 'counts', 'minhash', 'questions_blob', 'questions_offsets',
+                         'answers_blob', 'answers_offsets')
+        }
+        for column in ('questions', 'answers'):
+            self._files[f"{column}_offsets"].write(np.zeros(1, dtype=np.int64).tobytes())
+
+    def _path(self, name):
+        return os.path.join(self.artifact_dir, name)
+
+    def term_counts(self, questions):
+        return self.template._term_counts(questions)
+
+    def signatures(self, counts):
+        return self.minhash.signatures_for(counts)
+
+    def add(self, questions, answers, counts=None, signatures=None):
+        """Append a chunk of rows; pass `counts`/`signatures` if already computed for it."""
+        if counts is None:
+            counts = self.term_counts(questions)
+        if signatures is None:
+            signatures = self.signatures(counts)
+
+        self._files['indices'].write(counts.indices.astype(np.int32).tobytes())
+        self._files['counts'].write(counts.data.astype(np.float64).tobytes())
+        self._files['minhash'].write(np.ascontiguousarray(signatures, dtype=np.uint32).tobytes())
+        self._doc_freq += np.bincount(counts.indices, minlength=self.n_features)
+        self._indptr.append(counts.indptr[1:].astype(np.int64) + self.nnz)
+        self.nnz += counts.nnz
+        self.n_rows += len(questions)
+
+        for column, texts in (('questions', questions), ('answers', answers)):
+            encoded = [text.encode('utf-8') for text in texts]
+            offsets = np.cumsum([len(e) for e in encoded], dtype=np.int64) + self._text_offsets[column]
+            self._files[f"{column}_blob"].write(b''.join(encoded))
+            self._files[f"{column}_offsets"].write(offsets.tobytes())
+            if len(offsets):
+                self._text_offsets[column] = int(offsets[-1])
+
+    def flush(self):
+        for f in self._files.values():
+            f.flush()
+
+    def signatures_view(self):
+        """Memory-mapped signatures of every row written so far."""
+        self._files['minhash'].flush()
+        if not self.n_rows:
+            return np.zeros((0, self.minhash.n_perm), dtype=np.uint32)
+        return np.memmap(self._path('minhash.raw'), dtype=np.uint32, mode='r',
+                         shape=(self.n_rows, self.minhash.n_perm))
+
+    def close(self, csv_bytes, chunk_rows=1 << 16, csv_path=None):
+        """
+        Finish the artifact; `csv_bytes` is the length of the CSV prefix it
+        indexes, and `csv_path` (if given) the file whose fingerprint to record.
+        """
+        for f in self._files.values():
+            f.close()
+        index_dtype = np.int32 if self.nnz < np.iinfo(np.int32).max else np.int64
+
+        _raw_to_npy(self._path('indices.raw'), self._path('indices.npy'), np.int32, (self.nnz,))
+        _raw_to_npy(self._path('counts.raw'), self._path('counts.npy'), np.float64, (self.nnz,))
+        _raw_to_npy(self._path('minhash.raw'), self._path('minhash.npy'), np.uint32,
+                    (self.n_rows, self.minhash.n_perm))
+        for column in ('questions', 'answers'):
+            _raw_to_npy(self._path(f"{column}_blob.raw"), self._path(f"{column}_blob.npy"),
+                        np.uint8, (self._text_offsets[column],))
+            _raw_to_npy(self._path(f"{column}_offsets.raw"), self._path(f"{column}_offsets.npy"),
+                        np.int64, (self.n_rows + 1,))
+
+        indptr = np.concatenate(self._indptr).astype(index_dtype)
+        np.save(self._path('indptr.npy'), indptr)
+        np.save(self._path('doc_freq.npy'), self._doc_freq)
+        idf = KnowledgeBaseIndex._compute_idf(self._doc_freq, self.n_rows)
+        np.save(self._path('idf.npy'), idf)
+
+        # Second pass over the counts on disk: IDF weighting and L2 normalization
+        indices = np.load(self._path('indices.npy'), mmap_mode='r')
+        counts = np.load(self._path('counts.npy'), mmap_mode='r')
+        vectors = np.lib.format.open_memmap(self._path('vectors.npy'), mode='w+', dtype=np.float64,
+                                            shape=(self.nnz,))
+        for first in range(0, self.n_rows, chunk_rows):
+            last = min(first + chunk_rows, self.n_rows)
+            start, end = int(indptr[first]), int(indptr[last])
+            if start == end:
+                continue
+            block = sp.csr_matrix(
+                (counts[start:end] * idf[indices[start:end]], indices[start:end], indptr[first:last + 1] - start),
+                shape=(last - first, self.n_features)
+            )
+            vectors[start:end] = normalize(block, norm='l2', copy=False).data
+        vectors.flush()
+        del vectors
+
+        with open(self._path('meta.json'), 'w') as f:
+            json.dump({
+                'version': ARTIFACT_VERSION,
+                'n_features': self.n_features,
+                'n_rows': self.n_rows,
+                'csv_bytes': csv_bytes,
+                **(csv_fingerprint(csv_path, csv_bytes) if csv_path else {})
+            }, f)
+        return self.artifact_dir
@@ -0,0 +1,416 @@
+"""
+Bulk ingestion of question/answer corpora into the knowledge base.
+
+Streams CSV or JSONL files (optionally gzipped) in chunks, normalizes and
+validates each row, drops rows whose question duplicates an existing or
+earlier one (exactly, or nearly by MinHash), and writes the merged `kb.csv`
+together with its search-index artifact in the same pass:
+
+    python -m utils.kb_ingest corpus.jsonl more.csv.gz --kb assets/knowledge_base/kb.csv
+"""
+import io
+import os
+import csv
+import sys
+import gzip
+import json
+import time
+import shutil
+import hashlib
+import resource
+import unicodedata
+import numpy as np
+import pandas as pd
+from utils.kb_index import IndexArtifactWriter, N_FEATURES, DUPLICATE_THRESHOLD
+from utils.file_lock import lock_for, encode_csv_row
+
+CHUNK_ROWS = 50_000
+MIN_QUESTION_CHARS = 3
+MAX_QUESTION_CHARS = 2_000
+MAX_ANSWER_CHARS = 20_000
+_SPACES = str.maketrans({'\t': ' ', '\r': '\n'})
+
+
+def normalize_text(value):
+    """NFKC-normalize, drop control characters and collapse runs of whitespace."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    text = unicodedata.normalize('NFKC', str(value)).translate(_SPACES)
+    text = "".join(ch for ch in text if ch == '\n' or unicodedata.category(ch)[0] != 'C')
+    lines = (" ".join(line.split()) for line in text.split('\n'))
+    return "\n".join(line for line in lines if line)
+
+
+def question_key(question):
+    """64-bit key of a question for exact duplicate detection (case and spacing insensitive)."""
+    digest = hashlib.blake2b(" ".join(question.casefold().split()).encode('utf-8'), digest_size=8)
+    return int.from_bytes(digest.digest(), 'little')
+
+
+def rejection_reason(question, answer):
+    if len(question) < MIN_QUESTION_CHARS:
+        return 'short_question'
+    if not answer:
+        return 'empty_answer'
+    if len(question) > MAX_QUESTION_CHARS:
+        return 'long_question'
+    if len(answer) > MAX_ANSWER_CHARS:
+        return 'long_answer'
+    return None
+
+
+class _PrefixReader(io.RawIOBase):
+    """Reads at most `limit` bytes of a binary file."""
+
+    def __init__(self, f, limit):
+        self._f = f
+        self._remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._remaining <= 0:
+            return 0
+        data = self._f.read(min(len(buffer), self._remaining))
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+
+def _open(path):
+    return gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')
+
+
+def read_csv_chunks(f, chunk_rows, question_field='question', answer_field='answer'):
+    """Yield (questions, answers) lists from a CSV stream, `chunk_rows` at a time."""
+    reader = pd.read_csv(f, chunksize=chunk_rows, dtype=str, keep_default_na=False, encoding='utf-8')
+    for frame in reader:
+        if question_field not in frame.columns or answer_field not in frame.columns:
+            raise ValueError(f"CSV lacks the expected columns ({question_field}, {answer_field})")
+        yield frame[question_field].tolist(), frame[answer_field].tolist()
+
+
+def read_jsonl_chunks(f, chunk_rows, question_field='question', answer_field='answer'):
+    """Yield (questions, answers) lists from a JSON-lines stream; malformed lines are skipped."""
+    questions, answers = [], []
+    for line in io.TextIOWrapper(f, encoding='utf-8'):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            questions.append(None)
+            answers.append(None)
+        else:
+            questions.append(record.get(question_field) if isinstance(record, dict) else None)
+            answers.append(record.get(answer_field) if isinstance(record, dict) else None)
+        if len(questions) >= chunk_rows:
+            yield questions, answers
+            questions, answers = [], []
+    if questions:
+        yield questions, answers
+
+
+def read_chunks(path, chunk_rows, **fields):
+    name = path[:-3] if path.endswith('.gz') else path
+    with _open(path) as f:
+        if name.endswith(('.jsonl', '.ndjson')):
+            yield from read_jsonl_chunks(f, chunk_rows, **fields)
+        elif name.endswith('.csv'):
+            yield from read_csv_chunks(f, chunk_rows, **fields)
+        else:
+            raise ValueError(f"Unsupported input format: {path} (expected .csv or .jsonl, optionally .gz)")
+
+
+class _SortedRuns:
+    """
+    Multimap from uint keys to row ids kept as a few sorted runs.
+
+    New runs are merged with their predecessor while at least as large, so
+    there are O(log n) runs and lookups are a handful of vectorized binary
+    searches per chunk.
+    """
+
+    def __init__(self, key_dtype):
+        self.key_dtype = key_dtype
+        self._runs = []
+
+    def add(self, keys, ids):
+        order = np.argsort(keys, kind='stable')
+        run = (np.asarray(keys, dtype=self.key_dtype)[order], np.asarray(ids, dtype=np.int64)[order])
+        self._runs.append(run)
+        while len(self._runs) > 1 and len(self._runs[-1][0]) >= len(self._runs[-2][0]):
+            (k2, i2), (k1, i1) = self._runs.pop(), self._runs.pop()
+            keys_merged = np.concatenate([k1, k2])
+            order = np.argsort(keys_merged, kind='stable')
+            self._runs.append((keys_merged[order], np.concatenate([i1, i2])[order]))
+
+    def contains(self, keys):
+        found = np.zeros(len(keys), dtype=bool)
+        for run_keys, _ in self._runs:
+            pos = np.searchsorted(run_keys, keys)
+            found |= run_keys[np.minimum(pos, len(run_keys) - 1)] == keys if len(run_keys) else False
+        return found
+
+    def ranges(self, keys):
+        """For each run, (ids, lo, hi) so that ids[lo[i]:hi[i]] are the ids stored under keys[i]."""
+        return [
+            (run_ids, np.searchsorted(run_keys, keys, 'left'), np.searchsorted(run_keys, keys, 'right'))
+            for run_keys, run_ids in self._runs
+        ]
+
+
+class DuplicateFilter:
+    """
+    Detects questions that duplicate ones already accepted.
+
+    Exact duplicates are matched on a 64-bit key of the case-folded question.
+    Near duplicates share an LSH band with an accepted question and agree on
+    at least `threshold` of their MinHash components, i.e. their estimated
+    Jaccard similarity of hashed terms is at least `threshold`. Memory is
+    about 136 bytes per accepted row.
+    """
+
+    def __init__(self, minhash, threshold=DUPLICATE_THRESHOLD, near_duplicates=True):
+        self.minhash = minhash
+        self.threshold = threshold
+        self.near_duplicates = near_duplicates
+        self._exact = _SortedRuns(np.uint64)
+        self._bands = [_SortedRuns(np.uint32) for _ in range(minhash.bands)]
+
+    def add(self, keys, signatures, nonempty, first_id):
+        """Register accepted rows, which get ids `first_id`, `first_id + 1`, ..."""
+        ids = np.arange(first_id, first_id + len(keys))
+        self._exact.add(keys, ids)
+        if self.near_duplicates and nonempty.any():
+            band_keys = self.minhash.band_keys(signatures[nonempty])
+            for band, runs in enumerate(self._bands):
+                runs.add(band_keys[:, band], ids[nonempty])
+
+    def _similar(self, signature, candidate_signatures):
+        return (candidate_signatures == signature).mean(axis=1) >= self.threshold
+
+    def filter(self, keys, signatures, nonempty, stored_signatures):
+        """
+        Classify a chunk of rows.
+
+        Returns:
+            ndarray: 0 = keep, 1 = exact duplicate, 2 = near duplicate
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        verdict = np.zeros(len(keys), dtype=np.int8)
+        _, first = np.unique(keys, return_index=True)
+        repeated = np.ones(len(keys), dtype=bool)
+        repeated[first] = False
+        verdict[repeated | self._exact.contains(keys)] = 1
+        if not self.near_duplicates:
+            return verdict
+
+        candidates = (verdict == 0) & nonempty
+        band_keys = self.minhash.band_keys(signatures)
+
+        # Rows sharing a band with a stored row, or with another row of this chunk
+        suspects = np.zeros(len(keys), dtype=bool)
+        lookups = []
+        for band, runs in enumerate(self._bands):
+            ranges = runs.ranges(band_keys[:, band])
+            for _, lo, hi in ranges:
+                suspects |= hi > lo
+            lookups.append(ranges)
+            band_column = band_keys[candidates, band]
+            _, inverse, counts = np.unique(band_column, return_inverse=True, return_counts=True)
+            shared = np.zeros(len(keys), dtype=bool)
+            shared[candidates] = counts[inverse] > 1
+            suspects |= shared
+        suspects &= candidates
+
+        local = {}
+        for row in np.flatnonzero(suspects):
+            stored = [
+                ids[lo[row]:hi[row]]
+                for ranges in lookups for ids, lo, hi in ranges if hi[row] > lo[row]
+            ]
+            if stored:
+                stored = np.unique(np.concatenate(stored))
+                if self._similar(signatures[row], stored_signatures[stored]).any():
+                    verdict[row] = 2
+                    continue
+            earlier = {other for band in range(self.minhash.bands)
+                       for other in local.get((band, int(band_keys[row, band])), ())}
+            if earlier and self._similar(signatures[row], signatures[sorted(earlier)]).any():
+                verdict[row] = 2
+                continue
+            for band in range(self.minhash.bands):
+                local.setdefault((band, int(band_keys[row, band])), []).append(row)
+        return verdict
+
+
+def _max_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(usage / (1024 * 1024) if sys.platform == 'darwin' else usage / 1024, 1)
+
+
+def ingest(sources, kb_path, index_dir=None, chunk_rows=CHUNK_ROWS, threshold=DUPLICATE_THRESHOLD,
+           near_duplicates=True, question_field='question', answer_field='answer',
+           n_features=N_FEATURES, progress=True):
+    """
+    Merge `sources` into the knowledge base at `kb_path` and build its index.
+
+    Existing rows are kept as they are and seed the duplicate filter; new rows
+    are appended after them. The new CSV and artifact are written to
+    temporary paths and swapped in at the end, under the KB lock, together
+    with any rows the app appended meanwhile. Artifacts land in
+    `index_dir/<sha256 of kb.csv>`, where `KnowledgeBaseIndex.load_or_build`
+    looks for them; rows appended meanwhile lie past the artifact's byte
+    offset and are indexed by `sync_from_csv`. Workers that loaded the old
+    file detect the replacement on their next `sync_from_csv` and reload.
+
+    Returns:
+        dict: Row counts, rejection and duplicate counts, timing and rows/sec
+    """
+    start = time.perf_counter()
+    index_dir = index_dir or os.path.join(os.path.dirname(kb_path) or '.', '.kb_index')
+    os.makedirs(index_dir, exist_ok=True)
+    tag = f"{os.getpid()}-{int(time.time())}"
+    tmp_csv = f"{kb_path}.ingest-{tag}"
+    tmp_artifact = os.path.join(index_dir, f".tmp-ingest-{tag}")
+
+    with lock_for(kb_path):
+        existing_bytes = os.path.getsize(kb_path) if os.path.exists(kb_path) else 0
+
+    writer = IndexArtifactWriter(tmp_artifact, n_features=n_features)
+    dedup = DuplicateFilter(writer.minhash, threshold=threshold, near_duplicates=near_duplicates)
+    digest = hashlib.sha256()
+    report = {
+        'existing_rows': 0, 'rows_read': 0, 'rows_added': 0,
+        'rejected': {}, 'duplicates': {'exact': 0, 'near': 0}
+    }
+
+    def write_csv(out, questions, answers):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(zip(questions, answers))
+        data = buffer.getvalue().encode('utf-8')
+        out.write(data)
+        digest.update(data)
+
+    def add_rows(questions, answers, check):
+        counts = writer.term_counts(questions)
+        signatures = writer.signatures(counts)
+        nonempty = np.diff(counts.indptr) > 0
+        keys = np.fromiter((question_key(q) for q in questions), dtype=np.uint64, count=len(questions))
+        if check:
+            verdict = dedup.filter(keys, signatures, nonempty, writer.signatures_view())
+            report['duplicates']['exact'] += int((verdict == 1).sum())
+            report['duplicates']['near'] += int((verdict == 2).sum())
+            keep = np.flatnonzero(verdict == 0)
+            questions = [questions[i] for i in keep]
+            answers = [answers[i] for i in keep]
+            counts, signatures, nonempty, keys = counts[keep], signatures[keep], nonempty[keep], keys[keep]
+        dedup.add(keys, signatures, nonempty, writer.n_rows)
+        writer.add(questions, answers, counts, signatures)
+        return questions, answers
+
+    try:
+        with open(tmp_csv, 'wb') as out:
+            header = encode_csv_row(['question', 'answer'])
+            out.write(header)
+            digest.update(header)
+
+            if existing_bytes:
+                with open(kb_path, 'rb') as f:
+                    prefix = io.BufferedReader(_PrefixReader(f, existing_bytes))
+                    for questions, answers in read_csv_chunks(prefix, chunk_rows):
+                        add_rows(questions, answers, check=False)
+                        write_csv(out, questions, answers)
+                        report['existing_rows'] += len(questions)
+
+            for path in sources:
+                for raw_questions, raw_answers in read_chunks(path, chunk_rows, question_field=question_field,
+                                                              answer_field=answer_field):
+                    report['rows_read'] += len(raw_questions)
+                    questions, answers = [], []
+                    for raw_question, raw_answer in zip(raw_questions, raw_answers):
+                        question, answer = normalize_text(raw_question), normalize_text(raw_answer)
+                        reason = rejection_reason(question, answer)
+                        if reason:
+                            report['rejected'][reason] = report['rejected'].get(reason, 0) + 1
+                            continue
+                        questions.append(question)
+                        answers.append(answer)
+                    if questions:
+                        questions, answers = add_rows(questions, answers, check=True)
+                        write_csv(out, questions, answers)
+                        report['rows_added'] += len(questions)
+                    if progress:
+                        elapsed = time.perf_counter() - start
+                        print(f"{path}: {report['rows_read']} read, {report['rows_added']} added, "
+                              f"{report['rows_read'] / elapsed:,.0f} rows/s", file=sys.stderr)
+
+            indexed_bytes = out.tell()
+
+        writer.close(indexed_bytes, csv_path=tmp_csv)
+
+        with lock_for(kb_path):
+            # Rows the app appended while we were ingesting
+            size = os.path.getsize(kb_path) if os.path.exists(kb_path) else 0
+            if size > existing_bytes:
+                with open(kb_path, 'rb') as f, open(tmp_csv, 'ab') as out:
+                    f.seek(existing_bytes)
+                    tail = f.read()
+                    out.write(tail)
+                    digest.update(tail)
+            artifact_dir = os.path.join(index_dir, digest.hexdigest())
+            if os.path.exists(artifact_dir):
+                shutil.rmtree(artifact_dir)
+            os.replace(tmp_artifact, artifact_dir)
+            os.replace(tmp_csv, kb_path)
+    finally:
+        if os.path.exists(tmp_csv):
+            os.remove(tmp_csv)
+        shutil.rmtree(tmp_artifact, ignore_errors=True)
+
+    for name in os.listdir(index_dir):
+        stale = os.path.join(index_dir, name)
+        if stale != artifact_dir and '.tmp-' not in name and os.path.isdir(stale):
+            shutil.rmtree(stale, ignore_errors=True)
+
+    seconds = time.perf_counter() - start
+    report.update({
+        'total_rows': writer.n_rows,
+        'artifact_dir': artifact_dir,
+        'seconds': round(seconds, 2),
+        'rows_per_second': round(report['rows_read'] / seconds, 1) if seconds else 0.0,
+        'max_rss_mb': _max_rss_mb()
+    })
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Bulk-load question/answer corpora into the knowledge base.")
+    parser.add_argument("sources", nargs="+", help="CSV or JSONL files, optionally .gz")
+    parser.add_argument("--kb", default="./assets/knowledge_base/kb.csv", help="Knowledge base CSV to extend")
+    parser.add_argument("--index-dir", help="Artifact directory (default: .kb_index next to the KB)")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--threshold", type=float, default=DUPLICATE_THRESHOLD,
+                        help="Estimated Jaccard similarity at which a question counts as a near duplicate")
+    parser.add_argument("--exact-only", action="store_true", help="Only drop exact duplicate questions")
+    parser.add_argument("--question-field", default="question")
+    parser.add_argument("--answer-field", default="answer")
+    parser.add_argument("--quiet", action="store_true")
+    args = parser.parse_args()
+
+    result = ingest(
+        args.sources,
+        args.kb,
+        index_dir=args.index_dir,
+        chunk_rows=args.chunk_rows,
+        threshold=args.threshold,
+        near_duplicates=not args.exact_only,
+        question_field=args.question_field,
+        answer_field=args.answer_field,
+        progress=not args.quiet
+    )
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,97 @@
+import re
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+SUMMARY_MODES = ('llm', 'local', 'hybrid')
+SUMMARY_WORDS = 100
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+|\n+')
+
+
+def entry_identity(entry):
+    """Stable identity of a KB row, derived from its content rather than its position."""
+    digest = hashlib.sha1()
+    digest.update(entry['question'].encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(entry['answer'].encode('utf-8'))
+    return digest.hexdigest()
+
+
+def summary_cache_key(kb_entries):
+    """Cache key for the summary of a set of KB entries; retrieval order does not matter."""
+    identities = sorted(entry_identity(entry) for entry in kb_entries)
+    return hashlib.sha1('|'.join(identities).encode('utf-8')).hexdigest()
+
+
+def split_sentences(text, min_words=3):
+    """Split an answer into sentences, dropping fragments shorter than `min_words`."""
+    sentences = (s.strip() for s in _SENTENCE_SPLIT.split(text))
+    return [s for s in sentences if len(s.split()) >= min_words]
+
+
+def extractive_summary(kb_entries, kb_index, max_words=SUMMARY_WORDS, redundancy=0.6):
+    """
+    Summarize KB answers locally by picking their most central sentences.
+
+    Sentences are vectorized with the knowledge base's own TF-IDF weights and
+    scored by their summed cosine similarity to every other sentence. The
+    best ones are taken greedily, skipping near-repeats of sentences already
+    chosen, until the word budget is spent.
+
+    Args:
+        kb_entries: Retrieved entries with an 'answer' key
+        kb_index: KnowledgeBaseIndex whose `transform` supplies the vectors
+        max_words: Word budget for the whole summary
+        redundancy: Skip sentences more similar than this to a chosen one
+
+    Returns:
+        str: Bullet points, one sentence each, in their original order
+    """
+    sentences = list(dict.fromkeys(
+        sentence for entry in kb_entries for sentence in split_sentences(entry['answer'])
+    ))
+    if not sentences:
+        return ""
+
+    vectors = kb_index.transform(sentences, known_terms_only=False)
+    similarity = (vectors @ vectors.T).toarray()
+    scores = similarity.sum(axis=1)
+    word_counts = np.array([len(s.split()) for s in sentences])
+
+    chosen = []
+    budget = max_words
+    for idx in np.argsort(-scores, kind='stable'):
+        if word_counts[idx] > budget:
+            continue
+        if chosen and similarity[idx, chosen].max() > redundancy:
+            continue
+        chosen.append(idx)
+        budget -= word_counts[idx]
+
+    if not chosen:
+        best = int(np.argmax(scores))
+        return "- " + " ".join(sentences[best].split()[:max_words]) + "..."
+    return "\n".join(f"- {sentences[idx]}" for idx in sorted(chosen))
+
+
+class BackgroundRefresher:
+    """Runs slow cache fills off the request path, at most one in flight per key."""
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='kb-summary')
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(lambda _: self._done(key))
+        return True
+
+    def _done(self, key):
+        with self._lock:
+            self._in_flight.discard(key)
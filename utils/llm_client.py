@@ -0,0 +1,216 @@
+import time
+import random
+import threading
+from utils import metrics
+
+DEFAULT_MODEL = 'gemini-2.0-flash'
+TIMEOUT = 30
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+BACKENDS = ('gemini', 'fake')
+
+
+class TransientLLMError(Exception):
+    """A failure worth retrying (rate limit, overload, timeout)."""
+
+
+class GeminiBackend:
+    """
+    google.generativeai, configured once per process with one reusable
+    `GenerativeModel` per (model name, system instruction), so a static
+    instruction is bound once rather than rebuilt into every prompt.
+    Timeouts are passed to the API as per-request deadlines.
+    """
+
+    def __init__(self, api_key):
+        import google.generativeai as genai
+        from google.api_core import exceptions
+
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        self._transient = (
+            exceptions.TooManyRequests,
+            exceptions.ResourceExhausted,
+            exceptions.ServiceUnavailable,
+            exceptions.InternalServerError,
+            exceptions.DeadlineExceeded,
+            TimeoutError,
+            ConnectionError
+        )
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def model(self, name, system_instruction=None):
+        key = (name, system_instruction)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._models[key] = self._genai.GenerativeModel(name, system_instruction=system_instruction)
+            return model
+
+    def is_transient(self, error):
+        return isinstance(error, self._transient)
+
+    def generate(self, model, prompt, timeout, system_instruction=None):
+        response = self.model(model, system_instruction).generate_content(prompt, request_options={'timeout': timeout})
+        return response.text
+
+    def stream(self, model, prompt, timeout, system_instruction=None):
+        generative_model = self.model(model, system_instruction)
+        for chunk in generative_model.generate_content(prompt, stream=True, request_options={'timeout': timeout}):
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. the final finish-reason chunk)
+                continue
+            if text:
+                yield text
+
+
+class FakeBackend:
+    """
+    Local stand-in for Gemini in tests and benchmarks.
+
+    Replies after `latency` seconds (plus up to `jitter`), streaming the text
+    in chunks of `chunk_words` words spread over that time. A `failure_rate`
+    fraction of calls raises TransientLLMError, and calls slower than the
+    timeout raise TimeoutError, so retry paths can be exercised.
+    """
+
+    def __init__(self, latency=0.5, jitter=0.0, reply=None, chunk_words=8, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.reply = reply or (lambda prompt: "I hear you. Let's take this one step at a time. "
+                                              "What feels most pressing right now?")
+        self.chunk_words = chunk_words
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def is_transient(self, error):
+        return isinstance(error, (TransientLLMError, TimeoutError))
+
+    def _start(self, timeout):
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.failure_rate
+            latency = self.latency + self._random.uniform(0, self.jitter)
+        if failed:
+            raise TransientLLMError("fake backend: simulated overload")
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"fake backend: no reply within {timeout}s")
+        return latency
+
+    def _text(self, prompt):
+        return self.reply(prompt) if callable(self.reply) else self.reply
+
+    def generate(self, model, prompt, timeout, system_instruction=None):
+        time.sleep(self._start(timeout))
+        return self._text(prompt)
+
+    def stream(self, model, prompt, timeout, system_instruction=None):
+        latency = self._start(timeout)
+        words = self._text(prompt).split(" ")
+        chunks = [" ".join(words[i:i + self.chunk_words]) for i in range(0, len(words), self.chunk_words)]
+        for i, chunk in enumerate(chunks):
+            time.sleep(latency / len(chunks))
+            yield chunk if i == len(chunks) - 1 else chunk + " "
+
+
+def make_backend(name, api_key=None, **options):
+    if name == 'gemini':
+        return GeminiBackend(api_key)
+    if name == 'fake':
+        return FakeBackend(**options)
+    raise ValueError(f"Unknown LLM backend {name!r}; expected one of {BACKENDS}")
+
+
+class LLMClient:
+    """
+    The one way the app talks to a language model.
+
+    Every call has a timeout, and transient failures are retried up to
+    `max_retries` times with full-jitter exponential backoff. Streams are only
+    retried before their first chunk, since a retry after that would repeat
+    text the user has already seen. Calls are recorded under
+    `llm_requests_total{model, result}` and `llm_retries_total{model}`.
+    """
+
+    def __init__(self, backend, model=DEFAULT_MODEL, timeout=TIMEOUT, max_retries=MAX_RETRIES,
+                 backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX):
+        self.backend = backend
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _should_retry(self, error, attempt, model):
+        if attempt >= self.max_retries or not self.backend.is_transient(error):
+            metrics.increment('llm_requests_total', model=model, result='error')
+            return False
+        metrics.increment('llm_retries_total', model=model)
+        time.sleep(self._backoff(attempt))
+        return True
+
+    def generate(self, prompt, model=None, timeout=None, system_instruction=None):
+        """Return the full reply text for `prompt`."""
+        model = model or self.model
+        attempt = 0
+        while True:
+            try:
+                text = self.backend.generate(model, prompt, timeout or self.timeout, system_instruction)
+            except Exception as e:
+                if not self._should_retry(e, attempt, model):
+                    raise
+                attempt += 1
+                continue
+            metrics.increment('llm_requests_total', model=model, result='ok')
+            return text
+
+    def stream(self, prompt, model=None, timeout=None, system_instruction=None):
+        """Yield the reply text chunk by chunk as the model produces it."""
+        model = model or self.model
+        attempt = 0
+        while True:
+            started = False
+            try:
+                for text in self.backend.stream(model, prompt, timeout or self.timeout, system_instruction):
+                    started = True
+                    yield text
+            except Exception as e:
+                if started or not self._should_retry(e, attempt, model):
+                    if started:
+                        metrics.increment('llm_requests_total', model=model, result='error')
+                    raise
+                attempt += 1
+                continue
+            metrics.increment('llm_requests_total', model=model, result='ok')
+            return
+
+
+_backends = {}
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def shared_client(backend='gemini', api_key=None, **kwargs):
+    """
+    The process-wide client for a backend and settings, created on first use.
+    Clients with different model/timeout/retry settings share one backend, so
+    the API is configured once and model instances are reused across sessions.
+    """
+    key = (backend, api_key, tuple(sorted(kwargs.items())))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            if (backend, api_key) not in _backends:
+                _backends[backend, api_key] = make_backend(backend, api_key)
+            client = _clients[key] = LLMClient(_backends[backend, api_key], **kwargs)
+        return client
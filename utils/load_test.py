@@ -0,0 +1,344 @@
+"""
+Load test for the Therapist chat flow.
+
+Drives the same turn logic the Therapist page uses (`ChatResponder` over the
+chat pipeline, history store, context builder and response cache, plus the
+LLM client and incremental TTS) for N
+concurrent simulated sessions, with a fake LLM, an in-process Redis and a
+stubbed TTS backend, and reports throughput and per-stage latency
+percentiles:
+
+    python -m utils.load_test --sessions 50 --turns 5 --llm-latency 0.8
+"""
+import os
+import time
+import random
+import shutil
+import tempfile
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from reinforcement import PromptOptimizationRL
+from utils.kb_index import KnowledgeBaseIndex
+from utils.kb_summary import extractive_summary, summary_cache_key
+from utils.cache import TieredCache
+from utils.chat_history import ChatHistoryStore
+from utils.chat_pipeline import ChatPipeline, ChatResponder, make_executor
+from utils.context_builder import ContextBuilder, model_summarizer, fold_messages
+from utils.response_cache import SemanticResponseCache, MemoryResponseStore
+from utils.llm_client import LLMClient, FakeBackend
+from utils.tts import SpeechSynthesizer, IncrementalSpeech
+from utils.fake_redis import FakeRedis
+
+# Stages timed by the ChatTurn itself, copied into the report after each turn
+TURN_STAGES = ('history', 'retrieval', 'summary', 'context', 'history_write')
+STAGES = (
+    'history', 'retrieval', 'summary', 'context', 'llm_first_token', 'llm_total',
+    'history_write', 'first_audio', 'all_audio', 'turn'
+)
+
+SAMPLE_MESSAGES = [
+    "I feel anxious about my exams next week",
+    "I can't sleep and I'm exhausted all the time",
+    "My partner and I keep arguing and I feel frustrated",
+    "I've been feeling really lonely since I moved to a new city",
+    "Work is too much and I think I'm burning out",
+    "I feel sad most days and nothing seems fun anymore",
+    "How can I stop worrying about things I can't control?",
+    "I had a good day today and want to keep it going",
+    "I get nervous before presentations, what can I do?",
+    "My family doesn't understand what I'm going through",
+    "I feel overwhelmed by everything I have to do",
+    "I'm angry at myself for procrastinating again"
+]
+
+_TOPICS = [
+    'exam stress', 'insomnia', 'social anxiety', 'grief', 'burnout', 'panic attacks', 'loneliness',
+    'anger', 'low mood', 'relationship conflict', 'perfectionism', 'procrastination', 'self-esteem'
+]
+_ADVICE = [
+    "Try a short grounding exercise and name five things you can see.",
+    "Breaking the problem into small steps can make it feel manageable.",
+    "Regular sleep and wake times help stabilise mood and energy.",
+    "Notice the thought, label it, and let it pass without judging it.",
+    "Talking to someone you trust often reduces the weight of a worry.",
+    "Schedule one small pleasant activity each day and track how it feels.",
+    "Slow breathing with a longer exhale calms the body's alarm response.",
+    "Write the worry down and set a specific time to think about it later.",
+    "Be as kind to yourself as you would be to a friend in the same place.",
+    "If these feelings persist, a licensed therapist can help you work through them."
+]
+
+
+def synthetic_knowledge_base(n_rows=2000, seed=0):
+    """A KnowledgeBaseIndex of templated Q&A pairs, for runs without the real KB."""
+    rng = random.Random(seed)
+    questions, answers = [], []
+    for i in range(n_rows):
+        topic = rng.choice(_TOPICS)
+        questions.append(f"How do I cope with {topic} ({i})? {rng.choice(SAMPLE_MESSAGES)}")
+        answers.append(" ".join(rng.sample(_ADVICE, 4)))
+    return KnowledgeBaseIndex(questions, answers)
+
+
+def fake_reply(seed=0):
+    """Reply generator for FakeBackend: 4-7 advice sentences, different on every call."""
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def reply(prompt):
+        with lock:
+            return " ".join(rng.sample(_ADVICE, rng.randint(4, 7)))
+    return reply
+
+
+def stub_tts(latency=0.3, per_char=0.002):
+    """TTS backend that sleeps like a network synthesizer and returns placeholder MP3 bytes."""
+    def synthesize(text, lang):
+        time.sleep(latency + per_char * len(text))
+        return b'ID3' + text.encode('utf-8')
+    return synthesize
+
+
+def percentile_table(samples):
+    """Per-stage count and p50/p95/p99/max latency in milliseconds."""
+    table = {}
+    for stage in STAGES:
+        values = samples.get(stage)
+        if not values:
+            continue
+        ms = np.asarray(values) * 1000
+        table[stage] = {
+            'count': len(values),
+            'p50_ms': round(float(np.percentile(ms, 50)), 1),
+            'p95_ms': round(float(np.percentile(ms, 95)), 1),
+            'p99_ms': round(float(np.percentile(ms, 99)), 1),
+            'max_ms': round(float(ms.max()), 1)
+        }
+    return table
+
+
+class TherapistSimulation:
+    """
+    The Therapist page's `process_message` without Streamlit: one instance
+    is shared by every simulated session, as the page's cached resources are
+    shared by every browser session in a server process.
+    """
+
+    def __init__(self, knowledge_base, llm, redis_conn, synthesizer, concurrent=True,
+                 pipeline_workers=8, summary_mode='local', response_cache=True, tts_chunk_chars=60,
+                 context_budget=1500):
+        self.knowledge_base = knowledge_base
+        self.llm = llm
+        self.synthesizer = synthesizer
+        self.summary_mode = summary_mode
+        self.tts_chunk_chars = tts_chunk_chars
+        # summary_mode also picks the rolling-summary hook, as CONTEXT_SUMMARY_MODE does on the page
+        summarize = fold_messages if summary_mode == 'local' else model_summarizer(llm.generate)
+        self.history = ChatHistoryStore(redis_conn, summarize=summarize)
+        self.summary_cache = TieredCache('kb_summary', redis_conn=redis_conn)
+        self.context_builder = ContextBuilder(budget=context_budget, summarize=summarize)
+        self.response_cache = SemanticResponseCache(MemoryResponseStore()) if response_cache else None
+        self.executor = make_executor(pipeline_workers)
+        self.concurrent = concurrent
+        self._samples = {}
+        self._lock = threading.Lock()
+        self.errors = 0
+        # Turns that went on without a stage (e.g. history), as the page does
+        self.stage_errors = 0
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._samples.setdefault(stage, []).append(seconds)
+
+    def samples(self):
+        with self._lock:
+            return {stage: list(values) for stage, values in self._samples.items()}
+
+    def _summarize(self, kb_entries):
+        if self.summary_mode == 'local':
+            return extractive_summary(kb_entries, self.knowledge_base)
+        key = summary_cache_key(kb_entries)
+        summary = self.summary_cache.get(key)
+        if summary is None:
+            prompt = "Summarize these expert answers concisely within 100 words:\n\n" + "\n\n".join(
+                f"EXPERT ANSWER: {entry['answer']}" for entry in kb_entries
+            )
+            summary = self.llm.generate(prompt)
+            self.summary_cache.set(key, summary)
+        return summary
+
+    def run_turn(self, session_id, rl_agent, message, first_turn):
+        start = time.perf_counter()
+        pipeline = ChatPipeline(
+            self.executor,
+            fetch_history=lambda: self.history.snapshot(session_id),
+            retrieve=lambda text: self.knowledge_base.search(text, top_n=3, threshold=0.2),
+            summarize=self._summarize,
+            concurrent=self.concurrent
+        )
+        turn = pipeline.start()
+        responder = ChatResponder(pipeline, self.context_builder, rl_agent, session_id, history=self.history,
+                                  response_cache=self.response_cache, knowledge_base=self.knowledge_base)
+        speech = IncrementalSpeech(self.synthesizer, min_chars=self.tts_chunk_chars)
+
+        cache_key = responder.cache_key(message, first_turn)
+        cached_response = responder.cached_reply(cache_key)
+        if cached_response is not None:
+            response_text = cached_response
+            speech.feed(response_text)
+        else:
+            prompt, _ = responder.build_prompt(turn, message)
+
+            llm_start = time.perf_counter()
+            chunks = []
+            for text in self.llm.stream(prompt, system_instruction=rl_agent.system_instruction):
+                if not chunks:
+                    self.record('llm_first_token', time.perf_counter() - llm_start)
+                chunks.append(text)
+                speech.feed(text)
+            self.record('llm_total', time.perf_counter() - llm_start)
+            response_text = "".join(chunks)
+            responder.remember(cache_key, response_text)
+
+        speech.finish()
+        responder.save_turn(turn, message, response_text)
+        speech.first_audio()
+        self.record('first_audio', time.perf_counter() - start)
+        speech.remaining_audio()
+        self.record('all_audio', time.perf_counter() - start)
+        turn.finish("cached" if cached_response is not None else pipeline.mode)
+        if turn.errors:
+            with self._lock:
+                self.stage_errors += 1
+        for stage in TURN_STAGES:
+            if stage in turn.timings:
+                self.record(stage, turn.timings[stage])
+        self.record('turn', time.perf_counter() - start)
+        return response_text
+
+    def run_session(self, session_index, turns, think_time, seed):
+        rng = random.Random(seed + session_index)
+        rl_agent = PromptOptimizationRL()
+        session_id = f"load-test-{session_index}"
+        for turn_index in range(turns):
+            try:
+                self.run_turn(session_id, rl_agent, rng.choice(SAMPLE_MESSAGES), turn_index == 0)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                print(f"Session {session_index} turn {turn_index} failed: {e}")
+            if think_time:
+                time.sleep(rng.uniform(0, 2 * think_time))
+
+
+def run_load_test(sessions=20, turns=5, think_time=0.0, ramp_up=0.0, llm_latency=0.8, llm_jitter=0.4,
+                  llm_failure_rate=0.0, redis_latency=0.0005, tts_latency=0.3, tts_workers=4,
+                  kb_rows=2000, kb_path=None, seed=0, **simulation_options):
+    """
+    Run `sessions` concurrent sessions of `turns` messages each.
+
+    Returns:
+        dict: Throughput, error count and per-stage latency percentiles
+    """
+    if kb_path:
+        knowledge_base = KnowledgeBaseIndex.load_or_build(kb_path, os.path.join(os.path.dirname(kb_path), '.kb_index'))
+    else:
+        knowledge_base = synthetic_knowledge_base(kb_rows, seed)
+
+    llm = LLMClient(
+        FakeBackend(latency=llm_latency, jitter=llm_jitter, reply=fake_reply(seed),
+                    failure_rate=llm_failure_rate, seed=seed),
+        backoff_base=0.05
+    )
+    cache_dir = tempfile.mkdtemp(prefix='tts-load-test-')
+    try:
+        synthesizer = SpeechSynthesizer(cache_dir, max_workers=tts_workers, backend=stub_tts(tts_latency))
+        simulation = TherapistSimulation(knowledge_base, llm, FakeRedis(latency=redis_latency), synthesizer,
+                                         **simulation_options)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=sessions, thread_name_prefix='session') as pool:
+            futures = []
+            for i in range(sessions):
+                futures.append(pool.submit(simulation.run_session, i, turns, think_time, seed))
+                if ramp_up:
+                    time.sleep(ramp_up / sessions)
+            for future in futures:
+                future.result()
+        wall_seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    stages = percentile_table(simulation.samples())
+    completed = stages.get('turn', {}).get('count', 0)
+    return {
+        'sessions': sessions,
+        'turns_completed': completed,
+        'errors': simulation.errors,
+        'stage_errors': simulation.stage_errors,
+        'wall_seconds': round(wall_seconds, 2),
+        'turns_per_second': round(completed / wall_seconds, 2) if wall_seconds else 0.0,
+        'llm_calls': llm.backend.calls,
+        'stages': stages
+    }
+
+
+def format_report(report):
+    lines = [
+        f"{report['sessions']} sessions, {report['turns_completed']} turns in {report['wall_seconds']}s "
+        f"({report['turns_per_second']} turns/s), {report['errors']} errors, {report['stage_errors']} degraded, {report['llm_calls']} LLM calls",
+        f"{'stage':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    ]
+    for stage, row in report['stages'].items():
+        lines.append(
+            f"{stage:<16}{row['count']:>7}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load-test the Therapist chat flow with fake Gemini, Redis and TTS.")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a session's turns (s)")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which sessions start")
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--llm-jitter", type=float, default=0.4)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--redis-latency", type=float, default=0.0005)
+    parser.add_argument("--tts-latency", type=float, default=0.3)
+    parser.add_argument("--tts-workers", type=int, default=4)
+    parser.add_argument("--pipeline-workers", type=int, default=8)
+    parser.add_argument("--sequential", action="store_true", help="Run pipeline stages inline")
+    parser.add_argument("--summary-mode", choices=("local", "llm"), default="local")
+    parser.add_argument("--no-response-cache", action="store_true")
+    parser.add_argument("--kb", dest="kb_path", help="KB CSV; a synthetic KB is used when omitted")
+    parser.add_argument("--kb-rows", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run_load_test(
+        sessions=args.sessions,
+        turns=args.turns,
+        think_time=args.think_time,
+        ramp_up=args.ramp_up,
+        llm_latency=args.llm_latency,
+        llm_jitter=args.llm_jitter,
+        llm_failure_rate=args.llm_failure_rate,
+        redis_latency=args.redis_latency,
+        tts_latency=args.tts_latency,
+        tts_workers=args.tts_workers,
+        kb_rows=args.kb_rows,
+        kb_path=args.kb_path,
+        seed=args.seed,
+        concurrent=not args.sequential,
+        pipeline_workers=args.pipeline_workers,
+        summary_mode=args.summary_mode,
+        response_cache=not args.no_response_cache
+    )
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
@@ -0,0 +1,197 @@
+import json
+import time
+import random
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+RATIO_BUCKETS = (0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99, 1.0)
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_observations = {}
+_buckets = {}
+_log = {'stream': None, 'sample_rate': 0.0}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def set_buckets(name, buckets):
+    """Histogram bucket bounds for `name`; must be set before its first observation."""
+    _buckets[name] = tuple(sorted(buckets))
+
+
+def buckets_for(name):
+    if name in _buckets:
+        return _buckets[name]
+    if name.endswith('_tokens'):
+        return TOKEN_BUCKETS
+    return LATENCY_BUCKETS
+
+
+def increment(name, value=1, **labels):
+    """Add `value` to the counter `name` with the given labels."""
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def counter(name, **labels):
+    """Current value of a counter (0 if never incremented)."""
+    with _lock:
+        return _counters.get(_key(name, labels), 0.0)
+
+
+def counters():
+    """Snapshot of every counter as {(name, ((label, value), ...)): total}."""
+    with _lock:
+        return dict(_counters)
+
+
+def observe(name, value, **labels):
+    """Record one observation (e.g. a latency in seconds) for `name` in its histogram."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _observations.get(key)
+        if histogram is None:
+            bounds = buckets_for(name)
+            histogram = _observations[key] = {
+                'count': 0, 'sum': 0.0, 'max': 0.0, 'bounds': bounds, 'buckets': [0] * (len(bounds) + 1)
+            }
+        histogram['count'] += 1
+        histogram['sum'] += value
+        histogram['max'] = max(histogram['max'], value)
+        histogram['buckets'][bisect_left(histogram['bounds'], value)] += 1
+
+
+def summary(name, **labels):
+    """Count, sum, mean and max of the observations recorded for `name`."""
+    with _lock:
+        histogram = _observations.get(_key(name, labels))
+        stats = {k: histogram[k] for k in ('count', 'sum', 'max')} if histogram else {'count': 0, 'sum': 0.0, 'max': 0.0}
+    stats['mean'] = stats['sum'] / stats['count'] if stats['count'] else 0.0
+    return stats
+
+
+def quantile(name, q, **labels):
+    """Estimate the `q` quantile from the histogram buckets (upper bound of the bucket it falls in)."""
+    with _lock:
+        histogram = _observations.get(_key(name, labels))
+        if not histogram or not histogram['count']:
+            return 0.0
+        bounds, buckets, count, maximum = histogram['bounds'], list(histogram['buckets']), histogram['count'], histogram['max']
+    rank = q * count
+    seen = 0
+    for bound, bucket in zip(bounds, buckets):
+        seen += bucket
+        if seen >= rank:
+            return min(bound, maximum)
+    return maximum
+
+
+@contextmanager
+def span(name, **labels):
+    """Time the enclosed block into the histogram `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def prometheus_text():
+    """Every counter and histogram in the Prometheus text exposition format."""
+    with _lock:
+        counter_items = sorted(_counters.items())
+        histogram_items = sorted(
+            ((key, dict(h, buckets=list(h['buckets']))) for key, h in _observations.items()),
+            key=lambda item: item[0]
+        )
+
+    lines = []
+    declared = set()
+    for (name, labels), value in counter_items:
+        if name not in declared:
+            lines.append(f"# TYPE {name} counter")
+            declared.add(name)
+        lines.append(f"{name}{_labels(labels)} {value:g}")
+
+    for (name, labels), histogram in histogram_items:
+        if name not in declared:
+            lines.append(f"# TYPE {name} histogram")
+            declared.add(name)
+        cumulative = 0
+        for bound, bucket in zip(histogram['bounds'], histogram['buckets']):
+            cumulative += bucket
+            lines.append(f"{name}_bucket{_labels(labels, [('le', f'{bound:g}')])} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']:.6g}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+_server = {'instance': None}
+
+
+def start_http_server(port, host='0.0.0.0'):
+    """Serve `prometheus_text()` at /metrics from a daemon thread; a no-op if already serving."""
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    with _lock:
+        if _server['instance'] is not None:
+            return _server['instance']
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        _server['instance'] = server
+        return server
+
+
+def configure_log(path=None, sample_rate=0.01, stream=None):
+    """Write a sampled fraction of `log_event` records as JSON lines to `path` (or `stream`)."""
+    with _lock:
+        if path is not None:
+            stream = open(path, 'a', buffering=1, encoding='utf-8')
+        _log['stream'] = stream
+        _log['sample_rate'] = sample_rate
+
+
+def log_event(event, **fields):
+    """Emit one JSON log record, subject to the configured sample rate."""
+    stream = _log['stream']
+    if stream is None or random.random() >= _log['sample_rate']:
+        return False
+    line = json.dumps({'ts': round(time.time(), 3), 'event': event, **fields}, default=str)
+    with _lock:
+        stream.write(line + "\n")
+    return True
@@ -0,0 +1,293 @@
+"""
+Q-values of the prompt-optimization agent, shared by every session and worker process.
+
+`SharedQTable` keeps the table in Redis, falls back to a local SQLite file
+while Redis is unavailable, caches reads in-process for a few seconds and
+periodically writes a JSON snapshot that seeds an empty store on startup.
+A policy trained offline (`utils.rl_training`) is swapped into a running
+deployment with `SharedQTable.replace`.
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from redis.exceptions import WatchError
+from utils import metrics
+from utils.cache import TTLCache
+
+READ_TTL = 5
+SNAPSHOT_INTERVAL = 300
+MAX_WATCH_RETRIES = 10
+
+
+class StoreUnavailable(ConnectionError):
+    """The store's backend is known to be down; the next store is used without logging."""
+
+
+def q_update(values, action, reward, learning_rate, discount_factor):
+    """
+    New Q(s, a) from the current values of state s.
+
+    Q(s, a) = Q(s, a) + α * (r + γ * max Q(s, a') - Q(s, a)), where the
+    max includes `action` itself (0.0 if it has no value yet).
+    """
+    current = values.get(action, 0.0)
+    best = max([current, *values.values()])
+    return current + learning_rate * (reward + discount_factor * best - current)
+
+
+class RedisQStore:
+    """
+    Q-values in one Redis hash with fields '<state>|<action>'.
+
+    Updates are read-modify-write under WATCH/MULTI, retried when another
+    process changed the table in between, so concurrent feedback is never lost.
+    """
+
+    def __init__(self, redis_conn, key='rl:q_table'):
+        self._redis = redis_conn if callable(redis_conn) else (lambda: redis_conn)
+        self.key = key
+
+    def _client(self):
+        redis_conn = self._redis()
+        if redis_conn is None:
+            raise StoreUnavailable("Redis is unavailable")
+        return redis_conn
+
+    @staticmethod
+    def _state_values(table, state):
+        prefix = f"{state}|"
+        return {field[len(prefix):]: float(value) for field, value in table.items() if field.startswith(prefix)}
+
+    def values(self, state):
+        return self._state_values(self._client().hgetall(self.key), state)
+
+    def update(self, state, action, reward, learning_rate, discount_factor):
+        redis_conn = self._client()
+        for _ in range(MAX_WATCH_RETRIES):
+            with redis_conn.pipeline(transaction=True) as pipe:
+                try:
+                    pipe.watch(self.key)
+                    values = self._state_values(pipe.hgetall(self.key), state)
+                    value = q_update(values, action, reward, learning_rate, discount_factor)
+                    pipe.multi()
+                    pipe.hset(self.key, f"{state}|{action}", repr(value))
+                    pipe.execute()
+                    values[action] = value
+                    return values
+                except WatchError:
+                    metrics.increment('rl_q_update_conflicts_total')
+        raise RuntimeError(f"Q update for {state}/{action} kept conflicting")
+
+    def snapshot(self):
+        table = {}
+        for field, value in self._client().hgetall(self.key).items():
+            state, _, action = field.rpartition('|')
+            table.setdefault(state, {})[action] = float(value)
+        return table
+
+    def _mapping(self, table):
+        return {f"{state}|{action}": repr(value) for state, values in table.items() for action, value in values.items()}
+
+    def load(self, table):
+        mapping = self._mapping(table)
+        if mapping:
+            self._client().hset(self.key, mapping=mapping)
+
+    def replace(self, table):
+        """Swap the whole table in one MULTI/EXEC; updates in flight retry against the new values."""
+        mapping = self._mapping(table)
+        with self._client().pipeline(transaction=True) as pipe:
+            pipe.delete(self.key)
+            if mapping:
+                pipe.hset(self.key, mapping=mapping)
+            pipe.execute()
+
+
+class SQLiteQStore:
+    """Q-values in a local SQLite file; each update is one IMMEDIATE transaction, so processes serialize."""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS q_values ("
+                "state TEXT NOT NULL, action TEXT NOT NULL, value REAL NOT NULL, PRIMARY KEY (state, action))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def values(self, state):
+        with self._connect() as conn:
+            return dict(conn.execute("SELECT action, value FROM q_values WHERE state = ?", (state,)).fetchall())
+
+    def update(self, state, action, reward, learning_rate, discount_factor):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            values = dict(conn.execute("SELECT action, value FROM q_values WHERE state = ?", (state,)).fetchall())
+            values[action] = q_update(values, action, reward, learning_rate, discount_factor)
+            conn.execute(
+                "INSERT OR REPLACE INTO q_values (state, action, value) VALUES (?, ?, ?)",
+                (state, action, values[action])
+            )
+            conn.execute("COMMIT")
+            return values
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def snapshot(self):
+        table = {}
+        with self._connect() as conn:
+            for state, action, value in conn.execute("SELECT state, action, value FROM q_values"):
+                table.setdefault(state, {})[action] = value
+        return table
+
+    def load(self, table):
+        rows = [(state, action, value) for state, values in table.items() for action, value in values.items()]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO q_values (state, action, value) VALUES (?, ?, ?)", rows)
+
+    def replace(self, table):
+        rows = [(state, action, value) for state, values in table.items() for action, value in values.items()]
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM q_values")
+            conn.executemany("INSERT INTO q_values (state, action, value) VALUES (?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+class SharedQTable:
+    """
+    Process-wide view of the shared Q-table.
+
+    Reads go through a per-state `TTLCache` (`read_ttl` seconds), so
+    `select_action` rarely touches a store; a process sees its own updates
+    at once and other processes' within `read_ttl`. Operations use
+    `primary` (Redis) and fall back to `fallback` (SQLite) when it fails.
+    Every `snapshot_interval` seconds the table is written to
+    `snapshot_path`; a new table whose stores are empty is seeded from it.
+    `replace` swaps in a new policy (e.g. one trained offline) on every store.
+    """
+
+    def __init__(self, primary=None, fallback=None, snapshot_path=None, read_ttl=READ_TTL,
+                 snapshot_interval=SNAPSHOT_INTERVAL):
+        self.stores = [store for store in (primary, fallback) if store is not None]
+        if not self.stores:
+            raise ValueError("SharedQTable needs at least one store")
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self._cache = TTLCache(max_entries=1024, ttl=read_ttl)
+        self._lock = threading.Lock()
+        self._last_snapshot = time.monotonic()
+        self._restore()
+
+    def _call(self, operation, *args):
+        error = None
+        for store in self.stores:
+            try:
+                return getattr(store, operation)(*args)
+            except StoreUnavailable as e:
+                error = e
+            except Exception as e:
+                error = e
+                metrics.increment('rl_q_store_errors_total', store=type(store).__name__, operation=operation)
+                print(f"Q-table {operation} failed on {type(store).__name__}: {e}")
+        raise error
+
+    def _restore(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            if self._call('snapshot'):
+                return
+            with open(self.snapshot_path) as f:
+                table = json.load(f)['q_table']
+            self._call('load', table)
+            print(f"Q-table restored from {self.snapshot_path} ({len(table)} states)")
+        except Exception as e:
+            print(f"Q-table restore skipped: {e}")
+
+    def values(self, state):
+        """Q-values of `state` as {action: value}; empty when no store is reachable."""
+        values = self._cache.get(state)
+        if values is not None:
+            return values
+        try:
+            values = self._call('values', state)
+        except Exception:
+            return {}
+        self._cache.set(state, values)
+        return values
+
+    def update(self, state, action, reward, learning_rate, discount_factor):
+        """Apply one Q-learning update atomically; returns the state's new values (None if it failed)."""
+        try:
+            values = self._call('update', state, action, reward, learning_rate, discount_factor)
+        except Exception:
+            return None
+        metrics.increment('rl_q_updates_total')
+        self._cache.set(state, values)
+        self.maybe_snapshot()
+        return values
+
+    def snapshot(self):
+        return self._call('snapshot')
+
+    def replace(self, table):
+        """
+        Replace the values in every reachable store with `table` ({state: {action: value}})
+        and write the snapshot. Other processes see the new values within `read_ttl`.
+
+        Returns:
+            int: Number of stores replaced
+
+        Raises:
+            Exception: The last store's error if no store could be replaced
+        """
+        replaced, error = 0, None
+        for store in self.stores:
+            try:
+                store.replace(table)
+                replaced += 1
+            except Exception as e:
+                error = e
+                print(f"Q-table replace failed on {type(store).__name__}: {e}")
+        if not replaced:
+            raise error
+        self._cache.clear()
+        metrics.increment('rl_q_policy_swaps_total')
+        self.maybe_snapshot(force=True)
+        return replaced
+
+    def maybe_snapshot(self, force=False):
+        """Write the JSON snapshot if `snapshot_interval` has passed since the last one."""
+        if not self.snapshot_path:
+            return False
+        with self._lock:
+            if not force and time.monotonic() - self._last_snapshot < self.snapshot_interval:
+                return False
+            self._last_snapshot = time.monotonic()
+        try:
+            table = self.snapshot()
+            os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump({'saved_at': time.time(), 'q_table': table}, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except Exception as e:
+            print(f"Q-table snapshot failed: {e}")
+            return False
+        return True
@@ -0,0 +1,169 @@
+import time
+import random
+import threading
+import redis
+from redis.backoff import ExponentialWithJitterBackoff
+from redis.retry import Retry
+from utils import metrics
+
+MAX_CONNECTIONS = 20
+POOL_TIMEOUT = 5
+SOCKET_TIMEOUT = 5
+CONNECT_TIMEOUT = 2
+HEALTH_CHECK_INTERVAL = 30
+RECONNECT_BASE = 0.5
+RECONNECT_MAX = 60
+
+metrics.set_buckets('redis_pool_utilization', metrics.RATIO_BUCKETS)
+
+
+class CountingConnectionPool(redis.BlockingConnectionPool):
+    """
+    `BlockingConnectionPool` that counts the connections it has created and
+    handed out, through its public hooks only, so `stats()` does not depend
+    on redis-py internals.
+    """
+
+    def reset(self):
+        # Also runs from __init__ and after a fork, when the pool starts empty
+        self._count_lock = threading.Lock()
+        self.created = 0
+        self.in_use = 0
+        super().reset()
+
+    def make_connection(self):
+        connection = super().make_connection()
+        with self._count_lock:
+            self.created += 1
+        return connection
+
+    def get_connection(self, *args, **kwargs):
+        connection = super().get_connection(*args, **kwargs)
+        with self._count_lock:
+            self.in_use += 1
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        with self._count_lock:
+            self.in_use = max(self.in_use - 1, 0)
+
+
+class RedisPoolManager:
+    """
+    Process-wide Redis client backed by one bounded, blocking connection pool.
+
+    At most `max_connections` sockets are opened; callers beyond that wait up
+    to `pool_timeout` seconds for a free one. Idle connections are pinged
+    before reuse after `health_check_interval` seconds, and individual
+    commands are retried on connection errors with jittered backoff.
+
+    `client()` returns None while Redis is unreachable instead of failing,
+    and retries the connection with exponential backoff, so an outage at
+    start-up is not remembered forever and a dead server is not hammered.
+    """
+
+    def __init__(self, host='localhost', port=6379, db=0, password=None,
+                 max_connections=MAX_CONNECTIONS, pool_timeout=POOL_TIMEOUT,
+                 socket_timeout=SOCKET_TIMEOUT, connect_timeout=CONNECT_TIMEOUT,
+                 health_check_interval=HEALTH_CHECK_INTERVAL,
+                 reconnect_base=RECONNECT_BASE, reconnect_max=RECONNECT_MAX):
+        self.health_check_interval = health_check_interval
+        self.reconnect_base = reconnect_base
+        self.reconnect_max = reconnect_max
+        self.pool = CountingConnectionPool(
+            host=host,
+            port=int(port),
+            db=int(db),
+            password=password,
+            max_connections=max_connections,
+            timeout=pool_timeout,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=connect_timeout,
+            health_check_interval=health_check_interval,
+            decode_responses=True
+        )
+        self._client = redis.Redis(
+            connection_pool=self.pool,
+            retry=Retry(ExponentialWithJitterBackoff(base=0.05, cap=1), 2),
+            retry_on_error=[redis.exceptions.ConnectionError, redis.exceptions.TimeoutError]
+        )
+        self._lock = threading.Lock()
+        self._healthy = False
+        self._failures = 0
+        self._next_check = 0.0
+        self.last_error = None
+
+    def client(self):
+        """The shared client if Redis is reachable, otherwise None."""
+        if time.monotonic() >= self._next_check:
+            self.check_health()
+        return self._client if self._healthy else None
+
+    def check_health(self):
+        """Ping Redis now; on failure schedule the next attempt with exponential backoff."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_check:
+                return self._healthy
+            try:
+                self._client.ping()
+            except redis.exceptions.RedisError as e:
+                self._failures += 1
+                delay = min(self.reconnect_max, self.reconnect_base * 2 ** (self._failures - 1))
+                self._next_check = now + delay * random.uniform(0.5, 1.0)
+                if self._healthy or self._failures == 1:
+                    print(f"Redis unavailable, retrying in {delay:.1f}s: {e}")
+                self._healthy = False
+                self.last_error = str(e)
+                self.pool.disconnect()
+                metrics.increment('redis_health_checks_total', result='failure')
+                return False
+
+            if not self._healthy and self._failures:
+                print(f"Redis reconnected after {self._failures} failed attempt(s)")
+            self._healthy = True
+            self._failures = 0
+            self._next_check = now + self.health_check_interval
+            self.last_error = None
+            metrics.increment('redis_health_checks_total', result='success')
+            metrics.observe('redis_pool_utilization', self.stats()['utilization'])
+            return True
+
+    def stats(self):
+        """Pool size and utilization (connections checked out / pool bound)."""
+        created, in_use = self.pool.created, self.pool.in_use
+        idle = max(created - in_use, 0)
+        return {
+            'healthy': self._healthy,
+            'max_connections': self.pool.max_connections,
+            'created': created,
+            'in_use': in_use,
+            'idle': idle,
+            'utilization': in_use / self.pool.max_connections,
+            'consecutive_failures': self._failures,
+            'last_error': self.last_error
+        }
+
+    def close(self):
+        self.pool.disconnect()
+
+
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+def shared_pool(host='localhost', port=6379, db=0, password=None, **kwargs):
+    """
+    The process-wide manager for a Redis server, created on first use.
+
+    It lives at module level rather than in Streamlit's resource cache, so
+    clearing that cache does not drop the pool.
+    """
+    key = (host, int(port), int(db), password)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = RedisPoolManager(host, port, db, password, **kwargs)
+            _managers[key] = manager
+        return manager
@@ -0,0 +1,186 @@
+import json
+import time
+import uuid
+import threading
+import numpy as np
+from scipy import sparse
+from utils import metrics
+from utils.cache import TTLCache
+
+SIMILARITY_THRESHOLD = 0.9
+MAX_ENTRIES_PER_STATE = 256
+TTL_SECONDS = 24 * 60 * 60
+
+metrics.set_buckets('response_cache_hit_similarity', metrics.RATIO_BUCKETS)
+
+
+class CachedResponse:
+    def __init__(self, response, action, similarity):
+        self.response = response
+        self.action = action
+        self.similarity = similarity
+
+
+class MemoryResponseStore:
+    """Per-state `TTLCache`s of (vector, response, action) entries in this process."""
+
+    def __init__(self, max_entries=MAX_ENTRIES_PER_STATE, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _cache(self, state):
+        with self._lock:
+            cache = self._states.get(state)
+            if cache is None:
+                cache = self._states[state] = TTLCache(max_entries=self.max_entries, ttl=self.ttl)
+            return cache
+
+    def entries(self, state):
+        return [(entry_id, *entry) for entry_id, entry in self._cache(state).items()]
+
+    def put(self, state, entry_id, vector, response, action):
+        self._cache(state).set(entry_id, (vector, response, action))
+
+    def touch(self, state, entry_id):
+        self._cache(state).get(entry_id)
+
+
+class RedisResponseStore:
+    """
+    Entries shared across worker processes.
+
+    Each state is a Redis hash of entries (sparse vector, response, action,
+    creation time) plus a sorted set of last-use times that drives LRU
+    trimming. Both keys expire after `ttl` seconds without writes, and
+    entries older than `ttl` are ignored and removed when read.
+    """
+
+    def __init__(self, redis_conn, name='chat_response', max_entries=MAX_ENTRIES_PER_STATE, ttl=TTL_SECONDS):
+        self._redis = redis_conn if callable(redis_conn) else (lambda: redis_conn)
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def _keys(self, state):
+        key = f"respcache:{self.name}:{state}"
+        return key, f"{key}:lru"
+
+    def entries(self, state):
+        redis_conn = self._redis()
+        if redis_conn is None:
+            return []
+        key, lru_key = self._keys(state)
+        now = time.time()
+        entries, expired = [], []
+        for entry_id, payload in redis_conn.hgetall(key).items():
+            entry = json.loads(payload)
+            if entry['t'] + self.ttl < now:
+                expired.append(entry_id)
+                continue
+            vector = sparse.csr_matrix(
+                (np.asarray(entry['v'], dtype=np.float64), np.asarray(entry['i']), [0, len(entry['i'])]),
+                shape=(1, entry['n'])
+            )
+            entries.append((entry_id, vector, entry['r'], entry['a']))
+        if expired:
+            pipe = redis_conn.pipeline(transaction=True)
+            pipe.hdel(key, *expired)
+            pipe.zrem(lru_key, *expired)
+            pipe.execute()
+        return entries
+
+    def put(self, state, entry_id, vector, response, action):
+        redis_conn = self._redis()
+        if redis_conn is None:
+            return
+        key, lru_key = self._keys(state)
+        now = time.time()
+        payload = json.dumps({
+            'i': vector.indices.tolist(),
+            'v': [round(value, 6) for value in vector.data.tolist()],
+            'n': vector.shape[1],
+            'r': response,
+            'a': action,
+            't': now
+        })
+        pipe = redis_conn.pipeline(transaction=True)
+        pipe.hset(key, entry_id, payload)
+        pipe.zadd(lru_key, {entry_id: now})
+        pipe.expire(key, self.ttl)
+        pipe.expire(lru_key, self.ttl)
+        pipe.zcard(lru_key)
+        size = pipe.execute()[-1]
+
+        if size > self.max_entries:
+            evicted = [entry_id for entry_id, _ in redis_conn.zpopmin(lru_key, size - self.max_entries)]
+            if evicted:
+                redis_conn.hdel(key, *evicted)
+
+    def touch(self, state, entry_id):
+        redis_conn = self._redis()
+        if redis_conn is not None:
+            redis_conn.zadd(self._keys(state)[1], {entry_id: time.time()})
+
+
+class SemanticResponseCache:
+    """
+    Reuses replies to near-identical messages.
+
+    Entries are partitioned by the RL state of the message (so a reply is
+    only reused for a message with the same detected emotions) and matched
+    by cosine similarity of L2-normalized message vectors. A lookup hits
+    when the best match reaches `threshold`. Lookups are recorded under
+    `response_cache_requests_total{result=hit|miss}`, and backend failures
+    under `response_cache_errors_total`, which otherwise count as misses.
+    """
+
+    def __init__(self, store, threshold=SIMILARITY_THRESHOLD):
+        self.store = store
+        self.threshold = threshold
+
+    def get(self, state, vector):
+        """
+        Args:
+            state: RL state of the message, e.g. 'anxious+sad'
+            vector: 1 x n_features sparse row, L2-normalized
+
+        Returns:
+            CachedResponse or None
+        """
+        try:
+            entries = self.store.entries(state)
+        except Exception as e:
+            metrics.increment('response_cache_errors_total')
+            print(f"Response cache read failed: {e}")
+            entries = []
+
+        if entries:
+            similarities = (sparse.vstack([entry[1] for entry in entries]) @ vector.T).toarray().ravel()
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                entry_id, _, response, action = entries[best]
+                try:
+                    self.store.touch(state, entry_id)
+                except Exception as e:
+                    print(f"Response cache touch failed: {e}")
+                metrics.increment('response_cache_requests_total', result='hit')
+                metrics.observe('response_cache_hit_similarity', float(similarities[best]))
+                return CachedResponse(response, action, float(similarities[best]))
+
+        metrics.increment('response_cache_requests_total', result='miss')
+        return None
+
+    def set(self, state, vector, response, action):
+        try:
+            self.store.put(state, uuid.uuid4().hex, sparse.csr_matrix(vector), response, action)
+        except Exception as e:
+            metrics.increment('response_cache_errors_total')
+            print(f"Response cache write failed: {e}")
+
+    def stats(self):
+        hits = metrics.counter('response_cache_requests_total', result='hit')
+        misses = metrics.counter('response_cache_requests_total', result='miss')
+        total = hits + misses
+        return {'hits': hits, 'misses': misses, 'hit_rate': hits / total if total else 0.0}
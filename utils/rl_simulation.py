@@ -0,0 +1,242 @@
+"""
+Offline evaluation of the prompt-optimization agent.
+
+Simulated users send messages, `PromptOptimizationRL` picks an action through
+`generate_optimized_prompt`, and a synthetic feedback model clicks one of the
+feedback buttons, which goes through `give_feedback`/`process_feedback`
+exactly as on the Therapist page. Every combination of learning rate,
+discount factor and exploration rate runs for several seeds across a
+process pool, and the report compares cumulative reward and how fast the
+greedy policy converges to the users' preferred actions:
+
+    python -m utils.rl_simulation --learning-rates 0.05,0.1,0.3 --discounts 0,0.9 --explorations 0.1,0.3
+"""
+import os
+import time
+import random
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from reinforcement import PromptOptimizationRL, EMOTION_KEYWORDS
+
+STEPS = 5000
+EVAL_EVERY = 100
+CONVERGED_ACCURACY = 0.9
+
+# The action each feedback model wants, per emotion; states with several
+# emotions take the first emotion's preference in this order
+FEEDBACK_MODELS = {
+    'mixed': {
+        'sad': 'more_empathy', 'lonely': 'more_empathy', 'angry': 'more_empathy',
+        'anxious': 'more_practical', 'overwhelmed': 'more_practical',
+        'happy': 'helpful', 'neutral': 'helpful'
+    },
+    'empathy': {emotion: 'more_empathy' for emotion in [*EMOTION_KEYWORDS, 'neutral']},
+    'practical': {emotion: 'more_practical' for emotion in [*EMOTION_KEYWORDS, 'neutral']},
+}
+_PRIORITY = ('sad', 'lonely', 'anxious', 'overwhelmed', 'angry', 'happy')
+_TEMPLATES = ("I feel {} today", "Lately I've been {} and I don't know why", "Everything is {} at work")
+_NEUTRAL_MESSAGES = ("How can I build a better routine?", "What is mindfulness?", "Tips for journaling?")
+
+
+def preferred_action(model, state):
+    emotions = state.split('+')
+    for emotion in _PRIORITY:
+        if emotion in emotions:
+            return FEEDBACK_MODELS[model][emotion]
+    return FEEDBACK_MODELS[model]['neutral']
+
+
+class SyntheticUsers:
+    """
+    Messages and feedback clicks of simulated users.
+
+    A reply with the preferred action gets 'helpful' with probability
+    `satisfaction`; otherwise the user asks for what they wanted ('more_empathy'
+    or 'more_practical') or says 'not_helpful'. A `click_rate` fraction of
+    replies gets any feedback at all.
+    """
+
+    def __init__(self, model='mixed', satisfaction=0.85, click_rate=0.6, rng=None):
+        self.model = model
+        self.satisfaction = satisfaction
+        self.click_rate = click_rate
+        self.rng = rng or random.Random(0)
+        self.keywords = [(emotion, keyword) for emotion, keywords in EMOTION_KEYWORDS.items()
+                         for keyword in keywords if ' ' not in keyword]
+
+    def message(self):
+        if self.rng.random() < 0.15:
+            return self.rng.choice(_NEUTRAL_MESSAGES)
+        words = [keyword for _, keyword in self.rng.sample(self.keywords, self.rng.choice((1, 1, 2)))]
+        return self.rng.choice(_TEMPLATES).format(" and ".join(words))
+
+    def feedback(self, state, action):
+        """Feedback button clicked for `action` in `state`, or None for no click."""
+        if self.rng.random() >= self.click_rate:
+            return None
+        wanted = preferred_action(self.model, state)
+        if action == wanted:
+            return 'helpful' if self.rng.random() < self.satisfaction else 'not_helpful'
+        if wanted in ('more_empathy', 'more_practical') and self.rng.random() < 0.7:
+            return wanted
+        return 'not_helpful'
+
+
+def greedy_accuracy(agent, model, state_counts):
+    """Share of messages so far whose state's greedy action is now the preferred one."""
+    total = sum(state_counts.values())
+    if not total:
+        return 0.0
+    hits = 0
+    for state, count in state_counts.items():
+        q_values = agent.q_table.values(state)
+        hits += count * (max(q_values, key=q_values.get, default='helpful') == preferred_action(model, state))
+    return hits / total
+
+
+def simulate(learning_rate, discount_factor, exploration_rate, seed=0, steps=STEPS, model='mixed',
+             eval_every=EVAL_EVERY, satisfaction=0.85, click_rate=0.6):
+    """
+    Run one agent against synthetic users for `steps` messages.
+
+    Returns:
+        dict: Cumulative and mean reward, the greedy-policy accuracy curve,
+        and the first step from which accuracy stays at or above
+        CONVERGED_ACCURACY (None if it never does)
+    """
+    random.seed(seed)
+    users = SyntheticUsers(model, satisfaction, click_rate, random.Random(seed + 1))
+    agent = PromptOptimizationRL()
+    agent.learning_rate = learning_rate
+    agent.discount_factor = discount_factor
+    agent.exploration_rate = exploration_rate
+
+    state_counts = {}
+    cumulative_reward = 0.0
+    curve = []
+    start = time.perf_counter()
+    for step in range(1, steps + 1):
+        message = users.message()
+        _, action = agent.generate_optimized_prompt(message, message)
+        state_counts[agent.last_state] = state_counts.get(agent.last_state, 0) + 1
+        feedback = users.feedback(agent.last_state, action)
+        if feedback is not None:
+            reward = agent.give_feedback(feedback)
+            agent.process_feedback(reward)
+            cumulative_reward += reward
+        if step % eval_every == 0:
+            curve.append((step, greedy_accuracy(agent, model, state_counts)))
+    seconds = time.perf_counter() - start
+
+    converged_at = None
+    for step, accuracy in reversed(curve):
+        if accuracy < CONVERGED_ACCURACY:
+            break
+        converged_at = step
+    return {
+        'learning_rate': learning_rate,
+        'discount_factor': discount_factor,
+        'exploration_rate': exploration_rate,
+        'seed': seed,
+        'cumulative_reward': round(cumulative_reward, 2),
+        'mean_reward': round(cumulative_reward / steps, 4),
+        'final_accuracy': round(curve[-1][1], 3) if curve else 0.0,
+        'converged_at': converged_at,
+        'states': len(state_counts),
+        'steps_per_second': round(steps / seconds)
+    }
+
+
+def _simulate(kwargs):
+    return simulate(**kwargs)
+
+
+def run_grid(learning_rates, discount_factors, exploration_rates, seeds=3, steps=STEPS, model='mixed',
+             workers=None, **options):
+    """
+    Simulate every configuration for `seeds` seeds on a process pool.
+
+    Returns:
+        list: One row per configuration, averaged over seeds and sorted by
+        mean cumulative reward (best first)
+    """
+    tasks = [
+        dict(learning_rate=lr, discount_factor=gamma, exploration_rate=epsilon, seed=seed,
+             steps=steps, model=model, **options)
+        for lr, gamma, epsilon in itertools.product(learning_rates, discount_factors, exploration_rates)
+        for seed in range(seeds)
+    ]
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        runs = list(pool.map(_simulate, tasks, chunksize=max(len(tasks) // (4 * workers), 1)))
+
+    grouped = {}
+    for run in runs:
+        grouped.setdefault((run['learning_rate'], run['discount_factor'], run['exploration_rate']), []).append(run)
+    rows = []
+    for (lr, gamma, epsilon), group in grouped.items():
+        converged = [run['converged_at'] for run in group if run['converged_at'] is not None]
+        rows.append({
+            'learning_rate': lr,
+            'discount_factor': gamma,
+            'exploration_rate': epsilon,
+            'cumulative_reward': round(float(np.mean([run['cumulative_reward'] for run in group])), 1),
+            'final_accuracy': round(float(np.mean([run['final_accuracy'] for run in group])), 3),
+            'converged_runs': f"{len(converged)}/{len(group)}",
+            'median_converged_at': int(np.median(converged)) if converged else None,
+            'steps_per_second': round(float(np.mean([run['steps_per_second'] for run in group])))
+        })
+    return sorted(rows, key=lambda row: row['cumulative_reward'], reverse=True)
+
+
+def format_report(rows, steps):
+    lines = [
+        f"{'lr':>6}{'gamma':>7}{'eps':>6}{'reward':>10}{'accuracy':>10}{'converged':>11}{'at step':>9}{'steps/s':>9}"
+    ]
+    for row in rows:
+        at = row['median_converged_at'] if row['median_converged_at'] is not None else '-'
+        lines.append(
+            f"{row['learning_rate']:>6g}{row['discount_factor']:>7g}{row['exploration_rate']:>6g}"
+            f"{row['cumulative_reward']:>10}{row['final_accuracy']:>10}{row['converged_runs']:>11}{at:>9}"
+            f"{row['steps_per_second']:>9}"
+        )
+    lines.append(f"{steps} messages per run; converged = greedy action is the preferred one in "
+                 f"{CONVERGED_ACCURACY:.0%} of messages (weighted by state frequency) until the end")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import json
+    import argparse
+
+    def floats(value):
+        return [float(item) for item in value.split(',')]
+
+    parser = argparse.ArgumentParser(description="Tune the prompt-optimization agent against synthetic users.")
+    parser.add_argument("--learning-rates", type=floats, default=[0.05, 0.1, 0.3])
+    parser.add_argument("--discounts", type=floats, default=[0.0, 0.5, 0.9])
+    parser.add_argument("--explorations", type=floats, default=[0.1, 0.3])
+    parser.add_argument("--steps", type=int, default=STEPS)
+    parser.add_argument("--seeds", type=int, default=3)
+    parser.add_argument("--model", choices=sorted(FEEDBACK_MODELS), default="mixed")
+    parser.add_argument("--satisfaction", type=float, default=0.85)
+    parser.add_argument("--click-rate", type=float, default=0.6)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    report = run_grid(
+        args.learning_rates,
+        args.discounts,
+        args.explorations,
+        seeds=args.seeds,
+        steps=args.steps,
+        model=args.model,
+        workers=args.workers,
+        satisfaction=args.satisfaction,
+        click_rate=args.click_rate
+    )
+    print(json.dumps(report, indent=2) if args.json else format_report(report, args.steps))
+    print(f"{len(report) * args.seeds} runs in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,198 @@
+"""
+Feedback event log and offline training for the prompt-optimization agent.
+
+Every feedback click is appended to a binary log of fixed-size records.
+The trainer replays the log into an `ArrayQTable` with vectorized
+updates and publishes the result as a policy snapshot, or swaps it into
+the live shared Q-table of a running deployment:
+
+    python -m utils.rl_training train data/rl/feedback_events.bin --snapshot data/rl/q_table_snapshot.json
+    python -m utils.rl_training train data/rl/feedback_events.bin --deploy-redis redis://localhost:6379/0 \
+        --deploy-sqlite data/rl/q_table.sqlite
+    python -m utils.rl_training bench --events 2000000
+"""
+import os
+import json
+import time
+import threading
+import numpy as np
+from reinforcement import ArrayQTable, ACTIONS, N_STATES, state_mask, mask_state
+from utils.q_store import SharedQTable, RedisQStore, SQLiteQStore
+
+EVENT_DTYPE = np.dtype([('time', '<f8'), ('state', 'u1'), ('action', 'u1'), ('reward', '<f4')])
+READ_CHUNK = 1 << 20
+
+
+class FeedbackEventLog:
+    """
+    Append-only log of (time, state mask, action index, reward) records.
+
+    Each record is written with one O_APPEND write, so concurrent sessions
+    and worker processes can share the file without a lock. A torn record
+    at the end (a crash mid-write) is ignored by `read_events`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+
+    def append(self, state, action, reward):
+        record = np.array([(time.time(), state_mask(state), ACTIONS.index(action), reward)], dtype=EVENT_DTYPE)
+        with self._lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, record.tobytes())
+            finally:
+                os.close(fd)
+
+
+def read_events(path, chunk_size=READ_CHUNK):
+    """Yield the events in `path` as structured arrays of up to `chunk_size` records."""
+    n_events = os.path.getsize(path) // EVENT_DTYPE.itemsize
+    if not n_events:
+        return
+    events = np.memmap(path, dtype=EVENT_DTYPE, mode='r', shape=(n_events,))
+    for start in range(0, n_events, chunk_size):
+        yield np.array(events[start:start + chunk_size])
+
+
+def train(paths, learning_rate=0.1, discount_factor=0.9, table=None):
+    """
+    Replay every event in `paths` (in order) into `table`.
+
+    Returns:
+        tuple: (ArrayQTable, number of events replayed)
+    """
+    table = table if table is not None else ArrayQTable()
+    n_events = 0
+    for path in paths:
+        for events in read_events(path):
+            n_events += table.apply_events(
+                events['state'], events['action'], events['reward'], learning_rate, discount_factor
+            )
+    return table, n_events
+
+
+def publish(table, snapshot_path=None, policy_path=None):
+    """
+    Write `table` as a `SharedQTable` JSON snapshot and/or an .npz policy,
+    atomically. A shared table only seeds itself from the snapshot when its
+    stores are empty; use `deploy` to replace the values of a live one.
+    """
+    if snapshot_path:
+        os.makedirs(os.path.dirname(snapshot_path) or '.', exist_ok=True)
+        tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'saved_at': time.time(), 'q_table': table.snapshot()}, f)
+        os.replace(tmp_path, snapshot_path)
+    if policy_path:
+        os.makedirs(os.path.dirname(policy_path) or '.', exist_ok=True)
+        tmp_path = f"{policy_path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, q=table.q, seen=table.seen, actions=np.array(ACTIONS))
+        os.replace(tmp_path, policy_path)
+
+
+def deploy(table, redis_url=None, sqlite_path=None):
+    """
+    Swap `table` into the live shared Q-table: the Redis store and/or the
+    SQLite fallback the Therapist page uses. Running processes pick up the
+    new values within their `RL_Q_CACHE_TTL`.
+
+    Returns:
+        int: Number of stores replaced
+    """
+    import redis
+
+    primary = RedisQStore(redis.Redis.from_url(redis_url, decode_responses=True)) if redis_url else None
+    fallback = SQLiteQStore(sqlite_path) if sqlite_path else None
+    return SharedQTable(primary, fallback).replace(table.snapshot())
+
+
+def synthetic_events(n_events, seed=0):
+    """Random events whose expected reward depends on (state, action), for benchmarks."""
+    rng = np.random.default_rng(seed)
+    events = np.zeros(n_events, dtype=EVENT_DTYPE)
+    events['time'] = time.time()
+    events['state'] = rng.integers(0, N_STATES, n_events)
+    events['action'] = rng.integers(0, len(ACTIONS), n_events)
+    preference = rng.uniform(-1, 1, (N_STATES, len(ACTIONS)))
+    noise = rng.normal(0, 0.3, n_events)
+    events['reward'] = np.clip(preference[events['state'], events['action']] + noise, -1, 1)
+    return events
+
+
+def benchmark(n_events=1_000_000, sequential_events=100_000, seed=0):
+    """
+    Updates/sec of per-event updates (as on a feedback click) versus the
+    vectorized replay, and the largest difference between their Q-values
+    on the same events (rounding error only).
+    """
+    events = synthetic_events(n_events, seed)
+    states = [mask_state(mask) for mask in range(N_STATES)]
+
+    sequential = ArrayQTable()
+    sample = events[:sequential_events]
+    start = time.perf_counter()
+    for mask, action, reward in zip(sample['state'].tolist(), sample['action'].tolist(), sample['reward'].tolist()):
+        sequential.update(states[mask], ACTIONS[action], reward, 0.1, 0.9)
+    sequential_seconds = time.perf_counter() - start
+
+    replayed_sample = ArrayQTable()
+    replayed_sample.apply_events(sample['state'], sample['action'], sample['reward'], 0.1, 0.9)
+
+    replayed = ArrayQTable()
+    start = time.perf_counter()
+    for first in range(0, n_events, READ_CHUNK):
+        chunk = events[first:first + READ_CHUNK]
+        replayed.apply_events(chunk['state'], chunk['action'], chunk['reward'], 0.1, 0.9)
+    replay_seconds = time.perf_counter() - start
+
+    sequential_rate = len(sample) / sequential_seconds
+    replay_rate = n_events / replay_seconds
+    return {
+        'events': n_events,
+        'sequential_updates_per_second': round(sequential_rate),
+        'vectorized_updates_per_second': round(replay_rate),
+        'speedup': round(replay_rate / sequential_rate, 1),
+        'max_abs_diff_vs_sequential': float(np.abs(replayed_sample.q - sequential.q).max())
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline training for the prompt-optimization agent.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train_parser = commands.add_parser("train", help="Replay feedback event logs and publish a policy")
+    train_parser.add_argument("logs", nargs="+", help="Event logs, replayed in the order given")
+    train_parser.add_argument("--learning-rate", type=float, default=0.1)
+    train_parser.add_argument("--discount-factor", type=float, default=0.9)
+    train_parser.add_argument("--snapshot", help="Write a SharedQTable JSON snapshot here")
+    train_parser.add_argument("--policy", help="Write the Q array (.npz) here")
+    train_parser.add_argument("--deploy-redis", help="Replace the live Q-table in this Redis (redis://host:port/db)")
+    train_parser.add_argument("--deploy-sqlite", help="Replace the live Q-table in this SQLite fallback file")
+
+    bench_parser = commands.add_parser("bench", help="Measure updates/sec on synthetic events")
+    bench_parser.add_argument("--events", type=int, default=1_000_000)
+    bench_parser.add_argument("--sequential-events", type=int, default=100_000)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        start = time.perf_counter()
+        q_table, replayed = train(args.logs, args.learning_rate, args.discount_factor)
+        publish(q_table, args.snapshot, args.policy)
+        deployed = 0
+        if args.deploy_redis or args.deploy_sqlite:
+            deployed = deploy(q_table, args.deploy_redis, args.deploy_sqlite)
+        seconds = time.perf_counter() - start
+        print(json.dumps({
+            'events': replayed,
+            'stores_replaced': deployed,
+            'states': len(q_table.snapshot()),
+            'seconds': round(seconds, 3),
+            'events_per_second': round(replayed / seconds) if seconds else 0
+        }, indent=2))
+    else:
+        print(json.dumps(benchmark(args.events, args.sequential_events), indent=2))
@@ -0,0 +1,214 @@
+import io
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils import metrics
+
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+MIN_CHUNK_CHARS = 60
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def gtts_synthesize(text, lang):
+    """Synthesize `text` with gTTS and return the MP3 bytes."""
+    from gtts import gTTS
+
+    buffer = io.BytesIO()
+    gTTS(text=text, lang=lang).write_to_fp(buffer)
+    return buffer.getvalue()
+
+
+class SpeechSynthesizer:
+    """
+    Text-to-speech with a content-addressed MP3 cache on disk.
+
+    Audio is returned as bytes, so concurrent sessions never share a file.
+    Cache entries are named by SHA-256 of (lang, text) and evicted least
+    recently used first once the cache exceeds `max_cache_bytes`. Requests
+    for text that is already being synthesized share the in-flight future,
+    so the same text is never synthesized twice.
+    """
+
+    def __init__(self, cache_dir, max_cache_bytes=MAX_CACHE_BYTES, max_workers=4, backend=gtts_synthesize):
+        self.cache_dir = cache_dir
+        self.max_cache_bytes = max_cache_bytes
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tts')
+        self._lock = threading.RLock()
+        self._in_flight = {}
+        self._entries = OrderedDict()
+        self._cache_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan_cache()
+
+    @staticmethod
+    def cache_key(text, lang='en'):
+        return hashlib.sha256(f"{lang}\0{text}".encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.mp3")
+
+    def _scan_cache(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.mp3'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._cache_bytes += size
+
+    def _read_cached(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                audio = f.read()
+        except FileNotFoundError:
+            # Evicted by another worker process
+            with self._lock:
+                self._cache_bytes -= self._entries.pop(key, 0)
+            return None
+        os.utime(path)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                # Written by another worker process
+                self._entries[key] = len(audio)
+                self._cache_bytes += len(audio)
+        return audio
+
+    def _store(self, key, audio):
+        tmp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(audio)
+        os.replace(tmp_path, self._path(key))
+
+        with self._lock:
+            self._cache_bytes += len(audio) - self._entries.pop(key, 0)
+            self._entries[key] = len(audio)
+            evicted = []
+            while self._cache_bytes > self.max_cache_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self._cache_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except FileNotFoundError:
+                pass
+
+    def synthesize(self, text, lang='en'):
+        """Return MP3 bytes for `text`, from the cache when possible."""
+        key = self.cache_key(text, lang)
+        with self._lock:
+            cached = key in self._entries
+        if cached or os.path.exists(self._path(key)):
+            audio = self._read_cached(key)
+            if audio is not None:
+                metrics.increment('tts_requests_total', result='hit')
+                return audio
+
+        metrics.increment('tts_requests_total', result='miss')
+        start = time.perf_counter()
+        audio = self.backend(text, lang)
+        metrics.observe('tts_synthesis_seconds', time.perf_counter() - start)
+        self._store(key, audio)
+        return audio
+
+    def submit(self, text, lang='en'):
+        """Synthesize on the worker pool; concurrent requests for the same text share one future."""
+        key = self.cache_key(text, lang)
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._executor.submit(self.synthesize, text, lang)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+        return future
+
+    def _forget(self, key):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+
+class IncrementalSpeech:
+    """
+    Synthesizes a reply sentence by sentence while its text is still arriving.
+
+    Text is fed in as it streams; as soon as the complete sentences buffered
+    reach `min_chars` they are submitted to the synthesizer right away, so the first chunk
+    is usually ready by the time the text is finished. Chunks are MP3 frame
+    streams and concatenate into one playable file. With `min_chars=None`
+    nothing is submitted until `finish`, i.e. the whole reply is one chunk.
+    """
+
+    def __init__(self, synthesizer, lang='en', min_chars=MIN_CHUNK_CHARS):
+        self.synthesizer = synthesizer
+        self.lang = lang
+        self.min_chars = min_chars
+        self.mode = 'whole' if min_chars is None else 'incremental'
+        self.started_at = time.perf_counter()
+        self.futures = []
+        self._buffer = ""
+        self._first_audio_taken = False
+
+    def _submit(self, text):
+        text = text.strip()
+        if text:
+            self.futures.append(self.synthesizer.submit(text, self.lang))
+            if len(self.futures) == 1:
+                self.futures[0].add_done_callback(self._first_audio_done)
+
+    def _first_audio_done(self, future):
+        # Measured when the audio exists, not when the page gets round to showing it
+        if not future.cancelled() and future.exception() is None:
+            metrics.observe('tts_time_to_first_audio_seconds', time.perf_counter() - self.started_at, mode=self.mode)
+
+    def feed(self, text):
+        """Add streamed text, submitting any complete sentences that are long enough."""
+        self._buffer += text
+        while self.min_chars is not None:
+            boundary = next(
+                (m.end() for m in _SENTENCE_END.finditer(self._buffer) if m.end() >= self.min_chars),
+                None
+            )
+            if boundary is None:
+                return
+            self._submit(self._buffer[:boundary])
+            self._buffer = self._buffer[boundary:]
+
+    def finish(self):
+        """Submit whatever text is left; returns the chunk futures in order."""
+        self._submit(self._buffer)
+        self._buffer = ""
+        return self.futures
+
+    def first_audio(self, timeout=None):
+        """Bytes of the first chunk."""
+        return self.futures[0].result(timeout=timeout)
+
+    def take_first_audio(self, wait=False, timeout=None):
+        """
+        Bytes of the first chunk the first time they are taken, else None.
+
+        Without `wait`, returns None until the chunk has been synthesized
+        (or if synthesis failed), so it can be polled while text streams.
+        """
+        if self._first_audio_taken or not self.futures:
+            return None
+        future = self.futures[0]
+        if not wait and (not future.done() or future.cancelled() or future.exception() is not None):
+            return None
+        audio = future.result(timeout=timeout)
+        self._first_audio_taken = True
+        return audio
+
+    def remaining_audio(self, timeout=None):
+        """Every chunk after the first, stitched into one stream."""
+        return b''.join(future.result(timeout=timeout) for future in self.futures[1:])
+